@@ -0,0 +1,49 @@
+"""
+analyze_json per city versus the vectorized analyzer over one batch, and the columnar analyzer the shared memory
+transport runs on the workers
+
+    python -m benchmarks.bench_analyzer --city-days 10000
+"""
+import argparse
+import json
+import logging
+import time
+
+from benchmarks.http_stand_in import load_example_response
+from external.analyzer import analyze_json
+from external.columnar import ForecastBatch, analyze_city
+from external.vectorized_analyzer import analyze_batch
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--city-days", type=int, default=10000)
+    args = parser.parse_args()
+    # analyze_json logs the payload at DEBUG, keep that out of the measurement whatever the configured level
+    logging.disable(logging.DEBUG)
+
+    raw = load_example_response()
+    days_per_city = len(json.loads(raw)["forecasts"])
+    payloads = {f"CITY{i}": json.loads(raw) for i in range(args.city_days // days_per_city)}
+
+    _, loop_seconds = timed(lambda: {city: analyze_json(data)["days"] for city, data in payloads.items()})
+    batch, extract_seconds = timed(ForecastBatch.from_payloads, payloads)
+    _, batch_seconds = timed(analyze_batch, batch)
+    _, columnar_seconds = timed(lambda: [analyze_city(batch, index) for index in range(len(batch.cities))])
+
+    print(f"{len(payloads)} cities, {len(batch.dates)} city-days, {len(batch.hours)} hours")
+    print(f"analyze_json loop       {loop_seconds:>8.3f}s")
+    print(f"ForecastBatch extract   {extract_seconds:>8.3f}s  (parent, shm transport)")
+    print(f"analyze_batch           {batch_seconds:>8.3f}s")
+    print(f"extract + analyze_batch {extract_seconds + batch_seconds:>8.3f}s")
+    print(f"analyze_city loop       {columnar_seconds:>8.3f}s  (workers, shm transport)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Memory retained per city by json.loads versus decode_compact_forecast, measured with tracemalloc
+
+    python -m benchmarks.bench_compact --cities 1000
+"""
+import argparse
+import gc
+import json
+import pickle
+import time
+import tracemalloc
+
+from benchmarks.http_stand_in import load_example_response
+from external.compact import decode_compact_forecast
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, default=1000)
+    args = parser.parse_args()
+    body = load_example_response().decode("utf-8")
+
+    print(f"{'decoder':>24} {'KB/city':>9} {'peak MB':>9} {'ms/city':>9} {'pickle KB':>10}")
+    for name, loads in (("json.loads", json.loads), ("decode_compact_forecast", decode_compact_forecast)):
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        decoded = [loads(body) for _ in range(args.cities)]
+        elapsed = time.perf_counter() - started
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{name:>24} {current / args.cities / 1024:>9.1f} {peak / 2**20:>9.1f} "
+            f"{elapsed / args.cities * 1000:>9.3f} {len(pickle.dumps(decoded[0])) / 1024:>10.1f}"
+        )
+        del decoded
+
+
+if __name__ == "__main__":
+    main()
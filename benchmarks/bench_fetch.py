@@ -0,0 +1,54 @@
+"""
+Compares the thread-pool and asyncio fetch paths against a local stand-in host
+
+    python -m benchmarks.bench_fetch --cities 18 1000 10000
+"""
+import argparse
+import time
+
+from benchmarks.http_stand_in import StandInServer
+from external.async_client import AsyncYandexWeatherAPI
+from external.client import YandexWeatherAPI
+from src.tasks import AsyncDataFetchingTask, DataFetchingTask
+
+
+def run_threads(urls, max_workers, timeout):
+    task = DataFetchingTask(urls, YandexWeatherAPI.get_forecasting, max_workers=max_workers, timeout=timeout)
+    return task.fetch_all()
+
+
+def run_async(urls, max_workers, timeout):
+    api = AsyncYandexWeatherAPI(max_connections_per_host=max_workers)
+    task = AsyncDataFetchingTask(
+        urls, api.get_forecasting, max_concurrency=max_workers, timeout=timeout, on_close=api.close
+    )
+    return task.fetch_all()
+
+
+MODES = {"threads": run_threads, "async": run_async}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, nargs="+", default=[18, 1000, 10000])
+    parser.add_argument("--max-workers", type=int, default=32)
+    parser.add_argument("--timeout", type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"{'cities':>8} {'mode':>8} {'fetched':>8} {'seconds':>9} {'req/s':>9} {'connections':>12}")
+    for n_cities in args.cities:
+        for mode, run in MODES.items():
+            with StandInServer() as server:
+                urls = server.city_urls(f"CITY{i}" for i in range(n_cities))
+                started = time.perf_counter()
+                results = run(urls, args.max_workers, args.timeout)
+                elapsed = time.perf_counter() - started
+                connections = server.counters["connections"]
+            print(
+                f"{n_cities:>8} {mode:>8} {len(results):>8} {elapsed:>9.3f} "
+                f"{len(results) / elapsed:>9.0f} {connections:>12}"
+            )
+
+
+if __name__ == "__main__":
+    main()
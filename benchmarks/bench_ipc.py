@@ -0,0 +1,41 @@
+"""
+Calculation stage over copies of the example response with different chunk sizes
+
+    python -m benchmarks.bench_ipc --cities 2000 --chunk-sizes 1 8 0
+"""
+import argparse
+import json
+import time
+
+from benchmarks.http_stand_in import load_example_response
+from external.analyzer import analyze_json
+from src.tasks import DataCalculationTask, WorkerPool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[1, 8, 0], help="0 means adaptive")
+    args = parser.parse_args()
+
+    print(f"{'chunk':>8} {'seconds':>9} {'msgs out':>9} {'MB out':>9} {'msgs in':>9} {'MB in':>9}")
+    # workers are forked before the payloads exist so they do not pay copy-on-write faults on them
+    with WorkerPool(num_workers=args.workers) as pool:
+        # distinct objects per city, otherwise pickle memoizes the shared payload inside a chunk
+        raw = load_example_response()
+        fetched_data = {f"CITY{i}": json.loads(raw) for i in range(args.cities)}
+        for chunk_size in args.chunk_sizes:
+            task = DataCalculationTask(fetched_data, analyze_json, pool=pool, chunk_size=chunk_size or None)
+            started = time.perf_counter()
+            task.execute()
+            elapsed = time.perf_counter() - started
+            stats = task.ipc_stats
+            print(
+                f"{chunk_size or 'auto':>8} {elapsed:>9.3f} {stats.messages_sent:>9} "
+                f"{stats.bytes_sent / 2**20:>9.1f} {stats.messages_received:>9} {stats.bytes_received / 2**20:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
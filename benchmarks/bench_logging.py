@@ -0,0 +1,85 @@
+"""
+Calculation stage throughput under different logging set-ups. Every mode runs in its own process with the
+same workers and payloads, logging to a file like the app.log handler.
+
+    python -m benchmarks.bench_logging --cities 500
+"""
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+from benchmarks.http_stand_in import load_example_response
+from config.log_queue import PayloadSampleFilter, start_queue_logging
+from config.logger import LOG_FORMAT
+from external.analyzer import analyze_json
+from src.tasks import DataCalculationTask, WorkerPool
+
+# name: (root level, queue logging, analyzer)
+MODES = {
+    "off": (logging.WARNING, False, "lazy"),
+    "info, eager": (logging.INFO, False, "eager"),
+    "info": (logging.INFO, False, "lazy"),
+    "info, queue": (logging.INFO, True, "lazy"),
+    "debug": (logging.DEBUG, False, "lazy"),
+    "debug, queue": (logging.DEBUG, True, "lazy"),
+}
+
+
+def eager_analyze_json(data):
+    """analyze_json as it logged before: the whole payload formatted at INFO on every call"""
+    logging.info(f"Data {data}")
+    return analyze_json(data)
+
+
+def _run(mode, payloads, workers, log_path, results):
+    level, use_queue, analyzer = MODES[mode]
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = logging.FileHandler(log_path, mode="w")
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(PayloadSampleFilter())
+    root.addHandler(handler)
+    root.setLevel(level)
+    listener = start_queue_logging() if use_queue else None
+
+    calc_func = eager_analyze_json if analyzer == "eager" else analyze_json
+    try:
+        with WorkerPool(num_workers=workers, log_queue=listener.queue if listener else None) as pool:
+            started = time.perf_counter()
+            DataCalculationTask(payloads, calc_func, pool=pool).execute()
+            elapsed = time.perf_counter() - started
+    finally:
+        if listener is not None:
+            listener.stop()
+    handler.close()
+    results.put((elapsed, os.path.getsize(log_path)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    body = load_example_response()
+    payloads = {f"CITY{index}": json.loads(body) for index in range(args.cities)}
+
+    ctx = mp.get_context("fork")
+    results = ctx.Queue()
+    print(f"{'logging':>14} {'cities/s':>10} {'seconds':>8} {'log MB':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in MODES:
+            log_path = os.path.join(directory, "bench.log")
+            process = ctx.Process(target=_run, args=(mode, payloads, args.workers, log_path, results))
+            process.start()
+            elapsed, log_size = results.get()
+            process.join()
+            print(f"{mode:>14} {args.cities / elapsed:>10,.0f} {elapsed:>8.2f} {log_size / 2**20:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Staged (fetch -> calculate -> aggregate barriers) versus streaming pipeline with a slow fetch tail
+
+    python -m benchmarks.bench_pipeline --cities 200 --slow-latency 2
+"""
+import argparse
+import functools
+import json
+import logging
+import random
+import time
+
+from benchmarks.http_stand_in import load_example_response
+from external.analyzer import analyze_json
+from src.pipeline import StreamingPipeline
+from src.tasks import DataAnalyzingTask, DataCalculationTask, DataFetchingTask, WorkerPool
+
+
+def fetch_with_latency(url, timeout, body, latencies):
+    time.sleep(latencies[url])
+    return json.loads(body)
+
+
+def run_staged(urls, fetch_func, pool, max_workers):
+    fetched_data = DataFetchingTask(urls, fetch_func, max_workers=max_workers).fetch_all()
+    calculated_data = DataCalculationTask(fetched_data, analyze_json, pool=pool).execute()
+    return DataAnalyzingTask(calculated_data, pool=pool).execute_and_rank()
+
+
+def run_streaming(urls, fetch_func, pool, max_workers):
+    return StreamingPipeline(urls, fetch_func, pool, max_workers=max_workers).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    parser.add_argument("--slow-share", type=float, default=0.02)
+    parser.add_argument("--max-workers", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    rng = random.Random(0)
+    urls = {f"CITY{i}": f"http://stand-in/{i}" for i in range(args.cities)}
+    latencies = {
+        url: args.slow_latency if rng.random() < args.slow_share else rng.expovariate(1 / args.latency)
+        for url in urls.values()
+    }
+    fetch_func = functools.partial(fetch_with_latency, body=load_example_response(), latencies=latencies)
+
+    with WorkerPool(num_workers=args.workers) as pool:
+        for name, run in (("staged", run_staged), ("streaming", run_streaming)):
+            started = time.perf_counter()
+            run(urls, fetch_func, pool, args.max_workers)
+            print(f"{name:>10} {time.perf_counter() - started:>8.3f}s")
+    print(f"max single fetch {max(latencies.values()):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
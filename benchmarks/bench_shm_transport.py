@@ -0,0 +1,40 @@
+"""
+Calculation stage with pickled payloads versus the shared memory transport
+
+    python -m benchmarks.bench_shm_transport --cities 2000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.http_stand_in import load_example_response
+from external.analyzer import analyze_json
+from src.tasks import TRANSPORT_PICKLE, TRANSPORT_SHARED_MEMORY, DataCalculationTask, WorkerPool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'transport':>10} {'seconds':>9} {'MB sent':>9} {'peak MB':>9}")
+    with WorkerPool(num_workers=args.workers) as pool:
+        raw = load_example_response()
+        fetched_data = {f"CITY{i}": json.loads(raw) for i in range(args.cities)}
+
+        for transport in (TRANSPORT_PICKLE, TRANSPORT_SHARED_MEMORY):
+            task = DataCalculationTask(fetched_data, analyze_json, pool=pool, transport=transport)
+            tracemalloc.start()
+            started = time.perf_counter()
+            task.execute()
+            elapsed = time.perf_counter() - started
+            # peak of allocations made by the stage in the parent, on top of the fetched payloads
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{transport:>10} {elapsed:>9.3f} {task.ipc_stats.bytes_sent / 2**20:>9.2f} {peak / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
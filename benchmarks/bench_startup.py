@@ -0,0 +1,114 @@
+"""
+Startup cost: import time of the entry points from `python -X importtime`, and wall time of `main.py --help`
+(interpreter start, imports and argument parsing). Every sample is a fresh interpreter, the best of --repeat is kept.
+Results can be saved as a baseline and later runs compared with it, as with benchmarks.suite.
+
+    python -m benchmarks.bench_startup --save startup.json
+    python -m benchmarks.bench_startup --compare startup.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.suite import compare
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("main", "src.tasks", "src.pipeline", "src.sharding")
+# loaded by main.py only in the modes that need them
+HEAVY_MODULES = ("numpy", "pydantic", "pydantic_settings", "asyncio", "sqlite3", "urllib.request", "ssl")
+
+
+def _environment() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BASE_DIR, env.get("PYTHONPATH")]))
+    return env
+
+
+def import_times(module: str, directory: str) -> Dict[str, Tuple[int, int]]:
+    """(self, cumulative) import time in microseconds of every module loaded by importing module"""
+    # main.py opens app.log before parsing arguments, run from a scratch directory to keep app.log out of the tree
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=directory,
+        env=_environment(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def help_wall_time(directory: str) -> float:
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join(BASE_DIR, "main.py"), "--help"],
+        cwd=directory,
+        env=_environment(),
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=list(MODULES))
+    parser.add_argument("--repeat", type=int, default=5, help="best of this many interpreters per measurement")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list for main")
+    parser.add_argument("--save", default=None, help="write the results to this baseline file")
+    parser.add_argument("--compare", default=None, help="baseline file to flag regressions against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+    args = parser.parse_args()
+
+    current: Dict[str, Any] = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "repeat": args.repeat},
+        "results": {},
+    }
+    print(f"{'measurement':>24} {'seconds':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        main_times: Dict[str, Tuple[int, int]] = {}
+        for module in args.modules:
+            samples = [import_times(module, directory) for _ in range(args.repeat)]
+            best = min(samples, key=lambda times: times[module][1])
+            seconds = best[module][1] / 1e6
+            loaded: List[str] = [name for name in HEAVY_MODULES if name in best]
+            current["results"][f"import.{module}"] = {"seconds": seconds, "heavy_modules": loaded}
+            print(f"{'import ' + module:>24} {seconds:>9.4f}  heavy: {', '.join(loaded) or '-'}")
+            if module == "main":
+                main_times = best
+        seconds = min(help_wall_time(directory) for _ in range(args.repeat))
+        current["results"]["main.help"] = {"seconds": seconds}
+        print(f"{'main.py --help':>24} {seconds:>9.4f}")
+
+    if main_times:
+        print(f"\n{'module':>32} {'self ms':>8} {'cumulative ms':>14}")
+        slowest = sorted(main_times.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+        for name, (self_us, cumulative_us) in slowest:
+            print(f"{name:>32} {self_us / 1000:>8.2f} {cumulative_us / 1000:>14.2f}")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(current, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
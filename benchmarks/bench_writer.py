@@ -0,0 +1,96 @@
+"""
+Throughput and peak memory of the output writers, against the previous list + np.savetxt implementation.
+Every writer runs in its own process on the same synthetic city-days; peak memory is the growth of the
+process high-water mark over its resident size before writing.
+
+    python -m benchmarks.bench_writer --rows 1000000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+from external.analyzer import DaySummary
+from src.tasks import OUTPUT_CSV, OUTPUT_DTYPE, OUTPUT_NPY, OUTPUT_PARQUET, DataAggregationTask
+
+DAYS_PER_CITY = 5
+
+
+def build_data(rows):
+    original_data, aggregated_data = {}, {}
+    for index in range(rows // DAYS_PER_CITY):
+        city = f"CITY{index}"
+        # analyze_json results
+        days = [DaySummary(f"2022-05-{18 + day}", 9, 19, 11, 13.091 + index % 7, day) for day in range(DAYS_PER_CITY)]
+        original_data[city] = {"days": days}
+        aggregated_data[city] = {"average_temperature": 11.7 + index % 11, "total_relevant_condition_hours": 27}
+    return original_data, aggregated_data
+
+
+def savetxt_writer(original_data, aggregated_data, ranked_cities, filename):
+    """The writer before streaming: every row in a list, then in a structured array"""
+    rows = list(DataAggregationTask.iter_rows(original_data, aggregated_data, ranked_cities))
+    array = np.array(rows, dtype=OUTPUT_DTYPE)
+    np.savetxt(filename, array, delimiter=",", fmt="%s", header=",".join(OUTPUT_DTYPE.names), comments="")
+
+
+def _rss_kb(field):
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run(name, rows, directory, results):
+    original_data, aggregated_data = build_data(rows)
+    ranked_cities = list(original_data)
+    filename = os.path.join(directory, f"output-{name}")
+    if name == "savetxt":
+        write = savetxt_writer
+    else:
+        write = lambda *data: DataAggregationTask.write_aggregated_data(*data, output_format=name)  # noqa: E731
+
+    try:
+        # resets the high-water mark to the current resident size (Linux)
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+    before = _rss_kb("VmRSS")
+    started = time.perf_counter()
+    write(original_data, aggregated_data, ranked_cities, filename)
+    elapsed = time.perf_counter() - started
+    peak = _rss_kb("VmHWM")
+    size = os.path.getsize(filename) if os.path.exists(filename) else 0
+    results.put((name, elapsed, max(peak - before, 0), size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("fork")
+    results = ctx.Queue()
+    print(f"{'writer':>8} {'rows/s':>12} {'seconds':>8} {'peak MB':>8} {'file MB':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("savetxt", OUTPUT_CSV, OUTPUT_NPY, OUTPUT_PARQUET):
+            process = ctx.Process(target=_run, args=(name, args.rows, directory, results))
+            process.start()
+            name, elapsed, peak_kb, size = results.get()
+            process.join()
+            if not size:
+                print(f"{name:>8} skipped")
+                continue
+            print(
+                f"{name:>8} {args.rows / elapsed:>12,.0f} {elapsed:>8.2f} {peak_kb / 1024:>8.1f} {size / 2**20:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Local stand-in for the forecast S3 host, used by benchmarks and tests
+"""
+import hashlib
+import os
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Union
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE_RESPONSE_PATH = os.path.join(BASE_DIR, "data", "examples", "response.json")
+
+PayloadSource = Union[bytes, Callable[[str], Optional[bytes]]]
+
+
+def load_example_response() -> bytes:
+    with open(EXAMPLE_RESPONSE_PATH, "rb") as file:
+        return file.read()
+
+
+@dataclass
+class FaultProfile:
+    """
+    Faults injected into every request: a base latency with uniform jitter, a share of requests delayed
+    by slow_latency (the slow tail) and a share answered with error_status. Random but reproducible for a seed.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 500
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """(delay in seconds, error status or None) for the next request"""
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            if self._rng.random() < self.slow_rate:
+                delay += self.slow_latency
+            failed = self._rng.random() < self.error_rate
+        return delay, self.error_status if failed else None
+
+
+class _StandInHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address) -> None:
+        # clients drop the connection of hedged or timed out requests mid-response
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.stand_in.count("connections")
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        stand_in: StandInServer = self.server.stand_in
+        stand_in.count("requests")
+        if stand_in.faults is not None:
+            delay, error_status = stand_in.faults.draw()
+            if delay:
+                time.sleep(delay)
+            if error_status is not None:
+                stand_in.count("errors")
+                self.send_response(error_status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        body = stand_in.payload_for(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if_none_match = self.headers.get("If-None-Match")
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if (if_none_match and if_none_match == etag) or (
+            not if_none_match and if_modified_since and if_modified_since == stand_in.last_modified
+        ):
+            stand_in.count("not_modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", stand_in.last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandInServer:
+    """
+    Threaded HTTP/1.1 keep-alive server serving forecast payloads by path,
+    with ETag / Last-Modified validators and 304 responses to conditional requests, and optional injected faults
+    """
+
+    handler_class = StandInHandler
+
+    def __init__(
+        self,
+        payload: Optional[PayloadSource] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        faults: Optional[FaultProfile] = None,
+    ) -> None:
+        self.payload: PayloadSource = payload if payload is not None else load_example_response()
+        self.faults: Optional[FaultProfile] = faults
+        self.httpd = _StandInHTTPServer((host, port), self.handler_class)
+        self.httpd.stand_in = self
+        self.counters: Dict[str, int] = {"connections": 0, "requests": 0, "not_modified": 0, "errors": 0}
+        self.last_modified: str = formatdate(usegmt=True)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url_for(self, city: str) -> str:
+        return f"{self.base_url}/{city.lower()}-response.json"
+
+    def city_urls(self, cities) -> Dict[str, str]:
+        return {city: self.url_for(city) for city in cities}
+
+    def payload_for(self, path: str) -> Optional[bytes]:
+        if callable(self.payload):
+            return self.payload(path)
+        return self.payload
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,26 @@
+"""
+Runs main.py with src.utils.CITIES replaced by the cities of a JSON file {city: url}, e.g. served by a StandInServer
+
+    python -m benchmarks.run_main cities.json --pipeline streaming --report report.json
+"""
+import json
+import os
+import runpy
+import sys
+
+from src.utils import CITIES
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def main():
+    with open(sys.argv[1]) as file:
+        cities = json.load(file)
+    CITIES.clear()
+    CITIES.update(cities)
+    sys.argv = [MAIN_PATH] + sys.argv[2:]
+    runpy.run_path(MAIN_PATH, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Benchmark suite over synthetic forecasts served by a local stand-in with injected latency, errors and slow tails.
+Every task class is timed on its own, then main.py end to end, at multiples of the 18 cities of src/utils.py.
+Results can be saved as a baseline and later runs compared with it; slower scenarios are flagged as regressions.
+
+    python -m benchmarks.suite --scales 1 10 100 --save baseline.json
+    python -m benchmarks.suite --scales 1 10 100 --compare baseline.json --threshold 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmarks.http_stand_in import FaultProfile, StandInServer
+from benchmarks.synthetic import ForecastGenerator, city_names
+from external.analyzer import analyze_json
+from external.async_client import AsyncYandexWeatherAPI
+from external.client import YandexWeatherAPI
+from external.resilience import ResilientFetcher
+from src.tasks import (
+    AsyncDataFetchingTask,
+    DataAggregationTask,
+    DataAnalyzingTask,
+    DataCalculationTask,
+    DataFetchingTask,
+    WorkerPool,
+)
+from src.utils import CITIES
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_CITIES = len(CITIES)
+# slowdowns shorter than this are noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.05
+
+
+def timed(func: Callable[[], Any], repeat: int) -> Tuple[float, Any]:
+    """Best of repeat runs, and the result of the last one"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def run_main(urls: Dict[str, str], main_args: List[str], directory: str) -> Dict[str, Any]:
+    cities_path = os.path.join(directory, "cities.json")
+    report_path = os.path.join(directory, "report.json")
+    with open(cities_path, "w") as file:
+        json.dump(urls, file)
+    env = dict(os.environ, PYTHONPATH=BASE_DIR)
+    command = [sys.executable, "-m", "benchmarks.run_main", cities_path, "--report", report_path] + main_args
+    subprocess.run(command, cwd=directory, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(report_path) as file:
+        return json.load(file)
+
+
+def run_scale(args, server: StandInServer, pool: WorkerPool, cities: int) -> Dict[str, Dict[str, Any]]:
+    urls = server.city_urls(city_names(cities))
+    results: Dict[str, Dict[str, Any]] = {}
+
+    def record(name: str, seconds: float, items: int, **extra: Any) -> None:
+        results[f"{name}@{cities}"] = {"seconds": seconds, "items": items, "items_per_second": items / seconds, **extra}
+        print(f"{name:>20} {cities:>7} {seconds:>9.3f} {items / seconds:>12,.0f}", flush=True)
+
+    seconds, fetched = timed(
+        lambda: DataFetchingTask(urls, YandexWeatherAPI.get_forecasting, max_workers=args.concurrency).fetch_all(),
+        args.repeat,
+    )
+    record("fetch.threads", seconds, len(urls), fetched=len(fetched))
+
+    # retries and hedging past the 95th percentile, as main.py with --hedge-quantile 0.95
+    fetcher = ResilientFetcher(YandexWeatherAPI.get_forecasting, max_workers=args.concurrency, hedge_quantile=0.95)
+    seconds, fetched_resilient = timed(
+        lambda: DataFetchingTask(urls, fetcher, max_workers=args.concurrency).fetch_all(), args.repeat
+    )
+    fetcher.close()
+    record("fetch.resilient", seconds, len(urls), fetched=len(fetched_resilient))
+
+    def fetch_async():
+        api = AsyncYandexWeatherAPI(max_connections_per_host=args.concurrency)
+        task = AsyncDataFetchingTask(urls, api.get_forecasting, max_concurrency=args.concurrency, on_close=api.close)
+        return task.fetch_all()
+
+    seconds, fetched_async = timed(fetch_async, args.repeat)
+    record("fetch.async", seconds, len(urls), fetched=len(fetched_async))
+
+    seconds, calculated = timed(lambda: DataCalculationTask(fetched, analyze_json, pool=pool).execute(), args.repeat)
+    record("calculation", seconds, len(fetched))
+
+    seconds, (analyzed, ranked) = timed(
+        lambda: DataAnalyzingTask(calculated, pool=pool).execute_and_rank(), args.repeat
+    )
+    record("analysis", seconds, len(calculated))
+
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "output.csv")
+        seconds, _ = timed(
+            lambda: DataAggregationTask.write_aggregated_data_to_csv(calculated, analyzed, ranked, output),
+            args.repeat,
+        )
+        rows = DataAggregationTask.count_rows(calculated, ranked)
+        record("aggregation", seconds, rows)
+
+    for pipeline in ("staged", "streaming"):
+        main_args = ["--pipeline", pipeline, "--workers", str(args.workers), "--max-concurrency", str(args.concurrency)]
+        with tempfile.TemporaryDirectory() as directory:
+            seconds, report = timed(lambda: run_main(urls, main_args, directory), args.repeat)
+        stages = {name: round(stage["wall_time"], 4) for name, stage in report["stages"].items()}
+        record(f"main.{pipeline}", seconds, len(urls), stages=stages, peak_rss_kb=report["peak_rss_kb"])
+    return results
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    regressions = []
+    print(f"\n{'scenario':>28} {'baseline s':>11} {'current s':>10} {'ratio':>7}")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        slower = result["seconds"] - before["seconds"]
+        regressed = ratio > 1 + threshold and slower > MIN_REGRESSION_SECONDS
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:>28} {before['seconds']:>11.3f} {result['seconds']:>10.3f} {ratio:>7.2f}{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help=f"multiples of {BASE_CITIES}")
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--lean", action="store_true", help="only the fields the analysis reads, for 1000x")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--slow-rate", type=float, default=0.01)
+    parser.add_argument("--slow-latency", type=float, default=0.25)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1, help="best of this many runs per scenario")
+    parser.add_argument("--save", default=None, help="write the results to this baseline file")
+    parser.add_argument("--compare", default=None, help="baseline file to flag regressions against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+    args = parser.parse_args()
+    # injected errors are expected, their log records would drown the results
+    logging.disable(logging.CRITICAL)
+
+    generator = ForecastGenerator(args.days, args.hours, args.seed, args.lean)
+    faults = FaultProfile(args.latency, args.jitter, args.slow_rate, args.slow_latency, args.error_rate, seed=args.seed)
+    current: Dict[str, Any] = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("save", "compare")},
+        },
+        "results": {},
+    }
+
+    print(f"{'scenario':>20} {'cities':>7} {'seconds':>9} {'items/s':>12}")
+    # workers are forked before the fetched payloads grow this process
+    with WorkerPool(num_workers=args.workers) as pool:
+        with StandInServer(generator.payload_source(), faults=faults) as server:
+            for scale in args.scales:
+                current["results"].update(run_scale(args, server, pool, BASE_CITIES * scale))
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(current, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline["meta"]["args"] != current["meta"]["args"]:
+            print("warning: baseline was recorded with different arguments", file=sys.stderr)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Deterministic synthetic forecasts in the Yandex Weather format of data/examples/response.json
+"""
+import copy
+import datetime
+import functools
+import json
+import random
+import zlib
+from typing import Any, Dict, List, Optional
+
+from benchmarks.http_stand_in import load_example_response
+from external.columnar import CONDITIONS
+
+START_DATE = datetime.date(2022, 5, 18)
+PATH_SUFFIX = "-response.json"
+SECONDS_PER_HOUR = 60 * 60
+# most hours dry, as in the example response
+CONDITION_WEIGHTS = [30, 25, 15, 15] + [1] * (len(CONDITIONS) - 4)
+
+
+def city_names(count: int) -> List[str]:
+    return [f"CITY{index:06d}" for index in range(count)]
+
+
+@functools.lru_cache(maxsize=None)
+def _template() -> Dict[str, Any]:
+    return json.loads(load_example_response())
+
+
+class ForecastGenerator:
+    """
+    Forecasts for any city name, the same on every call and every machine for a given seed.
+    lean=True keeps only the fields the analysis reads, to get to 1000x the city count within memory.
+    """
+
+    def __init__(self, days: int = 5, hours: int = 24, seed: int = 0, lean: bool = False) -> None:
+        self.days: int = days
+        self.hours: int = hours
+        self.seed: int = seed
+        self.lean: bool = lean
+
+    def _rng(self, city: str) -> random.Random:
+        return random.Random(zlib.crc32(city.encode("utf-8")) ^ self.seed)
+
+    def _hour(self, rng: random.Random, hour: int, hour_ts: int, base_temp: int) -> Dict[str, Any]:
+        temp = base_temp + round(6 * (1 - abs(hour - 14) / 14)) + rng.randint(-2, 2)
+        condition = rng.choices(CONDITIONS, CONDITION_WEIGHTS)[0]
+        if self.lean:
+            return {"hour": str(hour), "temp": temp, "condition": condition}
+        hour_data = copy.copy(_template()["forecasts"][0]["hours"][hour % 24])
+        hour_data.update(hour=str(hour), hour_ts=hour_ts, temp=temp, feels_like=temp - 3, condition=condition)
+        return hour_data
+
+    def forecast(self, city: str) -> Dict[str, Any]:
+        rng = self._rng(city)
+        base_temp = rng.randint(-5, 25)
+        template = _template()
+        forecasts = []
+        for day in range(self.days):
+            date = START_DATE + datetime.timedelta(days=day)
+            date_ts = int(datetime.datetime(date.year, date.month, date.day, tzinfo=datetime.timezone.utc).timestamp())
+            day_data: Dict[str, Any] = {"date": date.isoformat()}
+            if not self.lean:
+                day_data.update({key: value for key, value in template["forecasts"][0].items() if key != "hours"})
+                day_data.update(date=date.isoformat(), date_ts=date_ts, week=date.isocalendar()[1])
+            day_data["hours"] = [
+                self._hour(rng, hour, date_ts + hour * SECONDS_PER_HOUR, base_temp) for hour in range(self.hours)
+            ]
+            forecasts.append(day_data)
+        if self.lean:
+            return {"forecasts": forecasts}
+        payload = {key: value for key, value in template.items() if key != "forecasts"}
+        payload["forecasts"] = forecasts
+        return payload
+
+    def body(self, city: str) -> bytes:
+        return json.dumps(self.forecast(city)).encode("utf-8")
+
+    def payload_source(self, cache_size: Optional[int] = 4096):
+        """Callable for StandInServer: serves /<city>-response.json, bodies of recent cities kept encoded"""
+
+        @functools.lru_cache(maxsize=cache_size)
+        def body_for(city: str) -> bytes:
+            return self.body(city)
+
+        def payload_for(path: str) -> Optional[bytes]:
+            name = path.rsplit("/", 1)[-1]
+            if not name.endswith(PATH_SUFFIX):
+                return None
+            return body_for(name[:-len(PATH_SUFFIX)].upper())
+
+        return payload_for
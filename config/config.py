@@ -1,7 +1,5 @@
 import os
-
-from pydantic import Field
-from pydantic_settings import BaseSettings
+from typing import Dict, Optional
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -9,13 +7,54 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 env_file = ".env"
 ENV_FILE_PATH = os.path.join(BASE_DIR, env_file)
 
-
-class Settings(BaseSettings):
-    app_debug_level: str = Field("INFO", env="APP_DEBUG_LEVEL")
-    base_dir: str = Field(BASE_DIR)
-
-    class Config:
-        env_file = ENV_FILE_PATH
-
-
-settings = Settings()
+_env_file_values: Optional[Dict[str, str]] = None
+
+
+def read_env_file(path: str = ENV_FILE_PATH) -> Dict[str, str]:
+    """KEY=value lines of a dotenv file, keys lower-cased as pydantic-settings matches them"""
+    values: Dict[str, str] = {}
+    try:
+        with open(path) as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return values
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        key = key.strip()
+        if key.startswith("export "):
+            key = key[len("export "):].strip()
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+            value = value[1:-1]
+        elif " #" in value:
+            value = value.split(" #", 1)[0].rstrip()
+        values[key.lower()] = value
+    return values
+
+
+def get_setting(name: str, default: str) -> str:
+    """
+    One setting without pydantic: the environment variable first, then .env, as Settings resolves it.
+    For startup code such as the logging config; Settings still validates the full set.
+    """
+    global _env_file_values
+    for key, value in os.environ.items():
+        if key.lower() == name.lower():
+            return value
+    if _env_file_values is None:
+        _env_file_values = read_env_file()
+    return _env_file_values.get(name.lower(), default)
+
+
+def __getattr__(name: str):
+    # PEP 562: pydantic is only imported by code that uses the validated settings
+    if name in ("Settings", "settings"):
+        import importlib
+
+        value = getattr(importlib.import_module("config.settings"), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
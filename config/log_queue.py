@@ -0,0 +1,56 @@
+import itertools
+import logging
+import multiprocessing as mp
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+# extra= of records whose argument is a whole forecast payload
+PAYLOAD: Dict[str, Any] = {"payload": True}
+PAYLOAD_SAMPLE_EVERY = 100
+
+
+class PayloadSampleFilter(logging.Filter):
+    """
+    Lets through one in `every` records logged with extra=PAYLOAD, so payload dumps are formatted rarely even at DEBUG.
+    The decision is stored on the record: every handler, on either side of a log queue, agrees on it.
+    """
+
+    def __init__(self, every: int = PAYLOAD_SAMPLE_EVERY) -> None:
+        super().__init__()
+        self.every: int = every
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "payload", False):
+            return True
+        if not hasattr(record, "payload_sampled"):
+            record.payload_sampled = next(self._counter) % self.every == 0
+        return record.payload_sampled
+
+
+def install_queue_handler(log_queue: Any) -> QueueHandler:
+    """Replaces the root handlers of this process with a single one forwarding records to log_queue"""
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    for handler in handlers:
+        root.removeHandler(handler)
+    queue_handler = QueueHandler(log_queue)
+    # records none of the replaced handlers would emit are dropped before being formatted and pickled
+    queue_handler.setLevel(min((handler.level for handler in handlers), default=logging.NOTSET))
+    queue_handler.addFilter(PayloadSampleFilter())
+    root.addHandler(queue_handler)
+    return queue_handler
+
+
+def start_queue_logging(log_queue: Optional[Any] = None) -> QueueListener:
+    """
+    Moves the configured root handlers behind a QueueListener thread of this process, the single writer.
+    Processes forked afterwards inherit the queue handler, spawned ones install it with install_queue_handler.
+    """
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    log_queue = log_queue if log_queue is not None else mp.Queue(-1)
+    install_queue_handler(log_queue)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -1,4 +1,5 @@
-from config.config import settings
+from config.config import get_setting
+from config.log_queue import PayloadSampleFilter
 
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 LOG_DEFAULT_HANDLERS = ["console", "file"]  # Added "file" here
@@ -9,11 +10,15 @@ LOGGING = {
     "formatters": {
         "verbose": {"format": LOG_FORMAT},
     },
+    "filters": {
+        "payload_sample": {"()": PayloadSampleFilter},
+    },
     "handlers": {
         "console": {
             "level": "DEBUG",
             "class": "logging.StreamHandler",
             "formatter": "verbose",
+            "filters": ["payload_sample"],
         },
         "file": {  # New File Handler
             "level": "INFO",
@@ -21,12 +26,13 @@ LOGGING = {
             "formatter": "verbose",
             "filename": "app.log",  # Specify your log file name here
             "mode": "w",  # Append mode
+            "filters": ["payload_sample"],
         },
     },
     "loggers": {
         "": {
             "handlers": LOG_DEFAULT_HANDLERS,
-            "level": settings.app_debug_level,
+            "level": get_setting("app_debug_level", "INFO"),
         },
     },
     "root": {
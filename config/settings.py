@@ -0,0 +1,15 @@
+from pydantic import Field
+from pydantic_settings import BaseSettings
+
+from config.config import BASE_DIR, ENV_FILE_PATH
+
+
+class Settings(BaseSettings):
+    app_debug_level: str = Field("INFO", env="APP_DEBUG_LEVEL")
+    base_dir: str = Field(BASE_DIR)
+
+    class Config:
+        env_file = ENV_FILE_PATH
+
+
+settings = Settings()
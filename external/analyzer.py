@@ -4,7 +4,7 @@ import logging
 from dataclasses import dataclass, field
 from functools import reduce
 from operator import getitem
-from typing import Optional, List, Dict
+from typing import Any, Dict, List, Optional
 
 
 INPUT_FORECAST_PATH = "forecasts"
@@ -30,6 +30,69 @@ DEFAULT_OUTPUT_RESULT = {
 }
 
 
+class DaySummary:
+    """
+    Analysis result of one day, what DayInfo.to_json returned as a dict. Read by key like that dict, and pickled
+    as a bare tuple of values: less than half the memory of the dict and a smaller pickle between processes.
+    """
+
+    __slots__ = ("date", "hours_start", "hours_end", "hours_count", "temp_avg", "relevant_cond_hours")
+
+    def __init__(
+        self,
+        date: Optional[str],
+        hours_start: Optional[int],
+        hours_end: Optional[int],
+        hours_count: Optional[int],
+        temp_avg: Optional[float],
+        relevant_cond_hours: Optional[int],
+    ) -> None:
+        self.date = date
+        self.hours_start = hours_start
+        self.hours_end = hours_end
+        self.hours_count = hours_count
+        self.temp_avg = temp_avg
+        self.relevant_cond_hours = relevant_cond_hours
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "DaySummary":
+        """Also accepts partial dicts: a missing date is empty, any other missing value is None"""
+        return cls(
+            data.get("date", ""),
+            data.get("hours_start"),
+            data.get("hours_end"),
+            data.get("hours_count"),
+            data.get("temp_avg"),
+            data.get("relevant_cond_hours"),
+        )
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __reduce__(self):
+        return DaySummary, tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, DaySummary):
+            other = other.to_json()
+        return isinstance(other, dict) and self.to_json() == other
+
+    def __repr__(self) -> str:
+        return "DaySummary({})".format(", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__))
+
+    def to_json(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
 @dataclass
 class HourInfo:
     raw_data: Dict[str, tuple[str, int]] = field(repr=False)
@@ -71,15 +134,18 @@ class DayInfo:
     temperature_avg: Optional[float] = field(init=False, default=None)
     relevant_condition_hours: int = field(init=False, default=0)
 
+    def to_summary(self) -> DaySummary:
+        return DaySummary(
+            self.date,
+            self.hour_start,
+            self.hour_end,
+            self.hours_count,
+            round(self.temperature_avg, 3) if self.temperature_avg else self.temperature_avg,
+            self.relevant_condition_hours,
+        )
+
     def to_json(self):
-        return {
-            "date": self.date,
-            "hours_start": self.hour_start,
-            "hours_end": self.hour_end,
-            "hours_count": self.hours_count,
-            "temp_avg": round(self.temperature_avg, 3) if self.temperature_avg else self.temperature_avg,
-            "relevant_cond_hours": self.relevant_condition_hours,
-        }
+        return self.to_summary().to_json()
 
     def __post_init__(self):
         self.parse()
@@ -131,7 +197,8 @@ def analyze_json(data):
     time_start = None
     time_end = None
 
-    logging.info(f"Data {data}")
+    # formatted only when a handler emits it, and sampled by config.log_queue.PayloadSampleFilter
+    logging.debug("Data %s", data, extra={"payload": True})
     days_data = deep_getitem(data, INPUT_FORECAST_PATH)
     days = []
     for day_data in days_data:
@@ -141,8 +208,9 @@ def analyze_json(data):
         time_start = time_start or d_date
         time_end = d_date
 
-        days.append(d_info.to_json())
+        days.append(d_info.to_summary())
 
-    result = DEFAULT_OUTPUT_RESULT
+    # a new dict per call: results of several cities are pickled together by the pool workers
+    result = dict(DEFAULT_OUTPUT_RESULT)
     result[OUTPUT_DAYS_KEY] = days
     return result
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import logging
+import ssl
+from collections import deque
+from http import HTTPStatus
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from external.client import ERR_MESSAGE_TEMPLATE, FetchError
+from external.compact import decode_compact_forecast
+
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 10
+USER_AGENT = "weather-analysis-async/1.0"
+
+logger = logging.getLogger(__name__)
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+def status_phrase(status: int) -> str:
+    """Reason phrase of a status, empty for codes outside the standard ones, such as 520 or 599"""
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return ""
+
+
+class HostConnectionPool:
+    """
+    Keep-alive connections to a single (scheme, host, port)
+    """
+
+    def __init__(self, host: str, port: int, ssl_context: Optional[ssl.SSLContext], max_connections: int) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.ssl_context: Optional[ssl.SSLContext] = ssl_context
+        self.idle: Deque[Connection] = deque()
+        self.slots: asyncio.Semaphore = asyncio.Semaphore(max_connections)
+        self.opened: int = 0
+
+    async def acquire(self) -> Tuple[Connection, bool]:
+        """Returns a connection and a flag telling whether it was reused"""
+        await self.slots.acquire()
+        while self.idle:
+            reader, writer = self.idle.popleft()
+            if not writer.is_closing() and not reader.at_eof():
+                return (reader, writer), True
+            writer.close()
+        try:
+            connection = await asyncio.open_connection(self.host, self.port, ssl=self.ssl_context)
+        except BaseException:
+            self.slots.release()
+            raise
+        self.opened += 1
+        return connection, False
+
+    def release(self, connection: Connection, reusable: bool) -> None:
+        if reusable:
+            self.idle.append(connection)
+        else:
+            connection[1].close()
+        self.slots.release()
+
+    async def close(self) -> None:
+        while self.idle:
+            _, writer = self.idle.popleft()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+
+
+class AsyncYandexWeatherAPI:
+    """
+    Asyncio client for requests, keeps a keep-alive connection pool per host
+    """
+
+    def __init__(
+        self,
+        max_connections_per_host: int = DEFAULT_MAX_CONNECTIONS_PER_HOST,
+        compact: bool = False,
+        loads: Optional[Callable[[str], Any]] = None,
+    ) -> None:
+        self.max_connections_per_host: int = max_connections_per_host
+        self.loads: Callable[[str], Any] = loads or (decode_compact_forecast if compact else json.loads)
+        self.pools: Dict[Tuple[str, str, int], HostConnectionPool] = {}
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    @property
+    def connections_opened(self) -> int:
+        return sum(pool.opened for pool in self.pools.values())
+
+    def _get_pool(self, scheme: str, host: str, port: int) -> HostConnectionPool:
+        key = (scheme, host, port)
+        pool = self.pools.get(key)
+        if pool is None:
+            ssl_context = None
+            if scheme == "https":
+                self._ssl_context = self._ssl_context or ssl.create_default_context()
+                ssl_context = self._ssl_context
+            pool = HostConnectionPool(host, port, ssl_context, self.max_connections_per_host)
+            self.pools[key] = pool
+        return pool
+
+    @staticmethod
+    async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size_line = await reader.readline()
+                size = int(size_line.split(b";", 1)[0].strip(), 16)
+                if size == 0:
+                    # trailers end with an empty line
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return b"".join(chunks)
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+        if "content-length" in headers:
+            return await reader.readexactly(int(headers["content-length"]))
+        return await reader.read()
+
+    async def _request(self, connection: Connection, host_header: str, path: str) -> Tuple[int, Dict[str, str], bytes]:
+        reader, writer = connection
+        writer.write(
+            (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {host_header}\r\n"
+                f"User-Agent: {USER_AGENT}\r\n"
+                "Accept-Encoding: identity\r\n"
+                "Connection: keep-alive\r\n\r\n"
+            ).encode("latin-1")
+        )
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed before response")
+        version, status, *_ = status_line.decode("latin-1").split(" ", 2)
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        body = await self._read_body(reader, headers)
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        headers["x-keep-alive"] = "1" if keep_alive else "0"
+        return int(status), headers, body
+
+    async def _do_req(self, url: str) -> Any:
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        port = parts.port or (443 if scheme == "https" else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        pool = self._get_pool(scheme, parts.hostname, port)
+
+        while True:
+            connection, reused = await pool.acquire()
+            reusable = False
+            try:
+                status, headers, body = await self._request(connection, parts.netloc, path)
+                reusable = headers["x-keep-alive"] == "1"
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # an idle keep-alive connection may have been dropped by the server
+                if reused:
+                    continue
+                raise
+            finally:
+                pool.release(connection, reusable)
+            break
+
+        logger.info("Url to open %s", url)
+        if status != HTTPStatus.OK:
+            message = "Error during execute request. {}: {}".format(status, status_phrase(status))
+            raise FetchError(message, url, status=status)
+        return self.loads(body.decode("utf-8"))
+
+    async def get_forecasting(self, url: str, timeout: int = 10):
+        """
+        :param url: url_to_json_data as str
+        :return: response data as json
+        """
+        try:
+            return await asyncio.wait_for(self._do_req(url), timeout)
+        except asyncio.TimeoutError:
+            logger.error("Request timed out: %s", url)
+            raise FetchError(ERR_MESSAGE_TEMPLATE.format(error="Request timed out"), url, timeout=True)
+        except FetchError as ex:
+            logger.error(ex)
+            raise FetchError(ERR_MESSAGE_TEMPLATE.format(error=ex), url, ex.status, ex.timeout, ex.retryable)
+        except Exception as ex:
+            logger.error(ex)
+            # connection and protocol failures may not happen again, a body that does not decode will
+            retryable = isinstance(ex, (OSError, asyncio.IncompleteReadError))
+            raise FetchError(ERR_MESSAGE_TEMPLATE.format(error=ex), url, retryable=retryable)
+
+    async def close(self) -> None:
+        for pool in self.pools.values():
+            await pool.close()
+        self.pools.clear()
+
+    async def __aenter__(self) -> "AsyncYandexWeatherAPI":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
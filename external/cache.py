@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from http import HTTPStatus
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from external.client import FetchError, YandexWeatherAPI
+
+DEFAULT_TTL = 60 * 60
+DEFAULT_MAX_STALE = 7 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+ENTRY_SUFFIX = ".entry"
+# the metadata line is padded to a multiple of this, so that revalidation can rewrite it in place
+META_ALIGNMENT = 256
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry(NamedTuple):
+    url: str
+    stored_at: float
+    etag: Optional[str]
+    last_modified: Optional[str]
+    body: bytes
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    revalidated: int = 0
+    stored: int = 0
+    evicted: int = 0
+
+    def to_json(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class ResponseCache:
+    """
+    Response bodies on disk, one file per URL: a JSON metadata line followed by the body.
+    Files are replaced atomically, so concurrent writers (threads or processes) never expose a partial entry.
+    Entries are fresh for ttl seconds, revalidatable for max_stale more, and the least recently used ones
+    are evicted once the directory grows past max_bytes. A revalidated entry only gets its metadata line rewritten.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        ttl: float = DEFAULT_TTL,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_stale: float = DEFAULT_MAX_STALE,
+    ) -> None:
+        self.directory: str = directory
+        self.ttl: float = ttl
+        self.max_bytes: int = max_bytes
+        self.max_stale: float = max_stale
+        self.stats: CacheStats = CacheStats()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size: int = sum(entry.stat().st_size for entry in self._scan())
+
+    def _scan(self):
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(ENTRY_SUFFIX)]
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest() + ENTRY_SUFFIX)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            setattr(self.stats, name, getattr(self.stats, name) + 1)
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.stored_at < self.ttl
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        path = self._path(url)
+        try:
+            with open(path, "rb") as file:
+                meta = json.loads(file.readline())
+                body = file.read()
+            # the modification time doubles as the last use for LRU eviction
+            os.utime(path)
+            entry = CacheEntry(body=body, **meta)
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+        if entry.url != url or time.time() - entry.stored_at > self.ttl + self.max_stale:
+            return None
+        return entry
+
+    @staticmethod
+    def _meta(url: str, etag: Optional[str], last_modified: Optional[str]) -> bytes:
+        meta = {"url": url, "stored_at": time.time(), "etag": etag, "last_modified": last_modified}
+        return json.dumps(meta).encode("utf-8")
+
+    @staticmethod
+    def _meta_line(meta: bytes, size: int) -> bytes:
+        # JSON ignores the trailing spaces
+        return meta.ljust(size - 1) + b"\n"
+
+    def put(self, url: str, body: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        path = self._path(url)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                meta = self._meta(url, etag, last_modified)
+                file.write(self._meta_line(meta, -(-(len(meta) + 1) // META_ALIGNMENT) * META_ALIGNMENT))
+                file.write(body)
+                size = file.tell()
+            try:
+                previous_size = os.path.getsize(path)
+            except FileNotFoundError:
+                previous_size = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self.stats.stored += 1
+            self._size += size - previous_size
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def refresh(self, entry: CacheEntry, etag: Optional[str], last_modified: Optional[str]) -> None:
+        """
+        Marks a revalidated entry fresh with the validators of the 304 response. The metadata line is rewritten
+        in place when the new one fits in it, a reader racing the write sees at worst a miss.
+        """
+        meta = self._meta(entry.url, etag, last_modified)
+        try:
+            with open(self._path(entry.url), "r+b") as file:
+                size = len(file.readline())
+                if len(meta) < size:
+                    file.seek(0)
+                    file.write(self._meta_line(meta, size))
+                    return
+        except FileNotFoundError:
+            pass
+        self.put(entry.url, entry.body, etag, last_modified)
+
+    def evict(self) -> None:
+        with self._lock:
+            entries = []
+            for entry in self._scan():
+                try:
+                    entries.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+                except FileNotFoundError:
+                    continue
+            self._size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if self._size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self._size -= size
+                self.stats.evicted += 1
+
+    def log_stats(self) -> None:
+        logger.info("Response cache stats: %s", self.stats.to_json())
+
+
+class CachedWeatherAPI:
+    """
+    get_forecasting through a ResponseCache: fresh entries skip the network, stale ones are revalidated
+    with If-None-Match / If-Modified-Since and reused on 304 Not Modified
+    """
+
+    def __init__(self, cache: ResponseCache, loads: Callable[[str], Any] = json.loads) -> None:
+        self.cache: ResponseCache = cache
+        self.loads: Callable[[str], Any] = loads
+
+    def get_body(self, url: str, timeout: int = 10) -> bytes:
+        entry = self.cache.get(url)
+        if entry is not None and self.cache.is_fresh(entry):
+            self.cache.count("hits")
+            return entry.body
+
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+
+        response = YandexWeatherAPI.get_raw(url, timeout, headers)
+        if response.status == HTTPStatus.NOT_MODIFIED and entry is not None:
+            self.cache.count("revalidated")
+            # a 304 carries the current validators, or omits the ones that did not change
+            self.cache.refresh(
+                entry,
+                response.headers.get("etag") or entry.etag,
+                response.headers.get("last-modified") or entry.last_modified,
+            )
+            return entry.body
+        if response.status != HTTPStatus.OK:
+            raise FetchError("Error during execute request. {}: {}".format(response.status, url), url, response.status)
+
+        self.cache.count("misses")
+        self.cache.put(url, response.body, response.headers.get("etag"), response.headers.get("last-modified"))
+        return response.body
+
+    def get_forecasting(self, url: str, timeout: int = 10):
+        """
+        :param url: url_to_json_data as str
+        :return: response data as json
+        """
+        return self.loads(self.get_body(url, timeout).decode("utf-8"))
@@ -1,8 +1,13 @@
+import http.client
 import json
 import logging
+import socket
 from http import HTTPStatus
-from urllib.request import urlopen
-from urllib.error import URLError
+from typing import Any, Callable, Dict, NamedTuple, Optional
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError, URLError
+
+from external.compact import decode_compact_forecast
 
 ERR_MESSAGE_TEMPLATE = "Unexpected error: {error}"
 
@@ -10,27 +15,72 @@ ERR_MESSAGE_TEMPLATE = "Unexpected error: {error}"
 logger = logging.getLogger(__name__)
 
 
+class FetchError(Exception):
+    """
+    A failed request. By default retryable for timeouts, transport failures (no status), 429 and 5xx responses:
+    the failures another attempt may not hit.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        url: str = "",
+        status: Optional[int] = None,
+        timeout: bool = False,
+        retryable: Optional[bool] = None,
+    ) -> None:
+        super().__init__(message)
+        self.url: str = url
+        self.status: Optional[int] = status
+        self.timeout: bool = timeout
+        if retryable is None:
+            retryable = status is None or status == HTTPStatus.TOO_MANY_REQUESTS or status >= 500
+        self.retryable: bool = retryable
+
+
+def _request_error(url: str, ex: Exception) -> FetchError:
+    """FetchError for an exception raised by urlopen or while reading the response"""
+    if isinstance(ex, HTTPError):
+        logger.error(ex)
+        return FetchError(ERR_MESSAGE_TEMPLATE.format(error=ex), url, status=ex.code)
+    if isinstance(ex, URLError):
+        logger.error(f"Request timed out: {ex}")
+        timeout = isinstance(ex.reason, socket.timeout)
+        return FetchError(ERR_MESSAGE_TEMPLATE.format(error="Request timed out"), url, timeout=timeout)
+    logger.error(ex)
+    if isinstance(ex, (OSError, http.client.HTTPException)):
+        return FetchError(ERR_MESSAGE_TEMPLATE.format(error=ex), url, timeout=isinstance(ex, socket.timeout))
+    # e.g. an undecodable body, the same on every attempt
+    return FetchError(ERR_MESSAGE_TEMPLATE.format(error=ex), url, retryable=False)
+
+
+class RawResponse(NamedTuple):
+    status: int
+    headers: Dict[str, str]  # lower-cased names
+    body: bytes
+
+
+def _lower_keys(headers) -> Dict[str, str]:
+    return {name.lower(): value for name, value in headers.items()}
+
+
 class YandexWeatherAPI:
     """
     Base class for requests
     """
 
-    def __do_req(url: str, timeout: int = 10) -> str:
+    def __do_req(url: str, timeout: int = 10, loads: Callable[[str], Any] = json.loads) -> str:
         """Base request method"""
         try:
             with urlopen(url, timeout=timeout) as response:
                 logger.info(f"Url to open {str(url)}")
                 resp_body = response.read().decode("utf-8")
-                data = json.loads(resp_body)
+                data = loads(resp_body)
             if response.status != HTTPStatus.OK:
-                raise Exception("Error during execute request. {}: {}".format(resp_body.status, resp_body.reason))
+                raise HTTPError(url, response.status, response.reason, response.headers, None)
             return data
-        except URLError as ex:
-            logger.error(f"Request timed out: {ex}")
-            raise Exception(ERR_MESSAGE_TEMPLATE.format(error="Request timed out"))
         except Exception as ex:
-            logger.error(ex)
-            raise Exception(ERR_MESSAGE_TEMPLATE.format(error=ex))
+            raise _request_error(url, ex)
 
     @staticmethod
     def get_forecasting(url: str, timeout: int = 10):
@@ -39,3 +89,36 @@ class YandexWeatherAPI:
         :return: response data as json
         """
         return YandexWeatherAPI.__do_req(url, timeout)
+
+    @staticmethod
+    def get_compact_forecasting(url: str, timeout: int = 10):
+        """
+        :param url: url_to_json_data as str
+        :return: forecasts with only date and hours.{hour,temp,condition}, see external.compact
+        """
+        return YandexWeatherAPI.__do_req(url, timeout, decode_compact_forecast)
+
+    @staticmethod
+    def get_decoded(url: str, timeout: int = 10, loads: Callable[[str], Any] = json.loads):
+        """
+        :param url: url_to_json_data as str
+        :param loads: decodes the response body text
+        """
+        return YandexWeatherAPI.__do_req(url, timeout, loads)
+
+    @staticmethod
+    def get_raw(url: str, timeout: int = 10, headers: Optional[Dict[str, str]] = None) -> RawResponse:
+        """
+        Undecoded request, 304 Not Modified is returned rather than raised
+        :param headers: extra request headers, e.g. If-None-Match
+        """
+        try:
+            with urlopen(Request(url, headers=headers or {}), timeout=timeout) as response:
+                logger.info("Url to open %s", url)
+                return RawResponse(response.status, _lower_keys(response.headers), response.read())
+        except HTTPError as ex:
+            if ex.code == HTTPStatus.NOT_MODIFIED:
+                return RawResponse(ex.code, _lower_keys(ex.headers), b"")
+            raise _request_error(url, ex)
+        except Exception as ex:
+            raise _request_error(url, ex)
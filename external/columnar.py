@@ -0,0 +1,171 @@
+"""
+Columnar form of forecast payloads: only the fields analyze_json reads, as flat NumPy arrays
+"""
+import logging
+from typing import Any, Dict, List, NamedTuple
+
+import numpy as np
+
+from external.analyzer import (
+    DEFAULT_OUTPUT_RESULT,
+    INPUT_CONDITION_PATH,
+    INPUT_DATE_PATH,
+    INPUT_DAY_HOURS_END,
+    INPUT_DAY_HOURS_START,
+    INPUT_DAY_SUITABLE_CONDITIONS,
+    INPUT_FORECAST_PATH,
+    INPUT_HOUR_PATH,
+    INPUT_HOURS_PATH,
+    INPUT_TEMPERATURE_PATH,
+    OUTPUT_DAYS_KEY,
+    DaySummary,
+    deep_getitem,
+)
+
+# see data/examples/conditions.txt
+CONDITIONS = (
+    "clear",
+    "partly-cloudy",
+    "cloudy",
+    "overcast",
+    "drizzle",
+    "light-rain",
+    "rain",
+    "moderate-rain",
+    "heavy-rain",
+    "continuous-heavy-rain",
+    "showers",
+    "wet-snow",
+    "light-snow",
+    "snow",
+    "snow-showers",
+    "hail",
+    "thunderstorm",
+    "thunderstorm-with-rain",
+    "thunderstorm-with-hail",
+)
+CONDITION_CODES = {condition: code for code, condition in enumerate(CONDITIONS)}
+UNKNOWN_CONDITION_CODE = -1
+SUITABLE_CONDITION_CODES = tuple(CONDITION_CODES[condition] for condition in INPUT_DAY_SUITABLE_CONDITIONS)
+
+DATE_DTYPE = "S10"
+HOUR_DTYPE = np.int16
+TEMPERATURE_DTYPE = np.int16
+CONDITION_DTYPE = np.int8
+OFFSET_DTYPE = np.int64
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastBatch(NamedTuple):
+    """
+    Forecasts of many cities. City i owns days city_offsets[i]:city_offsets[i + 1],
+    day j owns hours day_offsets[j]:day_offsets[j + 1]
+    """
+
+    cities: List[Any]
+    city_offsets: np.ndarray
+    dates: np.ndarray
+    day_offsets: np.ndarray
+    hours: np.ndarray
+    temperatures: np.ndarray
+    conditions: np.ndarray
+
+    @property
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self._fields[1:]}
+
+    @classmethod
+    def from_payloads(cls, payloads: Dict[Any, Any]) -> "ForecastBatch":
+        """Cities with an empty payload are left out, as are malformed ones, which are logged"""
+        cities, dates = [], []
+        city_offsets, day_offsets = [0], [0]
+        hours, temperatures, conditions = [], [], []
+        for city, data in payloads.items():
+            if not data:
+                continue
+            try:
+                city_dates, city_day_lengths, city_hours, city_temperatures, city_conditions = _extract(data)
+            except Exception as e:
+                logger.exception("Error processing %s: %s", city, e)
+                continue
+            for length in city_day_lengths:
+                day_offsets.append(day_offsets[-1] + length)
+            dates.extend(city_dates)
+            hours.extend(city_hours)
+            temperatures.extend(city_temperatures)
+            conditions.extend(city_conditions)
+            cities.append(city)
+            city_offsets.append(len(dates))
+        return cls(
+            cities=cities,
+            city_offsets=np.array(city_offsets, dtype=OFFSET_DTYPE),
+            dates=np.array(dates, dtype=DATE_DTYPE),
+            day_offsets=np.array(day_offsets, dtype=OFFSET_DTYPE),
+            hours=np.array(hours, dtype=HOUR_DTYPE),
+            temperatures=np.array(temperatures, dtype=TEMPERATURE_DTYPE),
+            conditions=np.array(conditions, dtype=CONDITION_DTYPE),
+        )
+
+
+def _extract(data: Any):
+    """
+    Dates, daytime hours per day, and the hour, temperature and condition code columns of one payload.
+    Like analyze_json, only daytime hours are read past their hour, so both fail on the same payloads.
+    """
+    dates, day_lengths, hours, temperatures, conditions = [], [], [], [], []
+    for day_data in deep_getitem(data, INPUT_FORECAST_PATH):
+        dates.append(day_data[INPUT_DATE_PATH])
+        day_hours = 0
+        for hour_data in day_data[INPUT_HOURS_PATH]:
+            hour = int(hour_data[INPUT_HOUR_PATH])
+            if hour < INPUT_DAY_HOURS_START or hour > INPUT_DAY_HOURS_END:
+                continue
+            temperatures.append(int(deep_getitem(hour_data, INPUT_TEMPERATURE_PATH)))
+            conditions.append(
+                CONDITION_CODES.get(deep_getitem(hour_data, INPUT_CONDITION_PATH), UNKNOWN_CONDITION_CODE)
+            )
+            hours.append(hour)
+            day_hours += 1
+        day_lengths.append(day_hours)
+    return dates, day_lengths, hours, temperatures, conditions
+
+
+def analyze_city(batch: ForecastBatch, city_index: int) -> Dict[str, Any]:
+    """Same result as analyze_json for the city's original payload"""
+    day_start, day_end = batch.city_offsets[[city_index, city_index + 1]].tolist()
+    day_offsets = batch.day_offsets[day_start:day_end + 1].tolist()
+    hour_start, hour_end = day_offsets[0], day_offsets[-1]
+    hours = batch.hours[hour_start:hour_end].tolist()
+    temperatures = batch.temperatures[hour_start:hour_end].tolist()
+    conditions = batch.conditions[hour_start:hour_end].tolist()
+
+    days = []
+    for day_index, date in enumerate(batch.dates[day_start:day_end].tolist()):
+        first_hour, last_hour = None, None
+        temp, hours_count, conds_count = 0, 0, 0
+        for i in range(day_offsets[day_index] - hour_start, day_offsets[day_index + 1] - hour_start):
+            hour = hours[i]
+            if hour < INPUT_DAY_HOURS_START or hour > INPUT_DAY_HOURS_END:
+                continue
+            first_hour = first_hour or hour
+            last_hour = hour
+            temp += temperatures[i]
+            if conditions[i] in SUITABLE_CONDITION_CODES:
+                conds_count += 1
+            hours_count += 1
+        temperature_avg = temp / hours_count if hours_count > 0 else None
+        days.append(
+            DaySummary(
+                date.decode("ascii"),
+                first_hour,
+                last_hour,
+                hours_count,
+                round(temperature_avg, 3) if temperature_avg else temperature_avg,
+                conds_count,
+            )
+        )
+
+    result = dict(DEFAULT_OUTPUT_RESULT)
+    result[OUTPUT_DAYS_KEY] = days
+    return result
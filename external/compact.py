@@ -0,0 +1,81 @@
+"""
+Decoding of forecast responses that keeps only forecasts[].date and forecasts[].hours[].{hour,temp,condition}
+"""
+import json
+import sys
+from typing import Any, List, Optional, Tuple
+
+from external.analyzer import (
+    INPUT_CONDITION_PATH,
+    INPUT_DATE_PATH,
+    INPUT_FORECAST_PATH,
+    INPUT_HOUR_PATH,
+    INPUT_HOURS_PATH,
+    INPUT_TEMPERATURE_PATH,
+)
+
+COMPACT_FIELDS = frozenset(
+    (
+        INPUT_FORECAST_PATH,
+        INPUT_DATE_PATH,
+        INPUT_HOURS_PATH,
+        INPUT_HOUR_PATH,
+        INPUT_TEMPERATURE_PATH,
+        INPUT_CONDITION_PATH,
+    )
+)
+
+
+class CompactHour:
+    """
+    One forecast hour, read by key like the original dict
+    """
+
+    __slots__ = (INPUT_HOUR_PATH, INPUT_TEMPERATURE_PATH, INPUT_CONDITION_PATH)
+
+    def __init__(self, hour: int, temp: Any, condition: Optional[str]) -> None:
+        self.hour = hour
+        self.temp = temp
+        self.condition = condition
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, CompactHour) and self.to_json() == other.to_json()
+
+    def __repr__(self) -> str:
+        return f"CompactHour(hour={self.hour!r}, temp={self.temp!r}, condition={self.condition!r})"
+
+    def to_json(self):
+        return {
+            INPUT_HOUR_PATH: self.hour,
+            INPUT_TEMPERATURE_PATH: self.temp,
+            INPUT_CONDITION_PATH: self.condition,
+        }
+
+
+def _compact_object(pairs: List[Tuple[str, Any]]) -> Any:
+    fields = {key: value for key, value in pairs if key in COMPACT_FIELDS}
+    if INPUT_HOUR_PATH in fields and INPUT_TEMPERATURE_PATH in fields:
+        condition = fields.get(INPUT_CONDITION_PATH)
+        return CompactHour(
+            int(fields[INPUT_HOUR_PATH]),
+            fields[INPUT_TEMPERATURE_PATH],
+            sys.intern(condition) if isinstance(condition, str) else condition,
+        )
+    if INPUT_FORECAST_PATH in fields or INPUT_HOURS_PATH in fields:
+        return fields
+    # objects the analyzer never reads are dropped as soon as they are parsed
+    return None
+
+
+_compact_decoder = json.JSONDecoder(object_pairs_hook=_compact_object)
+
+
+def decode_compact_forecast(body: str) -> Any:
+    """Compact equivalent of json.loads(body) that analyze_json and ForecastBatch accept"""
+    return _compact_decoder.decode(body)
@@ -0,0 +1,329 @@
+"""
+Retries with jittered exponential backoff, hedged requests and opt-in per-host circuit breakers around a fetch function
+"""
+import concurrent.futures
+import logging
+import random
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+from urllib.parse import urlsplit
+
+from external.client import FetchError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(FetchError):
+    def __init__(self, host: str, url: str = "") -> None:
+        super().__init__(f"Circuit open for host {host}", url, retryable=False)
+        self.host: str = host
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, FetchError):
+        return exc.retryable
+    asyncio = sys.modules.get("asyncio")
+    # asyncio is imported by AsyncResilientFetcher, not at startup
+    if asyncio is not None and isinstance(exc, asyncio.TimeoutError):
+        return True
+    return isinstance(exc, (OSError, concurrent.futures.TimeoutError))
+
+
+@dataclass
+class RetryPolicy:
+    """attempts counts the first call. Delays use full jitter: uniform between 0 and the exponential backoff"""
+
+    attempts: int = 3
+    base_delay: float = 0.1
+    max_delay: float = 2.0
+    multiplier: float = 2.0
+
+    def delay(self, retry: int, rng: random.Random) -> float:
+        """Sleep before the retry-th retry, counted from 1"""
+        return rng.uniform(0, min(self.max_delay, self.base_delay * self.multiplier ** (retry - 1)))
+
+
+class LatencyTracker:
+    """Latencies of the latest successful calls to a host, for the hedging threshold"""
+
+    def __init__(self, window: int = 256) -> None:
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, q: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    Opens when at least failure_ratio of the last window calls to a host failed (once min_calls were made):
+    calls then fail fast with CircuitOpenError. After reset_timeout a single probe call is let through
+    (half-open); its success closes the circuit, its failure opens it again.
+    Every city of CITIES is on the same host, so the fetchers only use breakers given a breaker_factory.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        failure_ratio: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        reset_timeout: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.host: str = host
+        self.failure_ratio: float = failure_ratio
+        self.min_calls: int = min_calls
+        self.reset_timeout: float = reset_timeout
+        self.clock: Callable[[], float] = clock
+        self.state: str = CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at: float = 0.0
+        self._probing: bool = False
+        self._lock = threading.Lock()
+
+    def before_call(self, url: str = "") -> None:
+        with self._lock:
+            if self.state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == OPEN or (self.state == HALF_OPEN and self._probing):
+                raise CircuitOpenError(self.host, url)
+            if self.state == HALF_OPEN:
+                self._probing = True
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._outcomes.clear()
+                self._probing = False
+                if success:
+                    self.state = CLOSED
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_ratio * len(self._outcomes):
+                self._open()
+
+    def _open(self) -> None:
+        logger.warning("Opening the circuit for host %s", self.host)
+        self.state = OPEN
+        self._opened_at = self.clock()
+        self._outcomes.clear()
+
+
+class _Resilience:
+    def __init__(
+        self,
+        retry: Optional[RetryPolicy] = None,
+        hedge_quantile: Optional[float] = None,
+        hedge_min_samples: int = 20,
+        breaker_factory: Optional[Callable[[str], CircuitBreaker]] = None,
+        attempt_timeout: Optional[float] = None,
+        count: Optional[Callable[[str], None]] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.retry: RetryPolicy = retry or RetryPolicy()
+        self.hedge_quantile: Optional[float] = hedge_quantile
+        self.hedge_min_samples: int = hedge_min_samples
+        self.breaker_factory: Optional[Callable[[str], CircuitBreaker]] = breaker_factory
+        self.attempt_timeout: Optional[float] = attempt_timeout
+        self.count: Callable[[str], None] = count or (lambda name: None)
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, LatencyTracker] = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _host_state(self, host: str):
+        with self._lock:
+            if host not in self.latencies:
+                self.latencies[host] = LatencyTracker()
+                if self.breaker_factory is not None:
+                    self.breakers[host] = self.breaker_factory(host)
+            return self.breakers.get(host), self.latencies[host]
+
+    def _before_call(self, host: str, url: str) -> None:
+        breaker, _ = self._host_state(host)
+        if breaker is None:
+            return
+        try:
+            breaker.before_call(url)
+        except CircuitOpenError:
+            self.count("fetch.circuit_open")
+            raise
+
+    def _after_call(self, host: str, started: float, exc: Optional[BaseException]) -> None:
+        breaker, latencies = self._host_state(host)
+        if exc is None:
+            latencies.add(time.perf_counter() - started)
+        if breaker is not None and (exc is None or is_retryable(exc)):
+            # a 404 or an undecodable body says nothing about the health of the host
+            breaker.record(exc is None)
+
+    def _hedge_delay(self, host: str) -> Optional[float]:
+        if not self.hedge_quantile:
+            return None
+        _, latencies = self._host_state(host)
+        return latencies.percentile(self.hedge_quantile, self.hedge_min_samples)
+
+    def _next_delay(self, url: str, retry: int, exc: BaseException) -> Optional[float]:
+        """Backoff before the next attempt, None when exc is final"""
+        if not is_retryable(exc) or retry >= self.retry.attempts:
+            return None
+        with self._lock:
+            delay = self.retry.delay(retry, self._rng)
+        self.count("fetch.retries")
+        logger.warning("Retrying %s in %.3fs after: %s", url, delay, exc)
+        return delay
+
+
+class ResilientFetcher(_Resilience):
+    """
+    Drop-in fetch_func(url, timeout) for DataFetchingTask and StreamingPipeline. Once a host has enough
+    successful calls, an attempt slower than their hedge_quantile gets a duplicate request, and the first
+    success wins; the slower request is left to finish in the background.
+    """
+
+    def __init__(self, fetch_func: Callable[[str, int], Any], max_workers: int = 32, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.fetch_func: Callable[[str, int], Any] = fetch_func
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def _call(self, host: str, url: str, timeout: float) -> Any:
+        started = time.perf_counter()
+        try:
+            result = self.fetch_func(url, timeout)
+        except BaseException as exc:
+            self._after_call(host, started, exc)
+            raise
+        self._after_call(host, started, None)
+        return result
+
+    def _attempt(self, url: str, timeout: float) -> Any:
+        host = urlsplit(url).netloc
+        self._before_call(host, url)
+        hedge_delay = self._hedge_delay(host)
+        if hedge_delay is None:
+            return self._call(host, url, timeout)
+
+        primary = self.executor.submit(self._call, host, url, timeout)
+        pending = {primary}
+        done, _ = concurrent.futures.wait(pending, timeout=hedge_delay)
+        if not done:
+            self.count("fetch.hedges")
+            pending.add(self.executor.submit(self._call, host, url, timeout))
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self.count("fetch.hedge_wins")
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def __call__(self, url: str, timeout: int = 10) -> Any:
+        timeout = self.attempt_timeout or timeout
+        retry = 0
+        while True:
+            try:
+                return self._attempt(url, timeout)
+            except Exception as exc:
+                retry += 1
+                delay = self._next_delay(url, retry, exc)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+class AsyncResilientFetcher(_Resilience):
+    """
+    ResilientFetcher for AsyncDataFetchingTask: the slower of two hedged requests is cancelled.
+    As in ResilientFetcher, an attempt gets the whole timeout unless attempt_timeout is given. The task's own
+    per-city timeout is the deadline of all attempts together, a shorter attempt_timeout leaves time for a retry.
+    """
+
+    def __init__(self, fetch_func: Callable[[str, int], Awaitable[Any]], **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.fetch_func: Callable[[str, int], Awaitable[Any]] = fetch_func
+
+    async def _call(self, host: str, url: str, timeout: float) -> Any:
+        import asyncio
+
+        started = time.perf_counter()
+        try:
+            result = await self.fetch_func(url, timeout)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as exc:
+            self._after_call(host, started, exc)
+            raise
+        self._after_call(host, started, None)
+        return result
+
+    async def _attempt(self, url: str, timeout: float) -> Any:
+        import asyncio
+
+        host = urlsplit(url).netloc
+        self._before_call(host, url)
+        hedge_delay = self._hedge_delay(host)
+        if hedge_delay is None:
+            return await self._call(host, url, timeout)
+
+        primary = asyncio.ensure_future(self._call(host, url, timeout))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+            if not done:
+                self.count("fetch.hedges")
+                pending.add(asyncio.ensure_future(self._call(host, url, timeout)))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.count("fetch.hedge_wins")
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def __call__(self, url: str, timeout: int = 10) -> Any:
+        import asyncio
+
+        timeout = self.attempt_timeout or timeout
+        retry = 0
+        while True:
+            try:
+                return await self._attempt(url, timeout)
+            except Exception as exc:
+                retry += 1
+                delay = self._next_delay(url, retry, exc)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
@@ -0,0 +1,84 @@
+"""
+analyze_json over many cities at once: masked reductions on the flat arrays of a ForecastBatch
+"""
+import logging
+from typing import Any, Dict
+
+import numpy as np
+
+from external.analyzer import (
+    DEFAULT_OUTPUT_RESULT,
+    INPUT_DAY_HOURS_END,
+    INPUT_DAY_HOURS_START,
+    OUTPUT_DAYS_KEY,
+    DaySummary,
+)
+from external.columnar import SUITABLE_CONDITION_CODES, ForecastBatch
+
+
+def _first_in_group(values: np.ndarray, group_ids: np.ndarray, groups: int, take_last: bool = False) -> np.ndarray:
+    """Value of the first (or last) element of every group, groups are sorted ids; -1 where a group is empty"""
+    result = np.full(groups, -1, dtype=np.int64)
+    if len(group_ids):
+        # the ids are sorted, a group starts where the id changes: no sort needed to find the edges
+        starts = np.flatnonzero(group_ids[1:] != group_ids[:-1]) + 1
+        if take_last:
+            positions = np.append(starts - 1, len(group_ids) - 1)
+        else:
+            positions = np.insert(starts, 0, 0)
+        result[group_ids[positions]] = values[positions]
+    return result
+
+
+def analyze_batch(batch: ForecastBatch) -> Dict[Any, Dict[str, Any]]:
+    """Same result as analyze_json for every city of the batch"""
+    days_total = len(batch.dates)
+    day_ids = np.repeat(np.arange(days_total), np.diff(batch.day_offsets))
+
+    in_day = (batch.hours >= INPUT_DAY_HOURS_START) & (batch.hours <= INPUT_DAY_HOURS_END)
+    day_hours = batch.hours[in_day]
+    day_hour_ids = day_ids[in_day]
+
+    hours_count = np.bincount(day_hour_ids, minlength=days_total)
+    temperature_sum = np.bincount(day_hour_ids, weights=batch.temperatures[in_day], minlength=days_total)
+    suitable = in_day & np.isin(batch.conditions, SUITABLE_CONDITION_CODES)
+    relevant_cond_hours = np.bincount(day_ids[suitable], minlength=days_total)
+
+    # DayInfo keeps the first truthy hour (`hour_start or h_hour`), falling back to 0 when every hour is 0
+    nonzero = day_hours != 0
+    hours_start = _first_in_group(day_hours[nonzero], day_hour_ids[nonzero], days_total)
+    hours_start = np.where((hours_start < 0) & (hours_count > 0), 0, hours_start)
+    hours_end = _first_in_group(day_hours, day_hour_ids, days_total, take_last=True)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        temperature_avg = temperature_sum / hours_count
+
+    days = [
+        DaySummary(date, start, end, count, round(avg, 3) if avg else avg, cond_hours)
+        if count
+        else DaySummary(date, None, None, count, None, cond_hours)
+        for date, start, end, count, avg, cond_hours in zip(
+            batch.dates.astype(str).tolist(),
+            hours_start.tolist(),
+            hours_end.tolist(),
+            hours_count.tolist(),
+            temperature_avg.tolist(),
+            relevant_cond_hours.tolist(),
+        )
+    ]
+
+    results = {}
+    city_offsets = batch.city_offsets.tolist()
+    for city_index, city in enumerate(batch.cities):
+        result = dict(DEFAULT_OUTPUT_RESULT)
+        result[OUTPUT_DAYS_KEY] = days[city_offsets[city_index]:city_offsets[city_index + 1]]
+        results[city] = result
+    return results
+
+
+def analyze_json_vectorized(data):
+    """Drop-in replacement of analyze_json for a single payload"""
+    if not data:
+        logging.warning("Input data is empty...")
+        return {}
+    return analyze_batch(ForecastBatch.from_payloads({None: data}))[None]
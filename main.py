@@ -1,42 +1,436 @@
+import argparse
 import logging.config
 import multiprocessing as mp
 
+# modules only some modes need (HTTP clients, asyncio, pydantic, NumPy) are imported where they are used,
+# which keeps startup short for small runs and for workers started with spawn
+from config.log_queue import PAYLOAD, start_queue_logging
 from config.logger import LOGGING
+from src.instrumentation import Instrumentation
 from src.utils import CITIES
-from external.client import YandexWeatherAPI
 from external.analyzer import analyze_json
-from src.tasks import DataFetchingTask, DataCalculationTask, DataAnalyzingTask, DataAggregationTask
+from src.tasks import (
+    OUTPUT_CSV,
+    OUTPUT_NPY,
+    OUTPUT_PARQUET,
+    TRANSPORT_PICKLE,
+    TRANSPORT_SHARED_MEMORY,
+    AsyncDataFetchingTask,
+    DataFetchingTask,
+    DataCalculationTask,
+    DataAnalyzingTask,
+    DataAggregationTask,
+    WorkerPool,
+)
 
 
-logging.config.dictConfig(LOGGING)
 logger = logging.getLogger(__name__)
 
 
+def configure_logging():
+    # not on import: children started with spawn or forkserver import this module as __mp_main__, and would
+    # reopen app.log over the parent's. They log through the queue handler of config/log_queue.py instead.
+    logging.config.dictConfig(LOGGING)
+
+
 def check_python_version():
     from src.utils import check_python_version
 
     check_python_version()
 
 
-if __name__ == "__main__":
-    check_python_version()
-    mp.set_start_method("fork")  # could be removed if not used on mac/m1
+def parse_args():
+    parser = argparse.ArgumentParser(description="Weather analysis tool")
+    parser.add_argument("--fetch-mode", choices=("threads", "async"), default="threads")
+    parser.add_argument(
+        "--pipeline",
+        choices=("staged", "streaming"),
+        default="staged",
+        help="streaming sends every city to the workers as soon as it is fetched, threads fetch mode only",
+    )
+    parser.add_argument("--max-concurrency", type=int, default=5)
+    parser.add_argument("--timeout", type=int, default=10)
+    parser.add_argument("--total-timeout", type=float, default=None)
+    parser.add_argument(
+        "--compact", action="store_true", help="keep only the forecast fields the analyzer reads in fetched data"
+    )
+    parser.add_argument("--cache-dir", default=None, help="on-disk response cache, threads fetch mode only")
+    parser.add_argument("--cache-ttl", type=float, default=60 * 60)
+    parser.add_argument("--cache-max-bytes", type=int, default=256 * 1024 * 1024)
+    parser.add_argument("--result-store", default=None, help="SQLite file with memoized per-city analysis results")
+    parser.add_argument(
+        "--result-store-max-bytes",
+        type=int,
+        default=256 * 1024 * 1024,
+        help="least recently used results are evicted above this size",
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--start-method", choices=mp.get_all_start_methods(), default="fork")
+    parser.add_argument("--transport", choices=(TRANSPORT_PICKLE, TRANSPORT_SHARED_MEMORY), default=TRANSPORT_PICKLE)
+    parser.add_argument("--output-format", choices=(OUTPUT_CSV, OUTPUT_NPY, OUTPUT_PARQUET), default=OUTPUT_CSV)
+    parser.add_argument("--output", default=None, help="output file, output.<format> by default")
+    parser.add_argument(
+        "--logging",
+        choices=("queue", "direct"),
+        default="queue",
+        help="queue: worker records go through a queue to a single writer thread in this process",
+    )
+    parser.add_argument("--retries", type=int, default=2, help="retries of a failed fetch, with jittered backoff")
+    parser.add_argument(
+        "--hedge-quantile",
+        type=float,
+        default=None,
+        help="send a duplicate request once a fetch is slower than this quantile of its host, e.g. 0.95",
+    )
+    parser.add_argument(
+        "--circuit-breaker",
+        action="store_true",
+        help="fail fast on hosts that keep failing; every city of CITIES is on the same host",
+    )
+    parser.add_argument(
+        "--attempt-timeout",
+        type=float,
+        default=None,
+        help="timeout of a single fetch attempt, --timeout by default; --timeout still bounds all attempts of a city",
+    )
+    parser.add_argument("--shards", type=int, default=1, help="split the cities over N nodes by consistent hash")
+    parser.add_argument(
+        "--shard-role",
+        choices=("local", "node", "coordinator"),
+        default="local",
+        help="local: run every node as a process here; node: run --shard-index only; "
+        "coordinator: merge the results of nodes run elsewhere",
+    )
+    parser.add_argument("--shard-index", type=int, default=None)
+    parser.add_argument("--shard-dir", default=None, help="directory shared by the nodes and the coordinator")
+    parser.add_argument("--shard-timeout", type=float, default=60 * 60, help="coordinator wait for node results")
+    parser.add_argument(
+        "--shard-run-id",
+        default=None,
+        help="id shared by the nodes and the coordinator of one run, results of other runs are ignored",
+    )
+    parser.add_argument(
+        "--state",
+        default=None,
+        help="SQLite file of an incremental run: only new, stale or changed cities are fetched, analyzed and rewritten",
+    )
+    parser.add_argument(
+        "--refresh-after", type=float, default=0.0, help="with --state, seconds before a city is fetched again"
+    )
+    parser.add_argument("--report", default=None, help="JSON file with stage timings, latencies and resource use")
+    parser.add_argument("--profile-dir", default=None, help="directory for a cProfile dump of every stage")
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = f"output.{args.output_format}"
+    if args.cache_dir and args.fetch_mode != "threads":
+        parser.error("--cache-dir is only supported with --fetch-mode threads")
+    if args.pipeline == "streaming" and args.fetch_mode != "threads":
+        parser.error("--pipeline streaming is only supported with --fetch-mode threads")
+    if args.pipeline == "streaming" and args.result_store:
+        parser.error("--result-store is only supported with --pipeline staged")
+    if args.pipeline == "streaming" and args.transport == TRANSPORT_SHARED_MEMORY:
+        parser.error("--transport shm is only supported with --pipeline staged")
+    check_shard_args(parser, args)
+    if args.state and (args.pipeline == "streaming" or args.shards > 1 or args.shard_role != "local"):
+        parser.error("--state is only supported with --pipeline staged on a single node")
+    if args.state and args.result_store:
+        parser.error("--state already keeps the results of every city, it is not supported with --result-store")
+    return args
+
+
+def check_shard_args(parser, args):
+    if args.shards > 1 and args.result_store:
+        parser.error("--result-store is not supported with --shards")
+    if args.shard_role != "local" and not args.shard_dir:
+        parser.error(f"--shard-role {args.shard_role} requires --shard-dir")
+    if args.shard_role == "node" and (args.shard_index is None or not 0 <= args.shard_index < args.shards):
+        parser.error("--shard-role node requires a --shard-index below --shards")
+    if args.shard_role != "local" and not args.shard_run_id:
+        parser.error(f"--shard-role {args.shard_role} requires --shard-run-id")
+
+
+def with_resilience(args, fetch_func, fetcher_class, instrumentation=None):
+    if not args.retries and not args.hedge_quantile and not args.circuit_breaker:
+        return fetch_func
+    from external.resilience import CircuitBreaker, RetryPolicy
+
+    return fetcher_class(
+        fetch_func,
+        retry=RetryPolicy(attempts=args.retries + 1),
+        hedge_quantile=args.hedge_quantile,
+        breaker_factory=CircuitBreaker if args.circuit_breaker else None,
+        attempt_timeout=args.attempt_timeout,
+        count=instrumentation.count if instrumentation is not None else None,
+    )
+
+
+def build_loads(args, fingerprint=False):
+    """Decoding of response bodies; with fingerprint, it returns (hash of the body, payload) pairs"""
+    import json
+
+    from external.compact import decode_compact_forecast
+
+    loads = decode_compact_forecast if args.compact else json.loads
+    if not fingerprint:
+        return loads
+    import functools
+
+    from src.result_store import loads_with_fingerprint
+
+    return functools.partial(loads_with_fingerprint, loads=loads)
+
+
+def build_fetch_func(args, cache=None, instrumentation=None, fingerprint=False):
+    import functools
+
+    from external.resilience import ResilientFetcher
+
+    if cache is not None:
+        from external.cache import CachedWeatherAPI
+
+        fetch_func = CachedWeatherAPI(cache, build_loads(args, fingerprint)).get_forecasting
+    else:
+        from external.client import YandexWeatherAPI
+
+        fetch_func = functools.partial(YandexWeatherAPI.get_decoded, loads=build_loads(args, fingerprint))
+    return with_resilience(args, fetch_func, ResilientFetcher, instrumentation)
+
+
+def build_fetching_task(args, cache=None, instrumentation=None, cities=CITIES, fingerprint=False):
+    if args.fetch_mode == "async":
+        from external.async_client import AsyncYandexWeatherAPI
+        from external.resilience import AsyncResilientFetcher
+
+        api = AsyncYandexWeatherAPI(
+            max_connections_per_host=args.max_concurrency, loads=build_loads(args, fingerprint)
+        )
+        return AsyncDataFetchingTask(
+            cities,
+            with_resilience(args, api.get_forecasting, AsyncResilientFetcher, instrumentation),
+            max_concurrency=args.max_concurrency,
+            timeout=args.timeout,
+            total_timeout=args.total_timeout,
+            on_close=api.close,
+            instrumentation=instrumentation,
+        )
+    fetch_func = build_fetch_func(args, cache, instrumentation, fingerprint)
+    return DataFetchingTask(
+        cities,
+        fetch_func,
+        max_workers=args.max_concurrency,
+        timeout=args.timeout,
+        instrumentation=instrumentation,
+        # the hedging threads of a ResilientFetcher
+        on_close=getattr(fetch_func, "close", None),
+    )
+
+
+def build_cache(args):
+    if not args.cache_dir:
+        return None
+    from external.cache import ResponseCache
+
+    return ResponseCache(args.cache_dir, args.cache_ttl, args.cache_max_bytes)
+
+
+def run_staged(args, pool, cache, result_store, instrumentation, cities=CITIES):
     logger.info("Fetching data ...")
-    data_fetching_app_instacnce = DataFetchingTask(CITIES, YandexWeatherAPI.get_forecasting)
-    fetched_data = data_fetching_app_instacnce.fetch_all()
-    logger.info("Fetched data = %s", fetched_data)
+    with instrumentation.stage("fetch"):
+        # results are stored under the hash of the response body they come from
+        data_fetching_app_instacnce = build_fetching_task(
+            args, cache, instrumentation, cities, fingerprint=result_store is not None
+        )
+        fetched_data = data_fetching_app_instacnce.fetch_all()
+    fingerprints = None
+    if result_store is not None:
+        fingerprints = {city: fingerprint for city, (fingerprint, _) in fetched_data.items()}
+        fetched_data = {city: data for city, (_, data) in fetched_data.items()}
+    logger.debug("Fetched data = %s", fetched_data, extra=PAYLOAD)
 
     logger.info("Weather parameters calculation ...")
-    data_calculation_instance = DataCalculationTask(fetched_data, analyze_json)
-    calculated_data = data_calculation_instance.execute()
-    logger.info("Calculated data = %s", calculated_data)
+    with instrumentation.stage("calculation"):
+        data_calculation_instance = DataCalculationTask(
+            fetched_data,
+            analyze_json,
+            pool=pool,
+            transport=args.transport,
+            result_store=result_store,
+            fingerprints=fingerprints,
+        )
+        calculated_data = data_calculation_instance.execute()
+    instrumentation.record_ipc(data_calculation_instance.ipc_stats)
+    logger.debug("Calculated data = %s", calculated_data, extra=PAYLOAD)
 
     logger.info("Analyzing and ranking ...")
-    city_rank_calc_isntance = DataAnalyzingTask(calculated_data)
-    analyezed_data, most_favorable_cities = city_rank_calc_isntance.execute_and_rank()
+    with instrumentation.stage("analysis"):
+        city_rank_calc_isntance = DataAnalyzingTask(
+            calculated_data,
+            pool=pool,
+            result_store=result_store,
+            # a calculated result is identified by its own store key
+            fingerprints=data_calculation_instance.store_keys,
+        )
+        analyezed_data, most_favorable_cities = city_rank_calc_isntance.execute_and_rank()
+    instrumentation.record_ipc(city_rank_calc_isntance.ipc_stats)
     logger.info("Analyaed data = %s, Ranked data = %s", analyezed_data, most_favorable_cities)
+    return calculated_data, analyezed_data, most_favorable_cities
+
+
+def run_streaming(args, pool, cache, instrumentation, cities=CITIES):
+    from src.pipeline import StreamingPipeline
+
+    logger.info("Fetching, calculating and analyzing data as it arrives ...")
+    fetch_func = build_fetch_func(args, cache, instrumentation)
+    pipeline = StreamingPipeline(
+        cities,
+        fetch_func,
+        pool,
+        max_workers=args.max_concurrency,
+        timeout=args.timeout,
+        instrumentation=instrumentation,
+    )
+    try:
+        with instrumentation.stage("streaming"):
+            calculated_data, analyezed_data, most_favorable_cities = pipeline.run()
+    finally:
+        if hasattr(fetch_func, "close"):
+            fetch_func.close()
+    logger.info("Analyaed data = %s, Ranked data = %s", analyezed_data, most_favorable_cities)
+    return calculated_data, analyezed_data, most_favorable_cities
+
+
+def run_shard(args, cities, pool, instrumentation):
+    """A node's share of the run, on the node's own pool"""
+    cache = build_cache(args)
+    if args.pipeline == "streaming":
+        results = run_streaming(args, pool, cache, instrumentation, cities)
+    else:
+        results = run_staged(args, pool, cache, None, instrumentation, cities)
+    if cache is not None:
+        cache.log_stats()
+    return results
+
+
+def build_shard_coordinator(args, shard_dir, log_queue=None, instrumentation=None):
+    import functools
+
+    from src.sharding import ShardCoordinator
 
-    logger.info("Writing results to the file ...")
-    DataAggregationTask.write_aggregated_data_to_csv(
-        calculated_data, analyezed_data, most_favorable_cities, "output.csv"
+    return ShardCoordinator(
+        CITIES,
+        functools.partial(run_shard, args),
+        shard_dir,
+        shards=args.shards,
+        workers_per_node=args.workers,
+        start_method=args.start_method,
+        log_queue=log_queue,
+        instrumentation=instrumentation,
+        run_id=args.shard_run_id,
     )
+
+
+def run_sharded(args, log_queue, instrumentation):
+    import tempfile
+
+    from src.sharding import ShardsMissingError
+
+    logger.info("Running %d shards ...", args.shards)
+    with tempfile.TemporaryDirectory(prefix="shards-") as temp_dir:
+        coordinator = build_shard_coordinator(args, args.shard_dir or temp_dir, log_queue, instrumentation)
+        try:
+            with instrumentation.stage("sharded"):
+                if args.shard_role == "coordinator":
+                    results = coordinator.merge(coordinator.collect(args.shard_timeout, require_all=True))
+                else:
+                    results = coordinator.run()
+        except ShardsMissingError as exc:
+            # a partial ranking must not replace the output of a complete run
+            logger.error("%s, the output is not written", exc)
+            raise SystemExit(1)
+    logger.info("Analyaed data = %s, Ranked data = %s", results[1], results[2])
+    return results
+
+
+def run_local(args, log_queue, instrumentation):
+    cache = build_cache(args)
+    result_store = None
+    if args.result_store:
+        from src.result_store import ResultStore
+
+        result_store = ResultStore(args.result_store, args.result_store_max_bytes)
+    # workers are started once, before fetching grows the parent, and shared by both calculation stages
+    with WorkerPool(num_workers=args.workers, log_queue=log_queue) as pool:
+        if args.pipeline == "streaming":
+            results = run_streaming(args, pool, cache, instrumentation)
+        else:
+            results = run_staged(args, pool, cache, result_store, instrumentation)
+    if cache is not None:
+        cache.log_stats()
+    if result_store is not None:
+        result_store.close()
+    return results
+
+
+def run_delta(args, log_queue, instrumentation):
+    """Incremental run, writes the output itself"""
+    from src.run_state import DeltaRun, OutputWriteError, RunState
+
+    cache = build_cache(args)
+
+    def fetch(cities):
+        return build_fetching_task(args, cache, instrumentation, cities).fetch_all()
+
+    with RunState(args.state) as state, WorkerPool(num_workers=args.workers, log_queue=log_queue) as pool:
+        delta_run = DeltaRun(
+            CITIES,
+            state,
+            fetch,
+            pool,
+            args.output,
+            args.output_format,
+            refresh_after=args.refresh_after,
+            transport=args.transport,
+            instrumentation=instrumentation,
+        )
+        try:
+            most_favorable_cities = delta_run.run()
+        except OutputWriteError as exc:
+            logger.error("%s, the state is left as it was", exc)
+            raise SystemExit(1)
+    if cache is not None:
+        cache.log_stats()
+    logger.info("Ranked data = %s", most_favorable_cities)
+    return most_favorable_cities
+
+
+if __name__ == "__main__":
+    configure_logging()
+    check_python_version()
+    args = parse_args()
+    mp.set_start_method(args.start_method)  # fork could be replaced on mac/m1
+    log_listener = start_queue_logging() if args.logging == "queue" else None
+    instrumentation = Instrumentation(args.profile_dir)
+    try:
+        log_queue = log_listener.queue if log_listener is not None else None
+        if args.shard_role == "node":
+            # the result is left in --shard-dir for the coordinator
+            result = build_shard_coordinator(args, args.shard_dir, log_queue).node(args.shard_index).run()
+            instrumentation.merge(result.instrumentation)
+        elif args.state:
+            run_delta(args, log_queue, instrumentation)
+        else:
+            if args.shards > 1 or args.shard_role == "coordinator":
+                calculated_data, analyezed_data, most_favorable_cities = run_sharded(args, log_queue, instrumentation)
+            else:
+                calculated_data, analyezed_data, most_favorable_cities = run_local(args, log_queue, instrumentation)
+
+            logger.info("Writing results to the file ...")
+            with instrumentation.stage("aggregation"):
+                DataAggregationTask.write_aggregated_data(
+                    calculated_data, analyezed_data, most_favorable_cities, args.output, args.output_format
+                )
+        if args.report:
+            instrumentation.write_report(args.report)
+    finally:
+        if log_listener is not None:
+            log_listener.stop()
@@ -0,0 +1,207 @@
+import concurrent.futures
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+# upper bounds in seconds, the last bucket takes everything slower
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+def peak_rss_kb(who: int = resource.RUSAGE_SELF) -> int:
+    peak = resource.getrusage(who).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def is_timeout(exc: BaseException) -> bool:
+    timeouts = (TimeoutError, concurrent.futures.TimeoutError)
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is not None:
+        # a distinct class before Python 3.11, only raised once asyncio was imported
+        timeouts += (asyncio.TimeoutError,)
+    if getattr(exc, "timeout", False) is True:
+        # external.client.FetchError
+        return True
+    # urllib wraps socket timeouts in URLError
+    return isinstance(exc, timeouts) or isinstance(getattr(exc, "reason", None), timeouts)
+
+
+@dataclass
+class LatencyHistogram:
+    """Fixed-bucket latency histogram, cheap to update and to merge across processes"""
+
+    counts: List[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+    count: int = 0
+    total: float = 0.0
+    min: Optional[float] = None
+    max: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile, capped by the largest observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": {str(bound): count for bound, count in zip(LATENCY_BUCKETS, self.counts) if count},
+        }
+
+    def __repr__(self) -> str:
+        return f"LatencyHistogram(count={self.count}, p50={self.quantile(0.5)}, max={self.max})"
+
+
+@dataclass
+class StageTiming:
+    """
+    ru_maxrss is a high-water mark of the whole process: process_peak_rss_kb is its value when the stage ended,
+    including what earlier stages reached, peak_rss_growth_kb how much the stage itself raised it
+    """
+
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    process_peak_rss_kb: int = 0
+    peak_rss_growth_kb: int = 0
+
+    def to_json(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class Instrumentation:
+    """
+    Timings, latency histograms and counters of one run, written as a JSON report.
+    With a profile_dir, every stage also runs under cProfile and leaves <stage>.prof there, for pstats or snakeviz.
+    cProfile sees the calling thread only; use py-spy on the process for fetch threads and workers.
+    """
+
+    def __init__(self, profile_dir: Optional[str] = None) -> None:
+        self.profile_dir: Optional[str] = profile_dir
+        self.stages: Dict[str, StageTiming] = {}
+        self.latencies: Dict[str, LatencyHistogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.ipc: Dict[str, Dict[str, Any]] = {}
+        self.started_at: float = time.time()
+        self._lock = threading.Lock()
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        profiler = cProfile.Profile() if self.profile_dir else None
+        wall_started, cpu_started, peak_started = time.perf_counter(), time.process_time(), peak_rss_kb()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+            peak = peak_rss_kb()
+            timing = StageTiming(
+                time.perf_counter() - wall_started, time.process_time() - cpu_started, peak, peak - peak_started
+            )
+            with self._lock:
+                self.stages[name] = timing
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.latencies.setdefault(name, LatencyHistogram()).observe(seconds)
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_ipc(self, stats: Any) -> None:
+        """IPCStats of a stage run on the worker pool"""
+        with self._lock:
+            self.ipc[stats.stage] = stats.to_json()
+
+    def merge(self, other: "Instrumentation", prefix: str = "") -> None:
+        """Adds up counters and latencies of another process' run, its stages and IPC go under prefix"""
+        with self._lock:
+            for name, value in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, histogram in other.latencies.items():
+                self.latencies.setdefault(name, LatencyHistogram()).merge(histogram)
+            self.stages.update((prefix + name, timing) for name, timing in other.stages.items())
+            self.ipc.update((prefix + name, stats) for name, stats in other.ipc.items())
+
+    def to_state(self) -> Dict[str, Any]:
+        """What merge reads, as plain JSON types, for another process to rebuild with from_state"""
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "stages": {name: asdict(timing) for name, timing in self.stages.items()},
+                "latencies": {name: asdict(histogram) for name, histogram in self.latencies.items()},
+                "counters": dict(self.counters),
+                "ipc": dict(self.ipc),
+            }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "Instrumentation":
+        instrumentation = cls()
+        instrumentation.started_at = state["started_at"]
+        instrumentation.stages = {name: StageTiming(**timing) for name, timing in state["stages"].items()}
+        instrumentation.latencies = {
+            name: LatencyHistogram(**histogram) for name, histogram in state["latencies"].items()
+        }
+        instrumentation.counters = dict(state["counters"])
+        instrumentation.ipc = dict(state["ipc"])
+        return instrumentation
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "wall_time": time.time() - self.started_at,
+                "peak_rss_kb": peak_rss_kb(),
+                "peak_rss_children_kb": peak_rss_kb(resource.RUSAGE_CHILDREN),
+                "stages": {name: timing.to_json() for name, timing in self.stages.items()},
+                "latencies": {name: histogram.to_json() for name, histogram in self.latencies.items()},
+                "counters": dict(self.counters),
+                "ipc": dict(self.ipc),
+            }
+
+    def write_report(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.report(), file, indent=2)
@@ -0,0 +1,121 @@
+import concurrent.futures
+import functools
+import logging
+import queue
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from external.analyzer import analyze_json
+from src.instrumentation import Instrumentation, is_timeout
+from src.ranking import CityRanking
+from src.tasks import DataAnalyzingTask, IPCStats, WorkerPool
+
+logger = logging.getLogger(__name__)
+
+_FETCHES_DONE = object()
+STREAM_DRAIN_INTERVAL = 0.1
+
+
+def calculate_and_summarize(
+    data: Any, calc_func: Callable[[Any], Any] = analyze_json
+) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Calculation and per-city aggregation of one payload in a single worker round trip"""
+    calculated = calc_func(data)
+    if not calculated:
+        return None
+    return calculated, DataAnalyzingTask.calculate_city_data(calculated)
+
+
+class StreamingPipeline:
+    """
+    Fetch, calculation and per-city aggregation without barriers between them: every city goes to the workers
+    as soon as its fetch completes. The queue between fetching and the workers holds at most queue_size payloads,
+    so fetching slows down when the workers fall behind. The ranking is updated with every city as it arrives.
+    """
+
+    def __init__(
+        self,
+        url_dict: Dict[str, str],
+        fetch_func: Callable[[str, int], Any],
+        pool: WorkerPool,
+        calc_func: Callable[[Any], Any] = analyze_json,
+        max_workers: int = 5,
+        timeout: int = 10,
+        queue_size: int = 64,
+        max_in_flight: Optional[int] = None,
+        instrumentation: Optional[Instrumentation] = None,
+    ) -> None:
+        self.url_dict: Dict[str, str] = url_dict
+        self.fetch_func: Callable[[str, int], Any] = fetch_func
+        self.pool: WorkerPool = pool
+        self.calc_func: Callable[[Any], Any] = calc_func
+        self.max_workers: int = max_workers
+        self.timeout: int = timeout
+        self.queue_size: int = queue_size
+        self.max_in_flight: Optional[int] = max_in_flight
+        self.instrumentation: Optional[Instrumentation] = instrumentation
+        self.ipc_stats: IPCStats = IPCStats(stage=type(self).__name__)
+        self.ranking: CityRanking = CityRanking()
+
+    def _fetch_one(self, fetched: queue.Queue, city: str, url: str) -> None:
+        started = time.perf_counter()
+        try:
+            data = self.fetch_func(url, self.timeout)
+        except Exception as exc:
+            if self.instrumentation is not None:
+                self.instrumentation.count("fetch.timeouts" if is_timeout(exc) else "fetch.errors")
+            logger.error("Fetching data for city=%s generated an exception: %s", city, exc)
+            return
+        finally:
+            if self.instrumentation is not None:
+                self.instrumentation.observe("fetch", time.perf_counter() - started)
+        # blocks the fetching thread while the queue is full
+        fetched.put((city, data))
+
+    def _fetch_all(self, fetched: queue.Queue) -> None:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for city, url in self.url_dict.items():
+                executor.submit(self._fetch_one, fetched, city, url)
+        fetched.put(_FETCHES_DONE)
+
+    @staticmethod
+    def _drain(fetched: queue.Queue) -> Iterator[Tuple[str, Any]]:
+        while True:
+            item = fetched.get()
+            if item is _FETCHES_DONE:
+                return
+            yield item
+
+    def run(self) -> Tuple[Dict[str, Any], Dict[str, Any], List[str]]:
+        """Returns calculated data, per-city aggregates and the ranking, like the staged pipeline"""
+        fetched: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        self.ipc_stats = IPCStats(stage=type(self).__name__)
+        self.ranking = CityRanking()
+        fetcher = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        fetching = fetcher.submit(self._fetch_all, fetched)
+
+        calculated_data: Dict[str, Any] = {}
+        analyzed_data: Dict[str, Any] = {}
+        try:
+            func = functools.partial(calculate_and_summarize, calc_func=self.calc_func)
+            results = self.pool.run_stream(func, self._drain(fetched), self.max_in_flight, self.ipc_stats)
+            for city, result in results:
+                if not result or not result[1]:
+                    logger.warning("Input data for key '%s' is empty...", city)
+                    continue
+                calculated_data[city], analyzed_data[city] = result
+                self.ranking.update(city, analyzed_data[city])
+        finally:
+            # unblock fetching threads if the workers failed before the queue was drained
+            while not fetching.done():
+                try:
+                    fetched.get(timeout=STREAM_DRAIN_INTERVAL)
+                except queue.Empty:
+                    pass
+            fetcher.shutdown()
+        fetching.result()
+        logger.info("IPC stats: %s", self.ipc_stats)
+        if self.instrumentation is not None:
+            self.instrumentation.record_ipc(self.ipc_stats)
+
+        return calculated_data, analyzed_data, self.ranking.ordered()
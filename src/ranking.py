@@ -0,0 +1,88 @@
+from bisect import bisect_left, insort
+from itertools import count, islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+AVERAGE_TEMPERATURE_KEY = "average_temperature"
+CONDITION_HOURS_KEY = "total_relevant_condition_hours"
+
+# (-average temperature, -condition hours, insertion order, city): ascending order is best first
+Entry = Tuple[float, float, int, Any]
+
+
+def city_score(result: Dict[str, Any]) -> Tuple[float, float]:
+    """Ranking key of DataAnalyzingTask results, higher is better. Missing values rank last."""
+    temperature = result.get(AVERAGE_TEMPERATURE_KEY, 0)
+    hours = result.get(CONDITION_HOURS_KEY, 0)
+    return (
+        float("-inf") if temperature is None else temperature,
+        float("-inf") if hours is None else hours,
+    )
+
+
+class CityRanking:
+    """
+    Cities in ranking order, best first. Equal scores keep the order in which the cities were first added,
+    as the stable sort they replace did. Updating a city moves it.
+    The entries are kept sorted as updates arrive: an update or removal is a binary search plus a list insert or
+    delete, so reads need no sort and top(k) only looks at the first k entries and their ties.
+    """
+
+    def __init__(self) -> None:
+        self._entries: List[Entry] = []
+        self._by_city: Dict[Any, Entry] = {}
+        self._order = count()
+
+    @classmethod
+    def from_results(cls, results: Dict[Any, Dict[str, Any]]) -> "CityRanking":
+        ranking = cls()
+        for city, result in results.items():
+            ranking.update(city, result)
+        return ranking
+
+    def __len__(self) -> int:
+        return len(self._by_city)
+
+    def __contains__(self, city: Any) -> bool:
+        return city in self._by_city
+
+    def __iter__(self) -> Iterator[Any]:
+        return (entry[3] for entry in self._entries)
+
+    def _discard(self, entry: Entry) -> None:
+        # entries are unique by their insertion order, the search lands on this one
+        del self._entries[bisect_left(self._entries, entry)]
+
+    def update(self, city: Any, result: Dict[str, Any]) -> None:
+        previous = self._by_city.get(city)
+        if previous is not None:
+            self._discard(previous)
+        temperature, hours = city_score(result)
+        order = previous[2] if previous is not None else next(self._order)
+        entry = (-temperature, -hours, order, city)
+        insort(self._entries, entry)
+        self._by_city[city] = entry
+
+    def remove(self, city: Any) -> None:
+        entry = self._by_city.pop(city, None)
+        if entry is not None:
+            self._discard(entry)
+
+    def score(self, city: Any) -> Optional[Tuple[float, float]]:
+        entry = self._by_city.get(city)
+        return None if entry is None else (-entry[0], -entry[1])
+
+    def top(self, k: int = 1) -> List[Any]:
+        """The k best cities, plus every further city tied with the k-th"""
+        entries = self._entries
+        if k <= 0 or not entries:
+            return []
+        cities = [entry[3] for entry in entries[:k]]
+        last_score = entries[len(cities) - 1][:2]
+        for entry in islice(entries, len(cities), None):
+            if entry[:2] != last_score:
+                break
+            cities.append(entry[3])
+        return cities
+
+    def ordered(self) -> List[Any]:
+        return [entry[3] for entry in self._entries]
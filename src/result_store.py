@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import pickle
+import sqlite3
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import external.analyzer as analyzer
+
+# bump to drop every stored result after a change of the analysis code or of the stored types
+# (2: days are DaySummary records)
+STORE_VERSION = 2
+# fixed so that the same payload always hashes the same, whatever the interpreter default is
+PAYLOAD_PICKLE_PROTOCOL = 4
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def analyzer_fingerprint() -> str:
+    """Changes whenever one of the analyzer parameters does, read at call time"""
+    params = {
+        "version": STORE_VERSION,
+        "hours_start": analyzer.INPUT_DAY_HOURS_START,
+        "hours_end": analyzer.INPUT_DAY_HOURS_END,
+        "suitable_conditions": list(analyzer.INPUT_DAY_SUITABLE_CONDITIONS),
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def payload_fingerprint(data: Any) -> str:
+    return hashlib.sha256(pickle.dumps(data, PAYLOAD_PICKLE_PROTOCOL)).hexdigest()
+
+
+def body_fingerprint(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+def loads_with_fingerprint(body: str, loads: Callable[[str], Any] = json.loads) -> Tuple[str, Any]:
+    """
+    loads for the fetching clients, which also returns the fingerprint of the response body:
+    the UTF-8 text the clients decode encodes back to the same bytes
+    """
+    return body_fingerprint(body.encode("utf-8")), loads(body)
+
+
+class ResultStore:
+    """
+    Persistent results of a pipeline stage, keyed by the stage, the function, the analyzer parameters and
+    a content hash of the input. A change of any of them is a miss, so stale entries are never returned.
+    The least recently used results are evicted once their values take more than max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.path: str = path
+        self.max_bytes: int = max_bytes
+        self.evicted: int = 0
+        self.connection = sqlite3.connect(path)
+        (version,) = self.connection.execute("PRAGMA user_version").fetchone()
+        if version != STORE_VERSION:
+            self.connection.execute("DROP TABLE IF EXISTS results")
+            self.connection.execute(f"PRAGMA user_version = {STORE_VERSION}")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, used_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_used_at ON results (used_at)")
+        self.connection.commit()
+        (self._size,) = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+
+    @staticmethod
+    def make_key(
+        stage: str, func: Callable, data: Any, params: Optional[str] = None, fingerprint: Optional[str] = None
+    ) -> str:
+        """fingerprint identifies data when given, e.g. the hash of the response body it was decoded from"""
+        func_name = f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', repr(func))}"
+        parts = (stage, func_name, params or analyzer_fingerprint(), fingerprint or payload_fingerprint(data))
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        found: Dict[str, Any] = {}
+        # stay under SQLite's limit of bound parameters per statement
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.connection.execute(f"SELECT key, value FROM results WHERE key IN ({placeholders})", batch)
+            found.update((key, pickle.loads(value)) for key, value in rows)
+        if found:
+            self.connection.executemany(
+                "UPDATE results SET used_at = ? WHERE key = ?", ((time.time(), key) for key in found)
+            )
+            self.connection.commit()
+        return found
+
+    def put_many(self, items: Dict[str, Any]) -> None:
+        values = {key: pickle.dumps(value, pickle.HIGHEST_PROTOCOL) for key, value in items.items()}
+        replaced = self._sizes(values)
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO results (key, value, size, used_at) VALUES (?, ?, ?, ?)",
+            ((key, value, len(value), now) for key, value in values.items()),
+        )
+        self._size += sum(len(value) for value in values.values()) - replaced
+        if self._size > self.max_bytes:
+            self._evict()
+        self.connection.commit()
+
+    def _sizes(self, keys: Iterable[str]) -> int:
+        keys = list(keys)
+        total = 0
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            (size,) = self.connection.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM results WHERE key IN ({placeholders})", batch
+            ).fetchone()
+            total += size
+        return total
+
+    def _evict(self) -> None:
+        # the most recently used results stay, up to max_bytes
+        kept = 0
+        evicted = []
+        for key, size in self.connection.execute("SELECT key, size FROM results ORDER BY used_at DESC"):
+            if not evicted and kept + size <= self.max_bytes:
+                kept += size
+            else:
+                evicted.append((key,))
+        self.connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+        self._size = kept
+        self.evicted += len(evicted)
+        logger.info("Evicted %s stored results, %s bytes are left", len(evicted), kept)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
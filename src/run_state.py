@@ -0,0 +1,356 @@
+"""
+Incremental runs: what the previous run learned about every city is kept, so that a run only fetches the cities
+due for a refresh, recomputes those whose forecast changed, and rewrites the CSV output from the first city whose
+rows moved or changed instead of from the top.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from external.analyzer import analyze_json
+from src.instrumentation import Instrumentation
+from src.ranking import AVERAGE_TEMPERATURE_KEY, CONDITION_HOURS_KEY, CityRanking
+from src.result_store import analyzer_fingerprint, payload_fingerprint
+from src.tasks import (
+    OUTPUT_COLUMNS,
+    OUTPUT_CSV,
+    TRANSPORT_PICKLE,
+    DataAggregationTask,
+    DataAnalyzingTask,
+    DataCalculationTask,
+    WorkerPool,
+    replaced_on_success,
+)
+
+# bump to start over from an empty state after a change of the tables
+STATE_VERSION = 1
+# stays under SQLite's limit on bound parameters per statement
+SQL_BATCH = 500
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CityState:
+    city: str
+    url: str
+    fingerprint: str
+    fetched_at: float
+    average_temperature: Optional[float] = None
+    total_relevant_condition_hours: Optional[int] = None
+    # place in the ranking, and the bytes of the city's rows in the CSV output
+    rank: int = -1
+    offset: int = 0
+    size: int = 0
+
+    @property
+    def analyzed(self) -> Dict[str, Any]:
+        return {
+            AVERAGE_TEMPERATURE_KEY: self.average_temperature,
+            CONDITION_HOURS_KEY: self.total_relevant_condition_hours,
+        }
+
+
+CITY_COLUMNS = tuple(CityState.__dataclass_fields__)
+
+
+class OutputWriteError(RuntimeError):
+    def __init__(self, output: str) -> None:
+        super().__init__(f"Could not write {output}")
+        self.output: str = output
+
+
+class RunState:
+    """
+    SQLite file with, for every city, the fingerprint of its last forecast, its calculated data and aggregates,
+    its rank and where its rows are in the output, plus the analyzer parameters and output file they belong to
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cities (city TEXT PRIMARY KEY, url TEXT NOT NULL, fingerprint TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL, average_temperature REAL, total_relevant_condition_hours INTEGER,"
+            " rank INTEGER NOT NULL, offset INTEGER NOT NULL, size INTEGER NOT NULL, calculated BLOB NOT NULL)"
+        )
+        if self.get_meta("version") != str(STATE_VERSION):
+            self.clear()
+        self.connection.commit()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key: str, value: str) -> None:
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def clear(self) -> None:
+        self.connection.execute("DELETE FROM cities")
+        self.connection.execute("DELETE FROM meta")
+        self.set_meta("version", str(STATE_VERSION))
+
+    def cities(self) -> Dict[str, CityState]:
+        """Every city in ranking order, without its calculated data"""
+        rows = self.connection.execute(f"SELECT {', '.join(CITY_COLUMNS)} FROM cities ORDER BY rank")
+        return {row[0]: CityState(*row) for row in rows}
+
+    def calculated(self, cities: Iterable[str]) -> Dict[str, Any]:
+        cities = list(cities)
+        found = {}
+        for start in range(0, len(cities), SQL_BATCH):
+            batch = cities[start:start + SQL_BATCH]
+            rows = self.connection.execute(
+                f"SELECT city, calculated FROM cities WHERE city IN ({', '.join('?' * len(batch))})", batch
+            )
+            found.update((city, pickle.loads(value)) for city, value in rows)
+        return found
+
+    def put(self, state: CityState, calculated: Any) -> None:
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO cities ({', '.join(CITY_COLUMNS)}, calculated)"
+            f" VALUES ({', '.join('?' * (len(CITY_COLUMNS) + 1))})",
+            [getattr(state, column) for column in CITY_COLUMNS] + [pickle.dumps(calculated, pickle.HIGHEST_PROTOCOL)],
+        )
+
+    def update(self, states: Iterable[CityState]) -> None:
+        """Stores all of the states but the calculated data, which stays as it is"""
+        self.connection.executemany(
+            f"UPDATE cities SET {', '.join(column + ' = ?' for column in CITY_COLUMNS[1:])} WHERE city = ?",
+            ([getattr(state, column) for column in CITY_COLUMNS[1:]] + [state.city] for state in states),
+        )
+
+    def remove(self, cities: Iterable[str]) -> None:
+        self.connection.executemany("DELETE FROM cities WHERE city = ?", ((city,) for city in cities))
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def rollback(self) -> None:
+        self.connection.rollback()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "RunState":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+@dataclass
+class DeltaStats:
+    cities: int = 0
+    fetched: int = 0
+    changed: int = 0
+    removed: int = 0
+    # rank from which the output was written again, the rows of the cities above it were left in place
+    rewritten_from: int = 0
+    full_rewrite: bool = False
+
+
+class DeltaRun:
+    """
+    One incremental run over url_dict. New cities and those fetched refresh_after seconds ago or earlier are
+    fetched; only the ones whose forecast fingerprint changed are calculated and analyzed on the pool.
+    The ranking is rebuilt from the stored aggregates, ties in url order, so it is the one a first run would give.
+    CSV output is cut after the last city whose rows neither moved nor changed and written on from there.
+    Other formats, an output file changed since the last run and new analyzer parameters get a full write.
+    A city whose fetch or calculation fails keeps its previous results.
+    """
+
+    def __init__(
+        self,
+        url_dict: Dict[str, str],
+        state: RunState,
+        fetch: Callable[[Dict[str, str]], Dict[str, Any]],
+        pool: WorkerPool,
+        output: str,
+        output_format: str = OUTPUT_CSV,
+        refresh_after: float = 0.0,
+        transport: str = TRANSPORT_PICKLE,
+        instrumentation: Optional[Instrumentation] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.url_dict: Dict[str, str] = url_dict
+        self.state: RunState = state
+        self.fetch: Callable[[Dict[str, str]], Dict[str, Any]] = fetch
+        self.pool: WorkerPool = pool
+        self.output: str = output
+        self.output_format: str = output_format
+        self.refresh_after: float = refresh_after
+        self.transport: str = transport
+        self.instrumentation: Instrumentation = instrumentation or Instrumentation()
+        self.clock: Callable[[], float] = clock
+        self.stats: DeltaStats = DeltaStats()
+
+    def _output_key(self) -> str:
+        return f"{self.output_format}:{os.path.abspath(self.output)}"
+
+    def _output_intact(self) -> bool:
+        """Whether the output is the file the stored offsets describe"""
+        try:
+            size = os.path.getsize(self.output)
+        except OSError:
+            return False
+        return self.state.get_meta("output") == self._output_key() and self.state.get_meta("output_size") == str(size)
+
+    def _due(self, previous: Dict[str, CityState], now: float) -> Dict[str, str]:
+        due = {}
+        for city, url in self.url_dict.items():
+            city_state = previous.get(city)
+            if city_state is None or city_state.url != url or now - city_state.fetched_at >= self.refresh_after:
+                due[city] = url
+        return due
+
+    def _recompute(self, payloads: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        with self.instrumentation.stage("calculation"):
+            calculation = DataCalculationTask(payloads, analyze_json, pool=self.pool, transport=self.transport)
+            calculated = calculation.execute()
+        self.instrumentation.record_ipc(calculation.ipc_stats)
+        with self.instrumentation.stage("analysis"):
+            analysis = DataAnalyzingTask(calculated, pool=self.pool)
+            analyzed = analysis.execute()
+        self.instrumentation.record_ipc(analysis.ipc_stats)
+        return calculated, analyzed
+
+    def _fetch_changed(
+        self, previous: Dict[str, CityState], now: float
+    ) -> Tuple[Dict[str, Any], Dict[str, str], List[CityState]]:
+        """Payloads and fingerprints of the due cities whose forecast changed, states of those that did not"""
+        due = self._due(previous, now)
+        with self.instrumentation.stage("fetch"):
+            fetched = self.fetch(due) if due else {}
+        self.stats.fetched = len(fetched)
+        payloads, fingerprints, refreshed = {}, {}, []
+        for city, payload in fetched.items():
+            fingerprint = payload_fingerprint(payload)
+            city_state = previous.get(city)
+            if city_state is not None and city_state.fingerprint == fingerprint and city_state.url == due[city]:
+                city_state.fetched_at = now
+                refreshed.append(city_state)
+            else:
+                payloads[city], fingerprints[city] = payload, fingerprint
+        return payloads, fingerprints, refreshed
+
+    def run(self) -> List[str]:
+        """Brings the state and the output up to date, returns the ranking"""
+        now = self.clock()
+        self.stats = DeltaStats(cities=len(self.url_dict))
+        full_rewrite = self.output_format != OUTPUT_CSV or not self._output_intact()
+        params = analyzer_fingerprint()
+        if self.state.get_meta("params") != params:
+            # aggregates of other analyzer parameters are of no use
+            self.state.clear()
+            full_rewrite = True
+        previous = self.state.cities()
+
+        payloads, fingerprints, refreshed = self._fetch_changed(previous, now)
+        calculated, analyzed = self._recompute(payloads) if payloads else ({}, {})
+        for city in payloads:
+            if city not in analyzed:
+                logger.warning("No new results for city=%s, its previous ones are kept", city)
+
+        states = {city: city_state for city, city_state in previous.items() if city in self.url_dict}
+        changed = [city for city in self.url_dict if city in analyzed]
+        for city in changed:
+            result = analyzed[city]
+            states[city] = CityState(
+                city,
+                self.url_dict[city],
+                fingerprints[city],
+                now,
+                result.get(AVERAGE_TEMPERATURE_KEY),
+                result.get(CONDITION_HOURS_KEY),
+            )
+        ranking = CityRanking.from_results({city: states[city].analyzed for city in self.url_dict if city in states})
+        ranked = ranking.ordered()
+        removed = [city for city in previous if city not in states]
+
+        start = 0 if full_rewrite else self._first_moved(list(previous), ranked, set(changed))
+        if full_rewrite or start < len(ranked) or removed:
+            with self.instrumentation.stage("aggregation"):
+                written = self._write(ranked, start, states, {city: calculated[city] for city in changed})
+            if not written:
+                # the state keeps describing the output of the last run that wrote it
+                self.state.rollback()
+                raise OutputWriteError(self.output)
+        for rank, city in enumerate(ranked):
+            states[city].rank = rank
+
+        for city in changed:
+            self.state.put(states[city], calculated[city])
+        # ranks and offsets only moved from start on
+        updated = {city_state.city: city_state for city_state in refreshed}
+        updated.update((city, states[city]) for city in ranked[start:] if city not in analyzed)
+        self.state.update(updated.values())
+        self.state.remove(removed)
+        self.state.set_meta("params", params)
+        self.state.set_meta("output", self._output_key())
+        self.state.set_meta("output_size", str(os.path.getsize(self.output)))
+        self.state.commit()
+
+        self.stats.changed, self.stats.removed = len(changed), len(removed)
+        self.stats.rewritten_from, self.stats.full_rewrite = start, full_rewrite
+        for name in ("fetched", "changed", "removed"):
+            self.instrumentation.count(f"delta.{name}", getattr(self.stats, name))
+        logger.info("Delta run: %s", self.stats)
+        return ranked
+
+    @staticmethod
+    def _first_moved(previous_order: List[str], ranked: List[str], changed: Set[str]) -> int:
+        """Rank of the first city whose rows changed or are not where they were"""
+        for rank, city in enumerate(ranked):
+            if rank >= len(previous_order) or previous_order[rank] != city or city in changed:
+                return rank
+        return len(ranked)
+
+    def _write(self, ranked: List[str], start: int, states: Dict[str, CityState], calculated: Dict[str, Any]) -> bool:
+        """Writes the rows of the cities ranked start and below, recording where each city's rows went"""
+        tail = ranked[start:]
+        calculated = dict(calculated)
+        calculated.update(self.state.calculated(city for city in tail if city not in calculated))
+        analyzed = {city: states[city].analyzed for city in tail}
+        if self.output_format != OUTPUT_CSV:
+            write = DataAggregationTask.write_aggregated_data
+            return write(calculated, analyzed, tail, self.output, self.output_format)
+
+        try:
+            if start:
+                # a patch that fails leaves an output of another size, which the next run writes again in full
+                kept = states[ranked[start - 1]]
+                with open(self.output, "r+b") as file:
+                    file.seek(kept.offset + kept.size)
+                    file.truncate()
+                    self._write_rows(file, tail, states, calculated, analyzed)
+            else:
+                # a full write replaces the output only once complete, a failed one keeps the previous output
+                with replaced_on_success(self.output) as temp_path, open(temp_path, "wb") as file:
+                    file.write((",".join(name for name, _ in OUTPUT_COLUMNS) + "\n").encode("utf-8"))
+                    self._write_rows(file, tail, states, calculated, analyzed)
+        except Exception as e:
+            logger.exception("An unexpected error occurred: %s", e)
+            return False
+        return True
+
+    @staticmethod
+    def _write_rows(
+        file: BinaryIO,
+        tail: List[str],
+        states: Dict[str, CityState],
+        calculated: Dict[str, Any],
+        analyzed: Dict[str, Any],
+    ) -> None:
+        offset = file.tell()
+        for city in tail:
+            rows = DataAggregationTask.iter_rows(calculated, analyzed, [city])
+            block = "".join(map(DataAggregationTask.format_csv_row, rows)).encode("utf-8")
+            file.write(block)
+            states[city].offset, states[city].size = offset, len(block)
+            offset += len(block)
@@ -0,0 +1,386 @@
+"""
+Sharded runs: the cities are split over nodes by consistent hash, every node fetches, calculates and aggregates
+its shard on its own worker pool, and a coordinator merges the partial results. Nodes hand their results over
+through a shared directory, so they can be local processes or processes on other hosts mounting the directory.
+Results are JSON, and carry the id of the run and a fingerprint of its inputs: the coordinator ignores any file
+another run left in the directory.
+"""
+import hashlib
+import heapq
+import json
+import logging
+import multiprocessing as mp
+import os
+import time
+import uuid
+from bisect import bisect_right, insort
+from dataclasses import dataclass, field
+from multiprocessing import Queue
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config.log_queue import install_queue_handler
+from external.analyzer import OUTPUT_DAYS_KEY, DaySummary
+from src.instrumentation import Instrumentation
+from src.ranking import CityRanking, city_score
+from src.result_store import analyzer_fingerprint
+from src.tasks import WorkerPool
+
+RING_REPLICAS = 128
+SHARD_FILE_TEMPLATE = "shard-{index:04d}.json"
+SHARD_POLL_INTERVAL = 0.5
+
+logger = logging.getLogger(__name__)
+
+# runs fetch, calculation and per-city aggregation of the cities it is given on a pool,
+# returning calculated data, per-city aggregates and a ranking like the single-node pipelines
+ShardRunner = Callable[[Dict[str, str], WorkerPool, Instrumentation], Tuple[Dict[str, Any], Dict[str, Any], List[str]]]
+
+
+def _hash(key: str) -> int:
+    # hash() of a str differs between processes, nodes must agree on the ring
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class ShardsMissingError(RuntimeError):
+    def __init__(self, indexes: List[int]) -> None:
+        super().__init__(f"No results for shards {', '.join(map(str, indexes))}")
+        self.indexes: List[int] = indexes
+
+
+class HashRing:
+    """
+    Consistent hash ring with replicas virtual points per node. Adding or removing a node only moves
+    the keys of the ring segments it gains or loses, about 1/N of them.
+    """
+
+    def __init__(self, nodes: Iterable[Any] = (), replicas: int = RING_REPLICAS) -> None:
+        self.replicas: int = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, Any] = {}
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self) -> List[Any]:
+        return list(dict.fromkeys(self._owners[point] for point in self._points))
+
+    def add_node(self, node: Any) -> None:
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            if point not in self._owners:
+                insort(self._points, point)
+                self._owners[point] = node
+
+    def remove_node(self, node: Any) -> None:
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != node}
+
+    def node_for(self, key: str) -> Any:
+        if not self._points:
+            raise ValueError("The hash ring has no nodes")
+        index = bisect_right(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+    def partition(self, url_dict: Dict[str, str]) -> Dict[Any, Dict[str, str]]:
+        """The cities of every node, in url_dict order"""
+        shards: Dict[Any, Dict[str, str]] = {node: {} for node in self.nodes}
+        for city, url in url_dict.items():
+            shards[self.node_for(city)][city] = url
+        return shards
+
+
+def run_fingerprint(url_dict: Dict[str, str], shards: int, replicas: int = RING_REPLICAS) -> str:
+    """Changes with anything that changes the shards or their results: cities, ring and analyzer parameters"""
+    inputs = {
+        "cities": list(url_dict.items()),
+        "shards": shards,
+        "replicas": replicas,
+        "analyzer": analyzer_fingerprint(),
+    }
+    return hashlib.sha256(json.dumps(inputs).encode("utf-8")).hexdigest()
+
+
+def _calculated_to_json(calculated: Dict[str, Any]) -> Dict[str, Any]:
+    result = dict(calculated)
+    result[OUTPUT_DAYS_KEY] = [
+        day.to_json() if isinstance(day, DaySummary) else day for day in calculated.get(OUTPUT_DAYS_KEY, [])
+    ]
+    return result
+
+
+def _calculated_from_json(data: Dict[str, Any]) -> Dict[str, Any]:
+    result = dict(data)
+    result[OUTPUT_DAYS_KEY] = [DaySummary.from_json(day) for day in data.get(OUTPUT_DAYS_KEY, [])]
+    return result
+
+
+@dataclass
+class ShardResult:
+    index: int
+    shards: int
+    cities: List[str]
+    run_id: str = ""
+    fingerprint: str = ""
+    calculated: Dict[str, Any] = field(default_factory=dict)
+    analyzed: Dict[str, Any] = field(default_factory=dict)
+    # best first, ties in cities order
+    ranking: List[str] = field(default_factory=list)
+    instrumentation: Optional[Instrumentation] = None
+
+    @property
+    def missing(self) -> List[str]:
+        return [city for city in self.cities if city not in self.analyzed]
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "shards": self.shards,
+            "cities": self.cities,
+            "run_id": self.run_id,
+            "fingerprint": self.fingerprint,
+            "calculated": {city: _calculated_to_json(result) for city, result in self.calculated.items()},
+            "analyzed": self.analyzed,
+            "ranking": self.ranking,
+            "instrumentation": self.instrumentation.to_state() if self.instrumentation is not None else None,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "ShardResult":
+        instrumentation = data.get("instrumentation")
+        return cls(
+            data["index"],
+            data["shards"],
+            data["cities"],
+            data["run_id"],
+            data["fingerprint"],
+            {city: _calculated_from_json(result) for city, result in data["calculated"].items()},
+            data["analyzed"],
+            data["ranking"],
+            Instrumentation.from_state(instrumentation) if instrumentation is not None else None,
+        )
+
+
+def shard_path(shard_dir: str, index: int) -> str:
+    return os.path.join(shard_dir, SHARD_FILE_TEMPLATE.format(index=index))
+
+
+class ShardNode:
+    """One shard of a run: its cities go through runner on a worker pool of the node's own"""
+
+    def __init__(
+        self,
+        index: int,
+        shards: int,
+        url_dict: Dict[str, str],
+        runner: ShardRunner,
+        shard_dir: str,
+        num_workers: int = 4,
+        start_method: Optional[str] = None,
+        log_queue: Optional[Queue] = None,
+        run_id: str = "",
+        fingerprint: str = "",
+    ) -> None:
+        self.index: int = index
+        self.shards: int = shards
+        self.url_dict: Dict[str, str] = url_dict
+        self.runner: ShardRunner = runner
+        self.shard_dir: str = shard_dir
+        self.num_workers: int = num_workers
+        self.start_method: Optional[str] = start_method
+        self.log_queue: Optional[Queue] = log_queue
+        self.run_id: str = run_id
+        self.fingerprint: str = fingerprint
+
+    @property
+    def path(self) -> str:
+        return shard_path(self.shard_dir, self.index)
+
+    def run(self) -> ShardResult:
+        logger.info("Shard %d/%d: processing %d cities", self.index, self.shards, len(self.url_dict))
+        instrumentation = Instrumentation()
+        result = ShardResult(
+            self.index, self.shards, list(self.url_dict), self.run_id, self.fingerprint, instrumentation=instrumentation
+        )
+        if self.url_dict:
+            with WorkerPool(self.num_workers, start_method=self.start_method, log_queue=self.log_queue) as pool:
+                result.calculated, result.analyzed, _ = self.runner(self.url_dict, pool, instrumentation)
+            # ranked again with ties in url_dict order, so that the coordinator merges shards without a sort
+            ranked = {city: result.analyzed[city] for city in self.url_dict if city in result.analyzed}
+            result.ranking = CityRanking.from_results(ranked).ordered()
+        self.write(result)
+        return result
+
+    def write(self, result: ShardResult) -> None:
+        os.makedirs(self.shard_dir, exist_ok=True)
+        # the coordinator may be polling for the file, it must never see a partial one
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(result.to_json(), file)
+        os.replace(temp_path, self.path)
+
+
+def _run_node(node: ShardNode) -> None:
+    if node.log_queue is not None:
+        install_queue_handler(node.log_queue)
+    node.run()
+
+
+class ShardCoordinator:
+    """
+    Splits url_dict over shards nodes and merges their results. run() starts every node as a local process;
+    with nodes started elsewhere (ShardNode(...).run() on each host), collect() waits for their results instead.
+    Nodes and coordinator of one run share its run_id, a new one is drawn when none is given.
+    The merged ranking breaks ties in url_dict order, so it does not depend on the number of shards.
+    """
+
+    def __init__(
+        self,
+        url_dict: Dict[str, str],
+        runner: ShardRunner,
+        shard_dir: str,
+        shards: int = 2,
+        workers_per_node: int = 4,
+        start_method: Optional[str] = None,
+        log_queue: Optional[Queue] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        replicas: int = RING_REPLICAS,
+        run_id: Optional[str] = None,
+    ) -> None:
+        self.url_dict: Dict[str, str] = url_dict
+        self.runner: ShardRunner = runner
+        self.shard_dir: str = shard_dir
+        self.shards: int = shards
+        self.workers_per_node: int = workers_per_node
+        self.start_method: Optional[str] = start_method
+        self.log_queue: Optional[Queue] = log_queue
+        self.instrumentation: Optional[Instrumentation] = instrumentation
+        self.ring: HashRing = HashRing(range(shards), replicas)
+        self.assignment: Dict[int, Dict[str, str]] = self.ring.partition(url_dict)
+        self.run_id: str = run_id or uuid.uuid4().hex
+        self.fingerprint: str = run_fingerprint(url_dict, shards, replicas)
+
+    def node(self, index: int) -> ShardNode:
+        return ShardNode(
+            index,
+            self.shards,
+            self.assignment.get(index, {}),
+            self.runner,
+            self.shard_dir,
+            self.workers_per_node,
+            self.start_method,
+            self.log_queue,
+            self.run_id,
+            self.fingerprint,
+        )
+
+    def launch(self) -> List[Any]:
+        """Starts a process per node, after removing results of earlier runs"""
+        os.makedirs(self.shard_dir, exist_ok=True)
+        context = mp.get_context(self.start_method)
+        processes = []
+        for index in range(self.shards):
+            if os.path.exists(shard_path(self.shard_dir, index)):
+                os.remove(shard_path(self.shard_dir, index))
+            # not a daemon: a node starts worker processes of its own
+            process = context.Process(target=_run_node, args=(self.node(index),), name=f"shard-{index}")
+            process.start()
+            processes.append(process)
+        return processes
+
+    def _load(self, index: int, quiet: bool = False) -> Optional[ShardResult]:
+        """The result of this run for shard index, None if its file is missing or was left by anything else"""
+        path = shard_path(self.shard_dir, index)
+        # while polling, a file that is not ours yet may still be replaced by the node
+        log = logger.debug if quiet else logger.error
+        try:
+            with open(path) as file:
+                result = ShardResult.from_json(json.load(file))
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            log("Ignoring %s: not a readable shard result: %s", path, exc)
+            return None
+        if result.shards != self.shards or result.index != index:
+            log("Ignoring %s: written for shard %d/%d", path, result.index, result.shards)
+            return None
+        if result.run_id != self.run_id:
+            log("Ignoring %s: left by run %s", path, result.run_id)
+            return None
+        if result.fingerprint != self.fingerprint:
+            log("Ignoring %s: written for other cities or analyzer parameters", path)
+            return None
+        if set(result.cities) != set(self.assignment.get(index, {})):
+            logger.warning("Shard %d processed a different city list than the coordinator assigned to it", index)
+        return result
+
+    def _poll(self, timeout: float) -> Dict[int, ShardResult]:
+        """Results of this run, waiting up to timeout seconds for every node to write one"""
+        deadline = time.monotonic() + timeout
+        loaded: Dict[int, ShardResult] = {}
+        # (mtime, size) of the files already read, a file is read again only once it was replaced
+        seen: Dict[int, Tuple[int, int]] = {}
+        while True:
+            for index in range(self.shards):
+                try:
+                    stat = os.stat(shard_path(self.shard_dir, index))
+                except FileNotFoundError:
+                    continue
+                if index in loaded or seen.get(index) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                seen[index] = (stat.st_mtime_ns, stat.st_size)
+                result = self._load(index, quiet=True)
+                if result is not None:
+                    loaded[index] = result
+            if len(loaded) == self.shards or time.monotonic() >= deadline:
+                return loaded
+            time.sleep(SHARD_POLL_INTERVAL)
+
+    def collect(self, timeout: float = 0, require_all: bool = False) -> List[ShardResult]:
+        """
+        Results of all nodes, waiting up to timeout seconds for missing ones. Files left by other runs do not count.
+        With require_all, a missing result raises ShardsMissingError.
+        """
+        loaded = self._poll(timeout)
+        results, missing = [], []
+        for index in range(self.shards):
+            result = loaded.get(index)
+            if result is None:
+                if os.path.exists(shard_path(self.shard_dir, index)):
+                    # logs why the file was ignored
+                    self._load(index)
+                logger.error(
+                    "No result for shard %d, its %d cities are missing", index, len(self.assignment.get(index, {}))
+                )
+                missing.append(index)
+                continue
+            if result.missing:
+                logger.warning("Shard %d has no results for %d cities", index, len(result.missing))
+            if self.instrumentation is not None and result.instrumentation is not None:
+                self.instrumentation.merge(result.instrumentation, prefix=f"shard-{index}.")
+            results.append(result)
+        if missing and require_all:
+            raise ShardsMissingError(missing)
+        return results
+
+    def merge(self, results: List[ShardResult]) -> Tuple[Dict[str, Any], Dict[str, Any], List[str]]:
+        calculated_data: Dict[str, Any] = {}
+        analyzed_data: Dict[str, Any] = {}
+        for result in results:
+            calculated_data.update(result.calculated)
+            analyzed_data.update(result.analyzed)
+
+        position = {city: index for index, city in enumerate(self.url_dict)}
+
+        def rank_key(city: str) -> Tuple[float, float, int]:
+            temperature, hours = city_score(analyzed_data[city])
+            return -temperature, -hours, position.get(city, len(position))
+
+        # every shard ranking is already in rank_key order
+        ranking = list(heapq.merge(*(result.ranking for result in results), key=rank_key))
+        return calculated_data, analyzed_data, ranking
+
+    def run(self) -> Tuple[Dict[str, Any], Dict[str, Any], List[str]]:
+        """Returns calculated data, per-city aggregates and the ranking, like the single-node pipelines"""
+        for process in self.launch():
+            process.join()
+            if process.exitcode:
+                logger.error("Node %s exited with code %s", process.name, process.exitcode)
+        return self.merge(self.collect(require_all=True))
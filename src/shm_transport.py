@@ -0,0 +1,97 @@
+import logging
+from multiprocessing import shared_memory
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from external.columnar import ForecastBatch, analyze_city
+
+logger = logging.getLogger(__name__)
+
+ARRAY_ALIGNMENT = 8
+
+# array name -> (offset, dtype, length)
+Layout = Tuple[Tuple[str, int, str, int], ...]
+
+
+class SharedForecastRef(NamedTuple):
+    """What a worker receives instead of the payload"""
+
+    shm_name: str
+    layout: Layout
+    city_index: int
+
+
+class SharedForecastStore:
+    """
+    Writes the columnar form of fetched payloads into one shared memory block.
+    The owner unlinks the block on exit, so workers must be done with it by then.
+    """
+
+    def __init__(self, payloads: Dict[Any, Any]) -> None:
+        self.batch: ForecastBatch = ForecastBatch.from_payloads(payloads)
+        layout = []
+        size = 0
+        for name, array in self.batch.arrays.items():
+            layout.append((name, size, array.dtype.str, len(array)))
+            size += -(-array.nbytes // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+        self.layout: Layout = tuple(layout)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for (name, offset, dtype, length), array in zip(self.layout, self.batch.arrays.values()):
+            np.ndarray(length, dtype=dtype, buffer=self.shm.buf, offset=offset)[:] = array
+        logger.info("Shared %s cities in %s bytes of shared memory", len(self.batch.cities), size)
+
+    @property
+    def refs(self) -> Dict[Any, SharedForecastRef]:
+        return {
+            city: SharedForecastRef(self.shm.name, self.layout, city_index)
+            for city_index, city in enumerate(self.batch.cities)
+        }
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self) -> "SharedForecastStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+# the block a worker attached to, kept open for the rest of its chunk
+_attached: Optional[Tuple[shared_memory.SharedMemory, ForecastBatch]] = None
+
+
+def _attach(ref: SharedForecastRef) -> ForecastBatch:
+    global _attached
+    if _attached is not None and _attached[0].name == ref.shm_name:
+        return _attached[1]
+    detach()
+    shm = shared_memory.SharedMemory(name=ref.shm_name)
+    arrays = {
+        name: np.ndarray(length, dtype=dtype, buffer=shm.buf, offset=offset)
+        for name, offset, dtype, length in ref.layout
+    }
+    batch = ForecastBatch(cities=[], **arrays)
+    _attached = (shm, batch)
+    return batch
+
+
+def detach() -> None:
+    """Closes the block of the worker, the owner unlinks it once the stage is done"""
+    global _attached
+    if _attached is None:
+        return
+    shm = _attached[0]
+    # the views have to go before the block can be closed
+    _attached = None
+    shm.close()
+
+
+def analyze_shared(ref: SharedForecastRef) -> Dict[str, Any]:
+    """Worker side of the transport: analyze_json over the shared columns of one city"""
+    return analyze_city(_attach(ref), ref.city_index)
+
+
+analyze_shared.after_chunk = detach
@@ -1,26 +1,114 @@
+import functools
+import itertools
 import logging
+import math
+import os
+import pickle
+import queue
+import threading
+import time
 import concurrent.futures
-from multiprocessing import Process, Queue
-from typing import Any, Callable, Dict, List, Tuple, Optional
+import multiprocessing as mp
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from multiprocessing import Process, Queue, resource_tracker
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple, Optional
 
-import numpy as np
+from config.log_queue import PAYLOAD, install_queue_handler
+from external.analyzer import DaySummary
+from src.instrumentation import Instrumentation, LatencyHistogram, is_timeout, peak_rss_kb
+from src.ranking import CityRanking
+
+if TYPE_CHECKING:
+    # imported where they are used: asyncio by async fetching, NumPy by the npy and parquet writers,
+    # SQLite by a result store
+    import asyncio
+
+    import numpy as np
+
+    from src.result_store import ResultStore
 
 logger = logging.getLogger(__name__)
 
+RESULT_POLL_INTERVAL = 1.0
+STREAM_POLL_INTERVAL = 0.05
+TRANSPORT_PICKLE = "pickle"
+TRANSPORT_SHARED_MEMORY = "shm"
+CHUNKS_PER_WORKER = 8
+DEFAULT_CHUNK_SIZE = 16
+MAX_CHUNK_BYTES = 1024 * 1024
+OUTPUT_CSV = "csv"
+OUTPUT_NPY = "npy"
+OUTPUT_PARQUET = "parquet"
+WRITE_CHUNK_ROWS = 16384
+# fields of OUTPUT_DTYPE, kept as plain strings so that CSV output does not need NumPy
+OUTPUT_COLUMNS = (
+    ("City", "U50"),
+    ("Avg Temperature", "f8"),
+    ("Total Cond Hours", "i8"),
+    ("Date", "U10"),
+    ("Hours Start", "i8"),
+    ("Hours End", "i8"),
+    ("Hours Count", "i8"),
+    ("Daily Avg Temp", "f8"),
+    ("Daily Cond Hours", "i8"),
+)
+
+
+@functools.lru_cache(maxsize=None)
+def output_dtype() -> "np.dtype":
+    import numpy as np
+
+    return np.dtype(list(OUTPUT_COLUMNS))
+
+
+def __getattr__(name: str) -> Any:
+    # PEP 562: NumPy is imported on first use of OUTPUT_DTYPE, by the npy and parquet writers only
+    if name == "OUTPUT_DTYPE":
+        return output_dtype()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class DataFetchingTask:
     def __init__(
-        self, url_dict: Dict[str, str], fetch_func: Callable[[str, int], Any], max_workers: int = 5, timeout: int = 10
+        self,
+        url_dict: Dict[str, str],
+        fetch_func: Callable[[str, int], Any],
+        max_workers: int = 5,
+        timeout: int = 10,
+        instrumentation: Optional[Instrumentation] = None,
+        on_close: Optional[Callable[[], None]] = None,
     ) -> None:
         self.url_dict: Dict[str, str] = url_dict
         self.fetch_func: Callable[[str, int], Any] = fetch_func
         self.max_workers: int = max_workers
         self.timeout: int = timeout
+        self.instrumentation: Optional[Instrumentation] = instrumentation
+        self.on_close: Optional[Callable[[], None]] = on_close
+
+    def _fetch(self, url: str) -> Any:
+        started = time.perf_counter()
+        try:
+            return self.fetch_func(url, self.timeout)
+        finally:
+            if self.instrumentation is not None:
+                self.instrumentation.observe("fetch", time.perf_counter() - started)
+
+    def _count_failure(self, exc: BaseException) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.count("fetch.timeouts" if is_timeout(exc) else "fetch.errors")
 
     def fetch_all(self) -> Dict[str, Any]:
-        with concurrent.futures.ThreadPoolExecutor() as executor:
+        try:
+            return self._fetch_all()
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+    def _fetch_all(self) -> Dict[str, Any]:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             future_to_city: Dict[concurrent.futures.Future, str] = {
-                executor.submit(self.fetch_func, url, self.timeout): city for city, url in self.url_dict.items()
+                executor.submit(self._fetch, url): city for city, url in self.url_dict.items()
             }
 
             results: Dict[str, Any] = {}
@@ -29,92 +117,504 @@ class DataFetchingTask:
                 try:
                     data = future.result(timeout=self.timeout)
                     results[city] = data
-                except concurrent.futures.TimeoutError:
+                except concurrent.futures.TimeoutError as exc:
+                    self._count_failure(exc)
                     logger.exception("Fetching data for city=%s timed out.", city)
                 except Exception as exc:
+                    self._count_failure(exc)
                     logger.exception(f"Fetching data for city=%s generated an exception: %s", city, exc)
 
             return results
 
 
+class AsyncDataFetchingTask:
+    def __init__(
+        self,
+        url_dict: Dict[str, str],
+        fetch_func: Callable[[str, int], Awaitable[Any]],
+        max_concurrency: int = 100,
+        timeout: int = 10,
+        total_timeout: Optional[float] = None,
+        on_close: Optional[Callable[[], Awaitable[None]]] = None,
+        instrumentation: Optional[Instrumentation] = None,
+    ) -> None:
+        self.url_dict: Dict[str, str] = url_dict
+        self.fetch_func: Callable[[str, int], Awaitable[Any]] = fetch_func
+        self.max_concurrency: int = max_concurrency
+        self.timeout: int = timeout
+        self.total_timeout: Optional[float] = total_timeout
+        self.on_close: Optional[Callable[[], Awaitable[None]]] = on_close
+        self.instrumentation: Optional[Instrumentation] = instrumentation
+
+    async def _fetch_city(self, semaphore: "asyncio.Semaphore", city: str, url: str) -> Any:
+        import asyncio
+
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                return await asyncio.wait_for(self.fetch_func(url, self.timeout), self.timeout)
+            finally:
+                if self.instrumentation is not None:
+                    self.instrumentation.observe("fetch", time.perf_counter() - started)
+
+    def _count(self, name: str) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.count(name)
+
+    async def fetch_all_async(self) -> Dict[str, Any]:
+        import asyncio
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        task_to_city: Dict["asyncio.Task", str] = {
+            asyncio.ensure_future(self._fetch_city(semaphore, city, url)): city for city, url in self.url_dict.items()
+        }
+
+        results: Dict[str, Any] = {}
+        try:
+            if not task_to_city:
+                return results
+            done, pending = await asyncio.wait(task_to_city, timeout=self.total_timeout)
+            for task in pending:
+                task.cancel()
+                self._count("fetch.timeouts")
+                logger.error("Fetching data for city=%s exceeded the overall deadline.", task_to_city[task])
+            if pending:
+                await asyncio.wait(pending)
+
+            for task in done:
+                city = task_to_city[task]
+                exc = task.exception()
+                if isinstance(exc, asyncio.TimeoutError):
+                    self._count("fetch.timeouts")
+                    logger.error("Fetching data for city=%s timed out.", city)
+                elif exc is not None:
+                    self._count("fetch.timeouts" if is_timeout(exc) else "fetch.errors")
+                    logger.error("Fetching data for city=%s generated an exception: %s", city, exc)
+                else:
+                    results[city] = task.result()
+            return results
+        finally:
+            if self.on_close is not None:
+                await self.on_close()
+
+    def fetch_all(self) -> Dict[str, Any]:
+        import asyncio
+
+        return asyncio.run(self.fetch_all_async())
+
+
+class WorkerTiming(NamedTuple):
+    """Sent back by a worker with the results of every message"""
+
+    pid: int
+    queue_wait: float
+    latencies: List[float]
+    cpu_time: float
+    peak_rss_kb: int
+
+
 class Worker(Process):
-    def __init__(self, func: Callable, task_queue: Queue, result_queue: Queue) -> None:
-        super().__init__()
-        self.func: Callable[[Any], Any] = func
+    """
+    Long-lived worker process. A task carries the function to run, falling back to the one bound at construction.
+    With a log_queue, every record of the worker is forwarded to the parent's listener.
+    A function with an after_chunk attribute gets it called once its chunk is done, to release what it acquired.
+    """
+
+    def __init__(
+        self,
+        func: Optional[Callable],
+        task_queue: Queue,
+        result_queue: Queue,
+        start_method: Optional[str] = None,
+        log_queue: Optional[Queue] = None,
+    ) -> None:
+        super().__init__(daemon=True)
+        self.func: Optional[Callable[[Any], Any]] = func
         self.task_queue: Queue = task_queue
         self.result_queue: Queue = result_queue
+        self.start_method: Optional[str] = start_method
+        self.log_queue: Optional[Queue] = log_queue
+
+    def _Popen(self, process_obj):
+        return mp.get_context(self.start_method).Process._Popen(process_obj)
 
     def run(self) -> None:
+        if self.log_queue is not None:
+            install_queue_handler(self.log_queue)
         while True:
-            key, value = self.task_queue.get()
-            if key is None:
-                self.result_queue.put((None, None))
+            message = self.task_queue.get()
+            if message is None:
+                self.result_queue.put(None)
                 break
-            try:
-                result = self.func(value)
-                self.result_queue.put((key, result))
-            except Exception as e:
-                logger.exception("Error processing %s: %s", key, e)
-                self.result_queue.put((key, None))
+            batch_id, payload, sent_at = message
+            queue_wait = time.time() - sent_at
+            cpu_started = time.process_time()
+            func, chunk = pickle.loads(payload)
+            func = func or self.func
+            results = []
+            latencies = []
+            for key, value in chunk:
+                started = time.perf_counter()
+                try:
+                    results.append((key, func(value)))
+                except Exception as e:
+                    logger.exception("Error processing %s: %s", key, e)
+                    results.append((key, None))
+                latencies.append(time.perf_counter() - started)
+            after_chunk = getattr(func, "after_chunk", None)
+            if after_chunk is not None:
+                after_chunk()
+            timing = WorkerTiming(
+                os.getpid(), queue_wait, latencies, time.process_time() - cpu_started, peak_rss_kb()
+            )
+            self.result_queue.put((batch_id, pickle.dumps(results, pickle.HIGHEST_PROTOCOL), timing))
+
+
+@dataclass
+class IPCStats:
+    """Traffic between a task manager and its workers for one stage, and how long the workers took over it"""
+
+    stage: str = ""
+    items: int = 0
+    messages_sent: int = 0
+    bytes_sent: int = 0
+    messages_received: int = 0
+    bytes_received: int = 0
+    queue_wait: float = 0.0
+    max_queue_wait: float = 0.0
+    worker_cpu_time: float = 0.0
+    worker_peak_rss_kb: int = 0
+    task_latency: Dict[int, LatencyHistogram] = field(default_factory=dict, repr=False)
+
+    def record_timing(self, timing: WorkerTiming) -> None:
+        self.queue_wait += timing.queue_wait
+        self.max_queue_wait = max(self.max_queue_wait, timing.queue_wait)
+        self.worker_cpu_time += timing.cpu_time
+        self.worker_peak_rss_kb = max(self.worker_peak_rss_kb, timing.peak_rss_kb)
+        histogram = self.task_latency.setdefault(timing.pid, LatencyHistogram())
+        for latency in timing.latencies:
+            histogram.observe(latency)
+
+    def to_json(self) -> Dict[str, Any]:
+        stats = asdict(self)
+        overall = LatencyHistogram()
+        for histogram in self.task_latency.values():
+            overall.merge(histogram)
+        stats["task_latency"] = overall.to_json()
+        stats["task_latency_per_worker"] = {pid: histogram.to_json() for pid, histogram in self.task_latency.items()}
+        return stats
+
+
+class WorkerPool:
+    """
+    Pool of worker processes that outlives a single task manager.
+    Functions dispatched to a pool started with spawn/forkserver must be picklable.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 4,
+        func: Optional[Callable[[Any], Any]] = None,
+        start_method: Optional[str] = None,
+        log_queue: Optional[Queue] = None,
+    ) -> None:
+        self.num_workers: int = num_workers
+        self.func: Optional[Callable[[Any], Any]] = func
+        self.start_method: Optional[str] = start_method
+        self.log_queue: Optional[Queue] = log_queue
+        self.context = mp.get_context(start_method)
+        self.task_queue: Queue = self.context.Queue()
+        self.result_queue: Queue = self.context.Queue()
+        self.workers: List[Worker] = []
+        self._batch_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self.workers)
+
+    def start(self) -> "WorkerPool":
+        if self.is_running:
+            return self
+        # workers must inherit the parent's tracker, otherwise each one reports attached shared memory as leaked
+        resource_tracker.ensure_running()
+        for _ in range(self.num_workers):
+            worker = Worker(self.func, self.task_queue, self.result_queue, self.start_method, self.log_queue)
+            worker.start()
+            self.workers.append(worker)
+        return self
+
+    def _poll_result(self, timeout: float) -> Any:
+        """A result message, or None when nothing arrived within timeout"""
+        try:
+            return self.result_queue.get(timeout=timeout)
+        except queue.Empty:
+            dead = [worker for worker in self.workers if not worker.is_alive()]
+            if dead:
+                raise RuntimeError(f"{len(dead)} pool worker(s) exited unexpectedly")
+            return None
+
+    def _get_result(self) -> Any:
+        while True:
+            message = self._poll_result(RESULT_POLL_INTERVAL)
+            if message is not None:
+                return message
+
+    def _iter_chunks(
+        self, func: Optional[Callable[[Any], Any]], items: Iterable[Tuple[Any, Any]], chunk_size: Optional[int]
+    ) -> Iterator[Tuple[int, bytes]]:
+        """
+        Yields (items count, pickled payload) per chunk. Without a fixed chunk_size, the item count per chunk
+        aims at CHUNKS_PER_WORKER chunks per worker and is scaled down to keep payloads under MAX_CHUNK_BYTES
+        """
+        if chunk_size:
+            limit = chunk_size
+        elif hasattr(items, "__len__"):
+            limit = max(1, math.ceil(len(items) / (self.num_workers * CHUNKS_PER_WORKER)))
+        else:
+            limit = DEFAULT_CHUNK_SIZE
+
+        chunk: List[Tuple[Any, Any]] = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) < limit:
+                continue
+            payload = pickle.dumps((func, chunk), pickle.HIGHEST_PROTOCOL)
+            yield len(chunk), payload
+            if not chunk_size and len(payload) > MAX_CHUNK_BYTES:
+                limit = max(1, limit * MAX_CHUNK_BYTES // len(payload))
+            chunk = []
+        if chunk:
+            yield len(chunk), pickle.dumps((func, chunk), pickle.HIGHEST_PROTOCOL)
+
+    def run_batch(
+        self,
+        func: Optional[Callable[[Any], Any]],
+        items: Iterable[Tuple[Any, Any]],
+        chunk_size: Optional[int] = None,
+        stats: Optional[IPCStats] = None,
+    ) -> Iterator[Tuple[Any, Any]]:
+        """Runs func over (key, value) items and yields (key, result) in completion order"""
+        stats = stats if stats is not None else IPCStats()
+        self.start()
+        with self._lock:
+            batch_id = next(self._batch_ids)
+            pending = 0
+            for count, payload in self._iter_chunks(func, items, chunk_size):
+                self.task_queue.put((batch_id, payload, time.time()))
+                stats.items += count
+                stats.messages_sent += 1
+                stats.bytes_sent += len(payload)
+                pending += 1
+            while pending:
+                result_batch_id, payload, timing = self._get_result()
+                if result_batch_id != batch_id:
+                    continue
+                pending -= 1
+                stats.messages_received += 1
+                stats.bytes_received += len(payload)
+                stats.record_timing(timing)
+                yield from pickle.loads(payload)
+
+    def run_stream(
+        self,
+        func: Optional[Callable[[Any], Any]],
+        items: Iterable[Tuple[Any, Any]],
+        max_in_flight: Optional[int] = None,
+        stats: Optional[IPCStats] = None,
+    ) -> Iterator[Tuple[Any, Any]]:
+        """
+        Like run_batch for items that arrive over time, e.g. from a queue: each item is sent as soon as it is
+        produced, with at most max_in_flight items waiting in the workers
+        """
+        stats = stats if stats is not None else IPCStats()
+        in_flight = threading.BoundedSemaphore(max_in_flight or self.num_workers * 2)
+        sent = [0]
+        feeder_errors: List[BaseException] = []
+        fed = threading.Event()
+        self.start()
+        with self._lock:
+            batch_id = next(self._batch_ids)
+
+            def feed() -> None:
+                try:
+                    for key, value in items:
+                        in_flight.acquire()
+                        payload = pickle.dumps((func, [(key, value)]), pickle.HIGHEST_PROTOCOL)
+                        self.task_queue.put((batch_id, payload, time.time()))
+                        stats.items += 1
+                        stats.messages_sent += 1
+                        stats.bytes_sent += len(payload)
+                        sent[0] += 1
+                except BaseException as e:
+                    feeder_errors.append(e)
+                finally:
+                    fed.set()
+
+            feeder = threading.Thread(target=feed, name="WorkerPoolFeeder", daemon=True)
+            feeder.start()
+            received = 0
+            while not (fed.is_set() and received == sent[0]):
+                message = self._poll_result(STREAM_POLL_INTERVAL)
+                if message is None or message[0] != batch_id:
+                    continue
+                received += 1
+                in_flight.release()
+                stats.messages_received += 1
+                stats.bytes_received += len(message[1])
+                stats.record_timing(message[2])
+                yield from pickle.loads(message[1])
+            feeder.join()
+            if feeder_errors:
+                raise feeder_errors[0]
+
+    def shutdown(self, timeout: Optional[float] = 10) -> None:
+        if not self.is_running:
+            return
+        for _ in self.workers:
+            self.task_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                logger.warning("Worker %s did not stop in time, terminating", worker.pid)
+                worker.terminate()
+                worker.join()
+        self.workers = []
+
+    def __enter__(self) -> "WorkerPool":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.shutdown()
 
 
 class MultiprocessingTaskManager:
-    def __init__(self, data_dict: Dict[Any, Any], calc_func: Callable[[Any], Any], num_workers: int = 4) -> None:
+    def __init__(
+        self,
+        data_dict: Dict[Any, Any],
+        calc_func: Callable[[Any], Any],
+        num_workers: int = 4,
+        pool: Optional[WorkerPool] = None,
+        chunk_size: Optional[int] = None,
+        result_store: Optional["ResultStore"] = None,
+        fingerprints: Optional[Dict[Any, str]] = None,
+    ) -> None:
         self.data_dict: Dict[Any, Any] = data_dict
         self.calc_func: Callable[[Any], Any] = calc_func
         self.num_workers: int = num_workers
-        self.task_queue: Queue = Queue()
-        self.result_queue: Queue = Queue()
-
-    def _start_workers(self) -> List[Worker]:
-        workers = []
-        for _ in range(self.num_workers):
-            worker = Worker(self.calc_func, self.task_queue, self.result_queue)
-            workers.append(worker)
-            worker.start()
-        return workers
+        self.pool: Optional[WorkerPool] = pool
+        self.chunk_size: Optional[int] = chunk_size
+        self.result_store: Optional["ResultStore"] = result_store
+        # content hashes of the inputs for the result store keys, the inputs are hashed when missing
+        self.fingerprints: Dict[Any, str] = fingerprints or {}
+        self.store_keys: Dict[Any, str] = {}
+        self.ipc_stats: IPCStats = IPCStats(stage=type(self).__name__)
+
+    def _collect_results(self, results_iter: Iterable[Tuple[Any, Any]]) -> Dict[Any, Any]:
+        results = {}
+        for key, result in results_iter:
+            if not result:
+                logger.warning("Input data for key '%s' is empty...", key)
+                continue
+            results[key] = result
+            self._on_result(key, result)
+        return results
 
-    def _send_tasks(self) -> None:
-        for key, value in self.data_dict.items():
-            self.task_queue.put((key, value))
-        for _ in range(self.num_workers):
-            self.task_queue.put((None, None))
+    def _on_result(self, key: Any, result: Any) -> None:
+        """Called for every result as it arrives, stored ones included"""
 
-    def _collect_results(self) -> Dict[Any, Any]:
-        results = {}
-        finished_workers = 0
-        while finished_workers < self.num_workers:
-            key, result = self.result_queue.get()
-            if key is None:
-                finished_workers += 1
-            else:
-                if not result:
-                    logger.warning("Input data for key '%s' is empty...", key)
-                    continue
-                else:
-                    results[key] = result
+    def _run(
+        self, pool: WorkerPool, func: Optional[Callable[[Any], Any]], data_dict: Dict[Any, Any]
+    ) -> Dict[Any, Any]:
+        self.ipc_stats = IPCStats(stage=type(self).__name__)
+        results = self._collect_results(pool.run_batch(func, data_dict.items(), self.chunk_size, self.ipc_stats))
+        logger.info("IPC stats: %s", self.ipc_stats)
         return results
 
-    def _join_workers(self, workers: List[Worker]) -> None:
-        for worker in workers:
-            worker.join()
+    def _dispatch(self, func: Callable[[Any], Any], data_dict: Dict[Any, Any]) -> Dict[Any, Any]:
+        if self.pool is not None:
+            return self._run(self.pool, func, data_dict)
+        # no shared pool: workers are bound to func at fork and live for this call only
+        with WorkerPool(self.num_workers, func) as pool:
+            return self._run(pool, None, data_dict)
+
+    def _compute(self, data_dict: Dict[Any, Any]) -> Dict[Any, Any]:
+        return self._dispatch(self.calc_func, data_dict)
 
     def execute(self) -> Dict[Any, Any]:
-        workers = self._start_workers()
-        self._send_tasks()
-        results = self._collect_results()
-        self._join_workers(workers)
+        if self.result_store is None:
+            return self._compute(self.data_dict)
+
+        from src.result_store import ResultStore, analyzer_fingerprint
+
+        # only inputs without a stored result for the current analyzer parameters go to the workers
+        stage = type(self).__name__
+        params = analyzer_fingerprint()
+        self.store_keys = store_keys = {
+            key: ResultStore.make_key(stage, self.calc_func, value, params, self.fingerprints.get(key))
+            for key, value in self.data_dict.items()
+        }
+        stored = self.result_store.get_many(store_keys.values())
+        results = {key: stored[store_key] for key, store_key in store_keys.items() if store_key in stored}
+        for key, result in results.items():
+            self._on_result(key, result)
+        pending = {key: value for key, value in self.data_dict.items() if key not in results}
+        logger.info("Stage %s reuses %s of %s stored results", stage, len(results), len(store_keys))
+
+        computed = self._compute(pending) if pending else {}
+        self.result_store.put_many({store_keys[key]: result for key, result in computed.items()})
+        results.update(computed)
         return results
 
 
 class DataCalculationTask(MultiprocessingTaskManager):
-    def __init__(self, data_dict: Dict[Any, Any], calc_func: Callable[[Any], Any], num_workers: int = 4) -> None:
-        super().__init__(data_dict, calc_func, num_workers)
+    def __init__(
+        self,
+        data_dict: Dict[Any, Any],
+        calc_func: Callable[[Any], Any],
+        num_workers: int = 4,
+        pool: Optional[WorkerPool] = None,
+        chunk_size: Optional[int] = None,
+        transport: str = TRANSPORT_PICKLE,
+        result_store: Optional["ResultStore"] = None,
+        fingerprints: Optional[Dict[Any, str]] = None,
+    ) -> None:
+        super().__init__(data_dict, calc_func, num_workers, pool, chunk_size, result_store, fingerprints)
+        self.transport: str = transport
+
+    def _compute(self, data_dict: Dict[Any, Any]) -> Dict[Any, Any]:
+        if self.transport == TRANSPORT_SHARED_MEMORY:
+            # workers run the columnar equivalent of analyze_json on offsets into the shared block
+            from src.shm_transport import SharedForecastStore, analyze_shared
+
+            with SharedForecastStore(data_dict) as store:
+                return self._dispatch(analyze_shared, store.refs)
+        return super()._compute(data_dict)
 
 
 class DataAnalyzingTask(MultiprocessingTaskManager):
-    def __init__(self, data_dict: Dict[str, Any], num_workers: int = 4) -> None:
-        super().__init__(data_dict, self.calculate_city_data, num_workers)
+    def __init__(
+        self,
+        data_dict: Dict[str, Any],
+        num_workers: int = 4,
+        pool: Optional[WorkerPool] = None,
+        chunk_size: Optional[int] = None,
+        result_store: Optional["ResultStore"] = None,
+        fingerprints: Optional[Dict[Any, str]] = None,
+    ) -> None:
+        super().__init__(
+            data_dict, self.calculate_city_data, num_workers, pool, chunk_size, result_store, fingerprints
+        )
+        self.ranking: CityRanking = CityRanking()
+        self.results: Optional[Dict[str, Any]] = None
+
+    def _on_result(self, key: Any, result: Any) -> None:
+        self.ranking.update(key, result)
+
+    def execute(self) -> Dict[str, Any]:
+        self.ranking = CityRanking()
+        self.results = super().execute()
+        return self.results
 
     @staticmethod
     def calculate_city_data(input_data: Dict[str, Any]) -> Dict[str, Optional[float]]:
@@ -123,19 +623,21 @@ class DataAnalyzingTask(MultiprocessingTaskManager):
             return {}
 
         days_data = input_data["days"]
-        logger.info("Days_data: %s", days_data)
+        logger.debug("Days_data: %s", days_data, extra=PAYLOAD)
 
         total_temp_avg = 0
         total_relevant_cond_hours = 0
         valid_temp_days = 0
 
         for day in days_data:
-            if "temp_avg" in day and day["temp_avg"] is not None:
-                total_temp_avg += day["temp_avg"]
+            if not isinstance(day, DaySummary):
+                day = DaySummary.from_json(day)
+            if day.temp_avg is not None:
+                total_temp_avg += day.temp_avg
                 valid_temp_days += 1
 
-            if "relevant_cond_hours" in day and day["relevant_cond_hours"] is not None:
-                total_relevant_cond_hours += day["relevant_cond_hours"]
+            if day.relevant_cond_hours is not None:
+                total_relevant_cond_hours += day.relevant_cond_hours
 
         avg_temp = total_temp_avg / valid_temp_days if valid_temp_days else None
 
@@ -143,13 +645,9 @@ class DataAnalyzingTask(MultiprocessingTaskManager):
 
     def find_most_favorable_cities(self, results: Dict[str, Any]) -> List[str]:
         try:
-            ranked_cities = sorted(
-                results.items(),
-                key=lambda x: (x[1].get("average_temperature", 0), x[1].get("total_relevant_condition_hours", 0)),
-                reverse=True,
-            )
-            ranked_city_names = [city for city, _ in ranked_cities]
-            return ranked_city_names
+            # results of execute were ranked while the workers produced them, anything else is ranked here
+            ranking = self.ranking if results is self.results else CityRanking.from_results(results)
+            return ranking.ordered()
         except KeyError as e:
             logger.exception("Key error encountered: %s. Check the data format.", e)
             return []
@@ -157,60 +655,195 @@ class DataAnalyzingTask(MultiprocessingTaskManager):
             logger.exception("An unexpected error occurred: %s", e)
             return []
 
+    def top_cities(self, k: int = 1) -> List[str]:
+        """The k most favorable cities of the last execute, with every city tied with the k-th"""
+        return self.ranking.top(k)
+
     def execute_and_rank(self) -> Tuple[Dict[str, Any], List[str]]:
         results = self.execute()
         return results, self.find_most_favorable_cities(results)
 
 
+@contextmanager
+def replaced_on_success(filename: str) -> Iterator[str]:
+    """Path of a temporary file that replaces filename once the block succeeds, and is removed if it fails"""
+    temp_path = f"{filename}.{os.getpid()}.tmp"
+    try:
+        yield temp_path
+        os.replace(temp_path, filename)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
 class DataAggregationTask:
+    """
+    Output rows, one per city-day in ranking order, are produced lazily and written WRITE_CHUNK_ROWS at a time,
+    so memory stays bounded by a chunk whatever the number of cities. A write that fails returns False and leaves
+    the previous output file, if any, as it was.
+    """
+
+    @staticmethod
+    def iter_rows(
+        original_data: Dict[str, Any], aggregated_data: Dict[str, Dict[str, Any]], ranked_cities: List[str]
+    ) -> Iterator[Tuple[Any, ...]]:
+        for city in ranked_cities:
+            avg_temp = aggregated_data.get(city, {}).get("average_temperature", 0)
+            total_hours = aggregated_data.get(city, {}).get("total_relevant_condition_hours", 0)
+
+            for day in original_data.get(city, {}).get("days", []):
+                if not isinstance(day, DaySummary):
+                    day = DaySummary.from_json(day)
+                yield (
+                    city,
+                    avg_temp,
+                    total_hours,
+                    day.date,
+                    day.hours_start or 0,
+                    day.hours_end or 0,
+                    day.hours_count or 0,
+                    day.temp_avg or 0,
+                    day.relevant_cond_hours or 0,
+                )
+
+    @classmethod
+    def iter_chunks(
+        cls,
+        original_data: Dict[str, Any],
+        aggregated_data: Dict[str, Dict[str, Any]],
+        ranked_cities: List[str],
+        chunk_rows: int = WRITE_CHUNK_ROWS,
+    ) -> Iterator["np.ndarray"]:
+        import numpy as np
+
+        dtype = output_dtype()
+        rows = cls.iter_rows(original_data, aggregated_data, ranked_cities)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_rows))
+            if not chunk:
+                return
+            yield np.array(chunk, dtype=dtype)
+
+    @staticmethod
+    def count_rows(original_data: Dict[str, Any], ranked_cities: List[str]) -> int:
+        return sum(len(original_data.get(city, {}).get("days", [])) for city in ranked_cities)
+
     @staticmethod
+    def format_csv_row(row: Tuple[Any, ...]) -> str:
+        # the text np.savetxt(fmt="%s") produced for OUTPUT_COLUMNS: strings cut to the field width, repr of floats
+        city, avg_temp, total_hours, date, hours_start, hours_end, hours_count, temp_avg, cond_hours = row
+        return (
+            f"{str(city)[:50]},{float('nan') if avg_temp is None else float(avg_temp)},{int(total_hours)},"
+            f"{str(date)[:10]},{int(hours_start)},{int(hours_end)},{int(hours_count)},"
+            f"{float(temp_avg)},{int(cond_hours)}\n"
+        )
+
+    @classmethod
     def write_aggregated_data_to_csv(
+        cls,
         original_data: Dict[str, Any],
         aggregated_data: Dict[str, Dict[str, Any]],
         ranked_cities: List[str],
         filename: str,
-    ) -> None:
+    ) -> bool:
         try:
-            csv_data = []
-            for city in ranked_cities:
-                avg_temp = aggregated_data.get(city, {}).get("average_temperature", 0)
-                total_hours = aggregated_data.get(city, {}).get("total_relevant_condition_hours", 0)
-
-                for day in original_data.get(city, {}).get("days", []):
-                    row = (
-                        city,
-                        avg_temp,
-                        total_hours,
-                        day.get("date", ""),
-                        day.get("hours_start", 0) or 0,
-                        day.get("hours_end", 0) or 0,
-                        day.get("hours_count", 0) or 0,
-                        day.get("temp_avg", 0) or 0,
-                        day.get("relevant_cond_hours", 0) or 0,
-                    )
-                    csv_data.append(row)
-
-            dtype = [
-                ("City", "U50"),
-                ("Avg Temperature", "f8"),
-                ("Total Cond Hours", "i8"),
-                ("Date", "U10"),
-                ("Hours Start", "i8"),
-                ("Hours End", "i8"),
-                ("Hours Count", "i8"),
-                ("Daily Avg Temp", "f8"),
-                ("Daily Cond Hours", "i8"),
-            ]
-            structured_array = np.array(csv_data, dtype=dtype)
-
-            # Write to CSV file
-            header = (
-                "City,Avg Temperature,Total Cond Hours,Date,Hours Start,"
-                "Hours End,Hours Count,Daily Avg Temp,Daily Cond Hours"
-            )
-            np.savetxt(filename, structured_array, delimiter=",", fmt="%s", header=header, comments="")
+            rows = cls.iter_rows(original_data, aggregated_data, ranked_cities)
+            with replaced_on_success(filename) as temp_path, open(temp_path, "w") as file:
+                file.write(",".join(name for name, _ in OUTPUT_COLUMNS) + "\n")
+                while True:
+                    chunk = [cls.format_csv_row(row) for row in itertools.islice(rows, WRITE_CHUNK_ROWS)]
+                    if not chunk:
+                        break
+                    file.writelines(chunk)
+            return True
+
+        except KeyError as e:
+            logger.exception("Key error encountered: %s. Check your data format.", e)
+        except Exception as e:
+            logger.exception("An unexpected error occurred: %s", e)
+        return False
+
+    @classmethod
+    def write_aggregated_data_to_npy(
+        cls,
+        original_data: Dict[str, Any],
+        aggregated_data: Dict[str, Dict[str, Any]],
+        ranked_cities: List[str],
+        filename: str,
+    ) -> bool:
+        """Structured OUTPUT_DTYPE array, readable without parsing by np.load(filename, mmap_mode="r")"""
+        import numpy as np
+
+        try:
+            total_rows = cls.count_rows(original_data, ranked_cities)
+            header = {
+                "descr": np.lib.format.dtype_to_descr(output_dtype()),
+                "fortran_order": False,
+                "shape": (total_rows,),
+            }
+            with replaced_on_success(filename) as temp_path, open(temp_path, "wb") as file:
+                np.lib.format.write_array_header_1_0(file, header)
+                written_rows = 0
+                for chunk in cls.iter_chunks(original_data, aggregated_data, ranked_cities):
+                    file.write(chunk.tobytes())
+                    written_rows += len(chunk)
+                if written_rows != total_rows:
+                    raise ValueError(f"Wrote {written_rows} rows, the header promises {total_rows}")
+            return True
 
         except KeyError as e:
             logger.exception("Key error encountered: %s. Check your data format.", e)
         except Exception as e:
             logger.exception("An unexpected error occurred: %s", e)
+        return False
+
+    @classmethod
+    def write_aggregated_data_to_parquet(
+        cls,
+        original_data: Dict[str, Any],
+        aggregated_data: Dict[str, Dict[str, Any]],
+        ranked_cities: List[str],
+        filename: str,
+    ) -> bool:
+        """Parquet file with one row group per chunk, requires pyarrow"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            logger.error("Parquet output requires pyarrow, which is not installed")
+            return False
+
+        try:
+            output = output_dtype()
+            fields = []
+            for name in output.names:
+                dtype = output[name]
+                fields.append((name, pa.string() if dtype.kind == "U" else pa.from_numpy_dtype(dtype)))
+            schema = pa.schema(fields)
+            with replaced_on_success(filename) as temp_path, pq.ParquetWriter(temp_path, schema) as writer:
+                for chunk in cls.iter_chunks(original_data, aggregated_data, ranked_cities):
+                    columns = [pa.array(chunk[name], type=schema.field(name).type) for name in output.names]
+                    writer.write_batch(pa.record_batch(columns, schema=schema))
+            return True
+
+        except KeyError as e:
+            logger.exception("Key error encountered: %s. Check your data format.", e)
+        except Exception as e:
+            logger.exception("An unexpected error occurred: %s", e)
+        return False
+
+    @classmethod
+    def write_aggregated_data(
+        cls,
+        original_data: Dict[str, Any],
+        aggregated_data: Dict[str, Dict[str, Any]],
+        ranked_cities: List[str],
+        filename: str,
+        output_format: str = OUTPUT_CSV,
+    ) -> bool:
+        writers = {
+            OUTPUT_CSV: cls.write_aggregated_data_to_csv,
+            OUTPUT_NPY: cls.write_aggregated_data_to_npy,
+            OUTPUT_PARQUET: cls.write_aggregated_data_to_parquet,
+        }
+        return writers[output_format](original_data, aggregated_data, ranked_cities, filename)
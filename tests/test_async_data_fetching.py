@@ -0,0 +1,75 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from tasks import AsyncDataFetchingTask
+from benchmarks.http_stand_in import FaultProfile, StandInServer
+from external.async_client import AsyncYandexWeatherAPI
+from external.client import FetchError
+
+
+async def mock_fetch_url(url, timeout):
+    if url.endswith("slow"):
+        await asyncio.sleep(5)
+    return f"Weather from {url}"
+
+
+def test_async_data_fetching_task():
+    urls = {"CITY1": "http://example.com/city1", "CITY2": "http://example.com/city2"}
+    task = AsyncDataFetchingTask(urls, mock_fetch_url)
+
+    results = task.fetch_all()
+    assert results == {city: f"Weather from {url}" for city, url in urls.items()}
+
+
+def test_async_data_fetching_task_drops_timed_out_city():
+    urls = {"CITY1": "http://example.com/city1", "SLOW": "http://example.com/slow"}
+    task = AsyncDataFetchingTask(urls, mock_fetch_url, timeout=0.1)
+
+    results = task.fetch_all()
+    assert list(results) == ["CITY1"]
+
+
+def test_async_data_fetching_task_total_timeout():
+    urls = {"CITY1": "http://example.com/city1", "SLOW": "http://example.com/slow"}
+    task = AsyncDataFetchingTask(urls, mock_fetch_url, total_timeout=0.1)
+
+    results = task.fetch_all()
+    assert list(results) == ["CITY1"]
+
+
+def test_async_client_reuses_connections():
+    with StandInServer(payload=b'{"forecasts": []}') as server:
+        urls = server.city_urls(f"CITY{i}" for i in range(20))
+        api = AsyncYandexWeatherAPI(max_connections_per_host=2)
+        task = AsyncDataFetchingTask(urls, api.get_forecasting, max_concurrency=4, on_close=api.close)
+
+        results = task.fetch_all()
+
+        assert results == {city: {"forecasts": []} for city in urls}
+        assert server.counters["requests"] == 20
+        assert server.counters["connections"] <= 2
+
+
+def test_async_client_reports_nonstandard_status():
+    faults = FaultProfile(error_rate=1.0, error_status=599)
+    with StandInServer(payload=b'{"forecasts": []}', faults=faults) as server:
+        url = server.url_for("CITY0")
+        api = AsyncYandexWeatherAPI()
+
+        async def fetch():
+            try:
+                return await api.get_forecasting(url)
+            finally:
+                await api.close()
+
+        with pytest.raises(FetchError) as raised:
+            asyncio.run(fetch())
+
+    assert raised.value.url == url
+    assert raised.value.status == 599
+    assert raised.value.retryable
@@ -0,0 +1,50 @@
+import gc
+import json
+import pickle
+from pathlib import Path
+import tracemalloc
+import unittest
+
+from benchmarks.http_stand_in import StandInServer
+from external.analyzer import analyze_json
+from external.client import YandexWeatherAPI
+from external.compact import CompactHour, decode_compact_forecast
+
+RESPONSE_PATH = Path(__file__).parent.parent / "data" / "examples" / "response.json"
+
+
+def retained_bytes(loads, body, copies=10):
+    gc.collect()
+    tracemalloc.start()
+    decoded = [loads(body) for _ in range(copies)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del decoded
+    return current / copies
+
+
+class TestCompactForecast(unittest.TestCase):
+    def setUp(self):
+        self.body = RESPONSE_PATH.read_text()
+
+    def test_keeps_only_analyzed_fields(self):
+        data = decode_compact_forecast(self.body)
+
+        self.assertEqual(list(data), ["forecasts"])
+        self.assertEqual(set(data["forecasts"][0]), {"date", "hours"})
+        self.assertEqual(data["forecasts"][0]["hours"][0], CompactHour(0, 10, "overcast"))
+        self.assertEqual(pickle.loads(pickle.dumps(data)), data)
+
+    def test_analyze_json_accepts_compact_data(self):
+        expected = analyze_json(json.loads(self.body))
+        self.assertEqual(analyze_json(decode_compact_forecast(self.body)), expected)
+
+    def test_memory_per_city_drops_by_an_order_of_magnitude(self):
+        full = retained_bytes(json.loads, self.body)
+        compact = retained_bytes(decode_compact_forecast, self.body)
+        self.assertLess(compact * 10, full)
+
+    def test_client_fetches_compact_data(self):
+        with StandInServer() as server:
+            data = YandexWeatherAPI.get_compact_forecasting(server.url_for("MOSCOW"))
+        self.assertEqual(data, decode_compact_forecast(self.body))
@@ -10,6 +10,7 @@ import numpy as np
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from tasks import DataAggregationTask
+from external.analyzer import DaySummary
 
 
 class TestDataAggregationTask(unittest.TestCase):
@@ -39,4 +40,100 @@ class TestDataAggregationTask(unittest.TestCase):
                 self.assertIn("City2", lines[2])
 
         def tearDown(self):
-            os.remove(self.temp_file_name)
\ No newline at end of file
+            os.remove(self.temp_file_name)
+
+
+class TestStreamingWriters(unittest.TestCase):
+    def setUp(self):
+        self.original_data = {
+            "City1": {"days": [{"date": "2023-01-01", "temp_avg": 20, "relevant_cond_hours": 5}]},
+            "City2": {
+                "days": [
+                    {"date": "2023-01-02", "hours_start": 9, "hours_end": 19, "hours_count": 11, "temp_avg": 25.5},
+                    {"date": "2023-01-03", "temp_avg": None, "relevant_cond_hours": 3},
+                ]
+            },
+        }
+        self.aggregated_data = {
+            "City1": {"average_temperature": 20, "total_relevant_condition_hours": 5},
+            "City2": {"average_temperature": None, "total_relevant_condition_hours": 3},
+        }
+        self.ranked_cities = ["City2", "City1"]
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_csv_matches_structured_array_text(self):
+        filename = os.path.join(self.directory.name, "output.csv")
+        with patch("tasks.WRITE_CHUNK_ROWS", 1):
+            DataAggregationTask.write_aggregated_data_to_csv(
+                self.original_data, self.aggregated_data, self.ranked_cities, filename
+            )
+
+        with open(filename) as file:
+            self.assertEqual(
+                file.read().splitlines(),
+                [
+                    "City,Avg Temperature,Total Cond Hours,Date,Hours Start,Hours End,Hours Count,"
+                    "Daily Avg Temp,Daily Cond Hours",
+                    "City2,nan,3,2023-01-02,9,19,11,25.5,0",
+                    "City2,nan,3,2023-01-03,0,0,0,0.0,3",
+                    "City1,20.0,5,2023-01-01,0,0,0,20.0,5",
+                ],
+            )
+
+    def test_records_write_the_same_rows_as_dicts(self):
+        records = {
+            city: {"days": [DaySummary.from_json(day) for day in data["days"]]}
+            for city, data in self.original_data.items()
+        }
+
+        self.assertEqual(
+            list(DataAggregationTask.iter_rows(records, self.aggregated_data, self.ranked_cities)),
+            list(DataAggregationTask.iter_rows(self.original_data, self.aggregated_data, self.ranked_cities)),
+        )
+
+    def test_npy_loads_as_memory_mapped_structured_array(self):
+        filename = os.path.join(self.directory.name, "output.npy")
+        DataAggregationTask.write_aggregated_data(
+            self.original_data, self.aggregated_data, self.ranked_cities, filename, "npy"
+        )
+
+        output = np.load(filename, mmap_mode="r")
+        self.assertEqual(len(output), 3)
+        self.assertEqual(list(output["City"]), ["City2", "City2", "City1"])
+        self.assertEqual(list(output["Daily Avg Temp"]), [25.5, 0.0, 20.0])
+        self.assertEqual(output["Date"][2], "2023-01-01")
+
+    def test_parquet_round_trip(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        filename = os.path.join(self.directory.name, "output.parquet")
+        DataAggregationTask.write_aggregated_data(
+            self.original_data, self.aggregated_data, self.ranked_cities, filename, "parquet"
+        )
+
+        table = pq.read_table(filename)
+        self.assertEqual(table.column("City").to_pylist(), ["City2", "City2", "City1"])
+        self.assertEqual(table.column("Total Cond Hours").to_pylist(), [3, 3, 5])
+
+    def test_failed_write_keeps_the_previous_output(self):
+        self.aggregated_data["City1"]["total_relevant_condition_hours"] = None
+        for output_format in ("csv", "npy"):
+            with self.subTest(output_format=output_format):
+                filename = os.path.join(self.directory.name, f"output.{output_format}")
+                with open(filename, "w") as file:
+                    file.write("previous run")
+
+                with patch("tasks.WRITE_CHUNK_ROWS", 1), self.assertLogs("tasks", level="ERROR"):
+                    DataAggregationTask.write_aggregated_data(
+                        self.original_data, self.aggregated_data, self.ranked_cities, filename, output_format
+                    )
+
+                with open(filename) as file:
+                    self.assertEqual(file.read(), "previous run")
+                self.assertEqual(os.listdir(self.directory.name), [f"output.{output_format}"])
+                os.remove(filename)
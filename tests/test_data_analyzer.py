@@ -1,3 +1,4 @@
+import pickle
 import sys
 from pathlib import Path
 import unittest
@@ -6,6 +7,7 @@ from unittest.mock import Mock
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from tasks import DataAnalyzingTask
+from external.analyzer import DaySummary, analyze_json
 
 
 class TestDataAnalyzingTask(unittest.TestCase):
@@ -39,4 +41,49 @@ class TestDataAnalyzingTask(unittest.TestCase):
         self.assertIsNotNone(results)
         self.assertIsNotNone(ranked_cities)
         self.assertIn("City1", ranked_cities)
-        self.assertIn("City2", ranked_cities)
\ No newline at end of file
+        self.assertIn("City2", ranked_cities)
+
+
+class TestDaySummary(unittest.TestCase):
+    def setUp(self):
+        self.day = {
+            "date": "2022-05-26",
+            "hours_start": 9,
+            "hours_end": 19,
+            "hours_count": 11,
+            "temp_avg": 17.727,
+            "relevant_cond_hours": 7,
+        }
+
+    def test_reads_like_the_dict(self):
+        summary = DaySummary.from_json(self.day)
+
+        self.assertEqual(summary.to_json(), self.day)
+        self.assertEqual(summary, self.day)
+        self.assertEqual(summary["temp_avg"], 17.727)
+        self.assertEqual(summary.get("missing", 0), 0)
+        self.assertIn("hours_count", summary)
+        with self.assertRaises(KeyError):
+            summary["missing"]
+
+    def test_pickle(self):
+        summary = DaySummary.from_json(self.day)
+        dumped = pickle.dumps([summary] * 2, pickle.HIGHEST_PROTOCOL)
+
+        self.assertEqual(pickle.loads(dumped), [summary] * 2)
+        self.assertLess(len(pickle.dumps(summary)), len(pickle.dumps(self.day)))
+
+    def test_analyze_json_returns_summaries(self):
+        payload = {"forecasts": [{"date": "2022-05-26", "hours": [{"hour": "12", "temp": 20, "condition": "clear"}]}]}
+        days = analyze_json(payload)["days"]
+
+        self.assertIsInstance(days[0], DaySummary)
+        self.assertEqual(days[0].to_json()["temp_avg"], 20)
+
+    def test_records_and_dicts_mixed(self):
+        data = {"days": [DaySummary.from_json(self.day), {"temp_avg": 20.273, "relevant_cond_hours": 3}]}
+
+        self.assertEqual(
+            DataAnalyzingTask.calculate_city_data(data),
+            {"average_temperature": 19.0, "total_relevant_condition_hours": 10},
+        )
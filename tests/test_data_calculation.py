@@ -1,3 +1,5 @@
+import copy
+import json
 import sys
 from pathlib import Path
 import unittest
@@ -7,6 +9,9 @@ from multiprocessing import Queue
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from tasks import DataCalculationTask
+from external.analyzer import analyze_json
+
+RESPONSE_PATH = Path(__file__).parent.parent / "data" / "examples" / "response.json"
 
 
 def mock_calculation_function(input_data):
@@ -22,4 +27,40 @@ class TestDataCalculationTask(unittest.TestCase):
         results = task.execute()
 
         expected_results = {1: 20, 2: 40, 3: 60}
-        self.assertEqual(results, expected_results)
\ No newline at end of file
+        self.assertEqual(results, expected_results)
+
+
+class TestDataCalculationTaskChunking(unittest.TestCase):
+    def setUp(self):
+        self.sample_data = {i: i for i in range(10)}
+
+    def test_fixed_chunk_size(self):
+        task = DataCalculationTask(self.sample_data, mock_calculation_function, chunk_size=3)
+        results = task.execute()
+
+        self.assertEqual(results, {i: i * 2 for i in range(1, 10)})
+        self.assertEqual(task.ipc_stats.items, 10)
+        self.assertEqual(task.ipc_stats.messages_sent, 4)
+        self.assertEqual(task.ipc_stats.messages_received, 4)
+        self.assertGreater(task.ipc_stats.bytes_sent, 0)
+        self.assertGreater(task.ipc_stats.bytes_received, 0)
+
+    def test_results_of_a_chunk_are_distinct(self):
+        payload = json.loads(RESPONSE_PATH.read_text())
+        payloads = {}
+        for city, days in zip("ABCD", (5, 3, 2, 1)):
+            payloads[city] = copy.deepcopy(payload)
+            payloads[city]["forecasts"] = payloads[city]["forecasts"][:days]
+
+        results = DataCalculationTask(payloads, analyze_json, chunk_size=4).execute()
+
+        days = {city: len(result["days"]) for city, result in results.items()}
+        self.assertEqual(days, {"A": 5, "B": 3, "C": 2, "D": 1})
+        self.assertEqual(results, {city: analyze_json(data) for city, data in payloads.items()})
+
+    def test_adaptive_chunk_size(self):
+        task = DataCalculationTask({i: i for i in range(100)}, mock_calculation_function, num_workers=2)
+        task.execute()
+
+        self.assertEqual(task.ipc_stats.items, 100)
+        self.assertEqual(task.ipc_stats.messages_sent, 15)
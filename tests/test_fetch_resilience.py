@@ -0,0 +1,229 @@
+import asyncio
+import random
+import time
+import unittest
+from unittest.mock import Mock
+
+from benchmarks.http_stand_in import FaultProfile, StandInServer
+from benchmarks.synthetic import ForecastGenerator, city_names
+from external.async_client import AsyncYandexWeatherAPI
+from external.client import FetchError, YandexWeatherAPI
+from external.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    AsyncResilientFetcher,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientFetcher,
+    RetryPolicy,
+)
+from src.instrumentation import Instrumentation
+from src.tasks import AsyncDataFetchingTask, DataFetchingTask
+
+FAST_RETRY = RetryPolicy(attempts=8, base_delay=0.001, max_delay=0.01)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_full_jitter_within_capped_backoff(self):
+        policy = RetryPolicy(attempts=5, base_delay=0.1, max_delay=0.3)
+        rng = random.Random(1)
+
+        for retry, cap in ((1, 0.1), (2, 0.2), (3, 0.3), (4, 0.3)):
+            delays = [policy.delay(retry, rng) for _ in range(200)]
+            self.assertTrue(all(0 <= delay <= cap for delay in delays))
+            self.assertGreater(max(delays), cap * 0.8)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_fails_fast_and_recovers_through_a_probe(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker("host", failure_ratio=0.5, window=10, min_calls=4, reset_timeout=5, clock=clock)
+        for success in (True, False, False, True):
+            breaker.before_call()
+            breaker.record(success)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+
+        clock.now = 5
+        breaker.before_call()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        # one probe at a time
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+        breaker.record(False)
+        self.assertEqual(breaker.state, OPEN)
+
+        clock.now = 10
+        breaker.before_call()
+        breaker.record(True)
+        self.assertEqual(breaker.state, CLOSED)
+
+
+class TestResilientFetcher(unittest.TestCase):
+    def setUp(self):
+        self.generator = ForecastGenerator(days=2, lean=True)
+        self.instrumentation = Instrumentation()
+
+    def test_retries_recover_from_server_errors(self):
+        faults = FaultProfile(error_rate=0.3, seed=2)
+        with StandInServer(self.generator.payload_source(), faults=faults) as server:
+            urls = server.city_urls(city_names(30))
+            fetcher = ResilientFetcher(
+                YandexWeatherAPI.get_forecasting,
+                retry=FAST_RETRY,
+                breaker_factory=None,
+                count=self.instrumentation.count,
+                seed=0,
+            )
+            fetched = DataFetchingTask(urls, fetcher, max_workers=4).fetch_all()
+
+        self.assertEqual(set(fetched), set(urls))
+        self.assertEqual(fetched["CITY000003"], self.generator.forecast("CITY000003"))
+        self.assertGreater(server.counters["errors"], 0)
+        self.assertEqual(self.instrumentation.counters["fetch.retries"], server.counters["errors"])
+
+    def test_client_errors_are_not_retried(self):
+        with StandInServer(lambda path: None) as server:
+            fetcher = ResilientFetcher(YandexWeatherAPI.get_forecasting, retry=FAST_RETRY)
+            with self.assertRaises(FetchError) as raised:
+                fetcher(server.url_for("missing"), 1)
+
+        self.assertEqual(raised.exception.status, 404)
+        self.assertFalse(raised.exception.retryable)
+        self.assertEqual(server.counters["requests"], 1)
+
+    def test_circuit_breaker_stops_calling_a_failing_host(self):
+        faults = FaultProfile(error_rate=1.0)
+        with StandInServer(self.generator.payload_source(), faults=faults) as server:
+            fetcher = ResilientFetcher(
+                YandexWeatherAPI.get_forecasting,
+                retry=RetryPolicy(attempts=1),
+                breaker_factory=lambda host: CircuitBreaker(host, min_calls=5, reset_timeout=60),
+                count=self.instrumentation.count,
+            )
+            for city in city_names(20):
+                with self.assertRaises(FetchError):
+                    fetcher(server.url_for(city), 1)
+
+        self.assertEqual(server.counters["requests"], 5)
+        self.assertEqual(self.instrumentation.counters["fetch.circuit_open"], 15)
+
+    def test_circuit_breaker_is_opt_in(self):
+        faults = FaultProfile(error_rate=1.0)
+        with StandInServer(self.generator.payload_source(), faults=faults) as server:
+            fetcher = ResilientFetcher(YandexWeatherAPI.get_forecasting, retry=RetryPolicy(attempts=1))
+            for city in city_names(20):
+                with self.assertRaises(FetchError):
+                    fetcher(server.url_for(city), 1)
+
+        self.assertEqual(server.counters["requests"], 20)
+        self.assertEqual(fetcher.breakers, {})
+
+    def test_fetching_task_closes_the_fetcher(self):
+        with StandInServer(self.generator.payload_source()) as server:
+            fetcher = ResilientFetcher(YandexWeatherAPI.get_forecasting)
+            fetcher.close = Mock(wraps=fetcher.close)
+            urls = server.city_urls(city_names(3))
+            fetched = DataFetchingTask(urls, fetcher, on_close=fetcher.close).fetch_all()
+
+        self.assertEqual(set(fetched), set(urls))
+        fetcher.close.assert_called_once_with()
+
+    def test_hedged_requests_cut_the_slow_tail(self):
+        faults = FaultProfile(latency=0.005, slow_rate=0.1, slow_latency=1.0, seed=4)
+        with StandInServer(self.generator.payload_source(), faults=faults) as server:
+            fetcher = ResilientFetcher(
+                YandexWeatherAPI.get_forecasting,
+                hedge_quantile=0.8,
+                hedge_min_samples=5,
+                count=self.instrumentation.count,
+            )
+            for city in city_names(5):
+                # warm-up: latencies of the host for the hedging threshold
+                fetcher(server.url_for(city), 5)
+            started = time.perf_counter()
+            for city in city_names(40):
+                self.assertEqual(fetcher(server.url_for(city), 5), self.generator.forecast(city))
+            elapsed = time.perf_counter() - started
+            fetcher.close()
+
+        self.assertGreater(self.instrumentation.counters["fetch.hedge_wins"], 0)
+        self.assertLess(elapsed, 2.0)
+
+
+class TestAsyncResilientFetcher(unittest.TestCase):
+    def setUp(self):
+        self.generator = ForecastGenerator(days=2, lean=True)
+        self.instrumentation = Instrumentation()
+
+    def fetch_all(self, faults, **kwargs):
+        async def fetch_all(server):
+            async with AsyncYandexWeatherAPI() as api:
+                fetcher = AsyncResilientFetcher(api.get_forecasting, count=self.instrumentation.count, **kwargs)
+                for city in city_names(5):
+                    # warm-up: latencies of the host for the hedging threshold
+                    await fetcher(server.url_for(city), 5)
+                started = time.perf_counter()
+                results = [await fetcher(server.url_for(city), 5) for city in city_names(40)]
+                return results, time.perf_counter() - started
+
+        with StandInServer(self.generator.payload_source(), faults=faults) as server:
+            return asyncio.run(fetch_all(server))
+
+    def test_retries_recover_from_server_errors(self):
+        results, _ = self.fetch_all(FaultProfile(error_rate=0.3, seed=5), retry=FAST_RETRY, breaker_factory=None)
+
+        self.assertEqual(results[7], self.generator.forecast("CITY000007"))
+        self.assertGreater(self.instrumentation.counters["fetch.retries"], 0)
+
+    def test_timed_out_attempt_is_retried_within_the_city_timeout(self):
+        attempt_timeouts = []
+
+        async def hang_once(url, timeout):
+            attempt_timeouts.append(timeout)
+            if len(attempt_timeouts) == 1:
+                await asyncio.wait_for(asyncio.Event().wait(), timeout)
+            return {"url": url}
+
+        fetcher = AsyncResilientFetcher(
+            hang_once, retry=RetryPolicy(attempts=2, base_delay=0.001), attempt_timeout=0.4, count=Mock()
+        )
+        fetched = AsyncDataFetchingTask({"MOSCOW": "moscow"}, fetcher, timeout=1).fetch_all()
+
+        self.assertEqual(fetched, {"MOSCOW": {"url": "moscow"}})
+        self.assertEqual(attempt_timeouts, [0.4, 0.4])
+
+    def test_attempt_gets_the_whole_city_timeout_by_default(self):
+        attempt_timeouts = []
+
+        async def slow(url, timeout):
+            attempt_timeouts.append(timeout)
+            # slower than timeout / attempts, within the per-city timeout
+            await asyncio.wait_for(asyncio.sleep(0.6), timeout)
+            return {"url": url}
+
+        fetcher = AsyncResilientFetcher(slow, retry=RetryPolicy(attempts=2, base_delay=0.001), count=Mock())
+        fetched = AsyncDataFetchingTask({"MOSCOW": "moscow"}, fetcher, timeout=1).fetch_all()
+
+        self.assertEqual(fetched, {"MOSCOW": {"url": "moscow"}})
+        self.assertEqual(attempt_timeouts, [1])
+
+    def test_hedged_requests_cut_the_slow_tail(self):
+        faults = FaultProfile(latency=0.005, slow_rate=0.1, slow_latency=1.0, seed=5)
+        results, elapsed = self.fetch_all(faults, hedge_quantile=0.8, hedge_min_samples=5)
+
+        self.assertEqual(results[7], self.generator.forecast("CITY000007"))
+        self.assertGreater(self.instrumentation.counters["fetch.hedge_wins"], 0)
+        self.assertLess(elapsed, 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from tasks import DataCalculationTask, DataFetchingTask, IPCStats, WorkerPool
+from src.instrumentation import Instrumentation, LatencyHistogram, is_timeout
+
+
+def double(input_data):
+    return input_data * 2
+
+
+def fetch_or_fail(url, timeout):
+    if url == "timeout":
+        raise TimeoutError(url)
+    if url == "error":
+        raise ValueError(url)
+    return {"url": url}
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_observe_and_quantiles(self):
+        histogram = LatencyHistogram()
+        for latency in [0.0005] * 90 + [0.2] * 9 + [3.0]:
+            histogram.observe(latency)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.quantile(0.5), 0.001)
+        self.assertEqual(histogram.quantile(0.95), 0.25)
+        self.assertEqual(histogram.quantile(1.0), 3.0)
+        self.assertEqual(histogram.to_json()["buckets"], {"0.001": 90, "0.25": 9, "5.0": 1})
+
+    def test_merge(self):
+        first, second = LatencyHistogram(), LatencyHistogram()
+        first.observe(0.002)
+        second.observe(0.5)
+        first.merge(second)
+
+        self.assertEqual((first.count, first.min, first.max), (2, 0.002, 0.5))
+
+    def test_empty(self):
+        self.assertIsNone(LatencyHistogram().quantile(0.5))
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_stage_timing_profile_and_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            instrumentation = Instrumentation(profile_dir=directory)
+            with instrumentation.stage("calculation"):
+                sum(range(10000))
+            instrumentation.count("fetch.errors")
+            report_path = os.path.join(directory, "report.json")
+            instrumentation.write_report(report_path)
+
+            with open(report_path) as file:
+                report = json.load(file)
+            self.assertTrue(os.path.exists(os.path.join(directory, "calculation.prof")))
+
+        self.assertGreater(report["stages"]["calculation"]["wall_time"], 0)
+        self.assertGreater(report["peak_rss_kb"], 0)
+        self.assertEqual(report["stages"]["calculation"]["process_peak_rss_kb"], report["peak_rss_kb"])
+        self.assertEqual(report["counters"], {"fetch.errors": 1})
+
+    def test_peak_rss_growth_per_stage(self):
+        instrumentation = Instrumentation()
+        with instrumentation.stage("allocation"):
+            data = b"x" * (64 << 20)
+        del data
+        with instrumentation.stage("reuse"):
+            data = b"x" * (16 << 20)
+        del data
+
+        allocation, reuse = instrumentation.stages["allocation"], instrumentation.stages["reuse"]
+        self.assertGreater(allocation.peak_rss_growth_kb, 32 << 10)
+        self.assertLess(reuse.peak_rss_growth_kb, allocation.peak_rss_growth_kb)
+        self.assertGreaterEqual(reuse.process_peak_rss_kb, allocation.process_peak_rss_kb)
+
+    def test_fetch_latencies_and_failures(self):
+        instrumentation = Instrumentation()
+        urls = {"A": "a", "B": "b", "C": "timeout", "D": "error"}
+
+        results = DataFetchingTask(urls, fetch_or_fail, instrumentation=instrumentation).fetch_all()
+
+        self.assertEqual(set(results), {"A", "B"})
+        self.assertEqual(instrumentation.latencies["fetch"].count, 4)
+        self.assertEqual(instrumentation.counters, {"fetch.timeouts": 1, "fetch.errors": 1})
+
+    def test_worker_timings_reach_ipc_stats(self):
+        with WorkerPool(num_workers=2) as pool:
+            task = DataCalculationTask({key: key for key in range(20)}, double, pool=pool, chunk_size=5)
+            task.execute()
+            pids = {worker.pid for worker in pool.workers}
+
+        stats = task.ipc_stats.to_json()
+        self.assertEqual(stats["task_latency"]["count"], 20)
+        self.assertTrue(set(stats["task_latency_per_worker"]) <= pids)
+        self.assertGreaterEqual(stats["queue_wait"], 0)
+        self.assertGreater(stats["worker_peak_rss_kb"], 0)
+        json.dumps(stats)
+
+    def test_merge_run_of_another_process(self):
+        node = Instrumentation()
+        with node.stage("fetch"):
+            node.observe("fetch", 0.002)
+        node.count("fetch.errors", 2)
+        node = Instrumentation.from_state(json.loads(json.dumps(node.to_state())))
+        instrumentation = Instrumentation()
+        instrumentation.observe("fetch", 0.3)
+        instrumentation.count("fetch.errors")
+
+        instrumentation.merge(node, prefix="shard-0.")
+
+        self.assertEqual(instrumentation.latencies["fetch"].count, 2)
+        self.assertEqual(instrumentation.counters, {"fetch.errors": 3})
+        self.assertEqual(list(instrumentation.stages), ["shard-0.fetch"])
+
+    def test_is_timeout(self):
+        class URLError(Exception):
+            reason = TimeoutError()
+
+        self.assertTrue(is_timeout(TimeoutError()))
+        self.assertTrue(is_timeout(URLError()))
+        self.assertFalse(is_timeout(ValueError()))
+        self.assertEqual(IPCStats().to_json()["task_latency"]["count"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import logging
+import multiprocessing as mp
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from logging.handlers import QueueListener
+from pathlib import Path
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from tasks import WorkerPool
+from benchmarks.http_stand_in import StandInServer
+from config.log_queue import PAYLOAD, PayloadSampleFilter
+
+BASE_DIR = Path(__file__).parent.parent
+# imported by every process of the run, spawned ones included: all cities point at the stand-in server
+SITECUSTOMIZE = """
+import json, os
+from src.utils import CITIES
+CITIES.clear()
+CITIES.update(json.loads(os.environ["STAND_IN_CITIES"]))
+"""
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def log_and_double(input_data):
+    logging.getLogger("worker").warning("value %s from %s", input_data, os.getpid())
+    return input_data * 2
+
+
+class TestPayloadSampleFilter(unittest.TestCase):
+    def make_record(self, payload):
+        record = logging.LogRecord("test", logging.DEBUG, __file__, 1, "Data %s", ({"days": []},), None)
+        if payload:
+            record.__dict__.update(PAYLOAD)
+        return record
+
+    def test_samples_payload_records_only(self):
+        sample = PayloadSampleFilter(every=100)
+
+        passed = [sample.filter(self.make_record(payload=True)) for _ in range(250)]
+
+        self.assertEqual(sum(passed), 3)
+        self.assertTrue(all(sample.filter(self.make_record(payload=False)) for _ in range(10)))
+
+    def test_decision_is_shared_by_every_handler(self):
+        sample = PayloadSampleFilter(every=2)
+        first, second = self.make_record(payload=True), self.make_record(payload=True)
+
+        self.assertTrue(sample.filter(first) and sample.filter(first))
+        self.assertFalse(sample.filter(second) or sample.filter(second))
+
+
+class TestQueueLogging(unittest.TestCase):
+    def test_worker_records_reach_the_parent_listener(self):
+        log_queue = mp.Queue()
+        handler = ListHandler()
+        listener = QueueListener(log_queue, handler)
+        listener.start()
+        try:
+            with WorkerPool(num_workers=2, log_queue=log_queue) as pool:
+                results = dict(pool.run_batch(log_and_double, [(1, 1), (2, 2), (3, 3)]))
+                worker_pids = {worker.pid for worker in pool.workers}
+        finally:
+            listener.stop()
+
+        self.assertEqual(results, {1: 2, 2: 4, 3: 6})
+        messages = [record.getMessage() for record in handler.records if record.name == "worker"]
+        self.assertEqual(len(messages), 3)
+        self.assertTrue(all(int(message.split()[-1]) in worker_pids for message in messages))
+
+
+
+class TestMainLogFile(unittest.TestCase):
+    def test_spawned_children_keep_app_log_intact(self):
+        with StandInServer() as server, tempfile.TemporaryDirectory() as directory:
+            Path(directory, "sitecustomize.py").write_text(SITECUSTOMIZE)
+            env = dict(
+                os.environ,
+                PYTHONPATH=os.pathsep.join((directory, str(BASE_DIR))),
+                STAND_IN_CITIES=json.dumps(server.city_urls(["MOSCOW", "PARIS", "ROMA", "CAIRO"])),
+            )
+            subprocess.run(
+                [sys.executable, str(BASE_DIR / "main.py"), "--start-method", "spawn", "--workers", "2"],
+                cwd=directory,
+                env=env,
+                capture_output=True,
+                check=True,
+            )
+            log = Path(directory, "app.log").read_bytes()
+            output = Path(directory, "output.csv").read_text()
+
+        self.assertNotIn(b"\0", log)
+        lines = log.decode("utf-8").splitlines()
+        self.assertIn("Fetching data ...", lines[0])
+        self.assertIn("Writing results to the file ...", lines[-1])
+        self.assertEqual(len(output.splitlines()), 1 + 4 * 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import random
+import sys
+from pathlib import Path
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from tasks import DataAnalyzingTask
+from src.ranking import CityRanking
+
+
+def result(temperature, hours):
+    return {"average_temperature": temperature, "total_relevant_condition_hours": hours}
+
+
+def sorted_ranking(results):
+    ranked = sorted(
+        results.items(),
+        key=lambda x: (x[1]["average_temperature"], x[1]["total_relevant_condition_hours"]),
+        reverse=True,
+    )
+    return [city for city, _ in ranked]
+
+
+class TestCityRanking(unittest.TestCase):
+    def test_matches_a_stable_sort(self):
+        rng = random.Random(7)
+        results = {f"City{i}": result(rng.randint(10, 14) / 2, rng.randint(0, 3)) for i in range(200)}
+
+        self.assertEqual(CityRanking.from_results(results).ordered(), sorted_ranking(results))
+
+    def test_update_moves_city_and_keeps_tie_order(self):
+        results = {"A": result(10, 1), "B": result(12, 1), "C": result(11, 1)}
+        ranking = CityRanking.from_results(results)
+
+        results["A"] = result(12, 1)
+        ranking.update("A", results["A"])
+
+        self.assertEqual(ranking.ordered(), ["A", "B", "C"])
+        self.assertEqual(ranking.ordered(), sorted_ranking(results))
+        self.assertEqual(ranking.score("A"), (12, 1))
+
+    def test_remove(self):
+        ranking = CityRanking.from_results({"A": result(10, 1), "B": result(12, 1)})
+        ranking.remove("B")
+        ranking.remove("missing")
+
+        self.assertEqual(ranking.ordered(), ["A"])
+        self.assertNotIn("B", ranking)
+
+    def test_interleaved_updates_removals_and_reads(self):
+        rng = random.Random(11)
+        ranking, results, first_seen = CityRanking(), {}, {}
+        for step in range(2000):
+            city = f"City{rng.randrange(60)}"
+            if rng.random() < 0.2:
+                ranking.remove(city)
+                results.pop(city, None)
+                first_seen.pop(city, None)
+            else:
+                results[city] = result(rng.randint(10, 14) / 2, rng.randint(0, 3))
+                first_seen.setdefault(city, step)
+                ranking.update(city, results[city])
+            if step % 7 == 0:
+                in_first_seen_order = {city: results[city] for city in sorted(results, key=first_seen.get)}
+                self.assertEqual(ranking.ordered(), sorted_ranking(in_first_seen_order))
+                self.assertEqual(len(ranking), len(results))
+
+    def test_top_includes_exact_ties(self):
+        ranking = CityRanking.from_results(
+            {"A": result(12, 2), "B": result(11, 3), "C": result(11, 3), "D": result(11, 1), "E": result(10, 5)}
+        )
+
+        self.assertEqual(ranking.top(1), ["A"])
+        self.assertEqual(ranking.top(2), ["A", "B", "C"])
+        self.assertEqual(ranking.top(4), ["A", "B", "C", "D"])
+        self.assertEqual(ranking.top(10), ["A", "B", "C", "D", "E"])
+        self.assertEqual(ranking.top(0), [])
+
+    def test_missing_temperature_ranks_last(self):
+        ranking = CityRanking.from_results({"A": result(None, 5), "B": result(-3, 0)})
+
+        self.assertEqual(ranking.ordered(), ["B", "A"])
+
+    def test_task_ranks_results_as_they_arrive(self):
+        data = {
+            "City1": {"days": [{"temp_avg": 20, "relevant_cond_hours": 5}]},
+            "City2": {"days": [{"temp_avg": 25, "relevant_cond_hours": 3}]},
+            "City3": {"days": [{"temp_avg": 25, "relevant_cond_hours": 3}]},
+        }
+        task = DataAnalyzingTask(data, num_workers=2)
+
+        results, ranked = task.execute_and_rank()
+
+        self.assertEqual(ranked, sorted_ranking(results))
+        self.assertEqual(task.top_cities(), ranked[:2])
+        self.assertCountEqual(ranked[:2], ["City2", "City3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from tasks import DataFetchingTask
+from benchmarks.http_stand_in import StandInServer
+from external.cache import CachedWeatherAPI, ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = StandInServer(payload=b'{"forecasts": []}').start()
+        self.url = self.server.url_for("MOSCOW")
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def test_hit_within_ttl(self):
+        api = CachedWeatherAPI(ResponseCache(self.directory.name, ttl=60))
+
+        self.assertEqual(api.get_forecasting(self.url), {"forecasts": []})
+        self.assertEqual(api.get_forecasting(self.url), {"forecasts": []})
+
+        self.assertEqual(self.server.counters["requests"], 1)
+        self.assertEqual(api.cache.stats.misses, 1)
+        self.assertEqual(api.cache.stats.hits, 1)
+
+    def test_stale_entry_is_revalidated(self):
+        api = CachedWeatherAPI(ResponseCache(self.directory.name, ttl=0))
+        api.get_forecasting(self.url)
+
+        self.assertEqual(api.get_forecasting(self.url), {"forecasts": []})
+        self.assertEqual(self.server.counters["not_modified"], 1)
+        self.assertEqual(api.cache.stats.revalidated, 1)
+
+        self.server.payload = b'{"forecasts": [{"date": "2022-05-18", "hours": []}]}'
+        self.assertEqual(api.get_forecasting(self.url), {"forecasts": [{"date": "2022-05-18", "hours": []}]})
+        self.assertEqual(api.cache.stats.misses, 2)
+
+    def test_not_modified_rewrites_only_the_metadata(self):
+        cache = ResponseCache(self.directory.name, ttl=60)
+        with patch("external.cache.time.time", return_value=time.time() - 120):
+            cache.put(self.url, self.server.payload, last_modified=self.server.last_modified)
+        size = os.path.getsize(cache._path(self.url))
+        api = CachedWeatherAPI(cache)
+
+        self.assertEqual(api.get_forecasting(self.url), {"forecasts": []})
+        self.assertEqual(api.get_forecasting(self.url), {"forecasts": []})
+
+        self.assertEqual(self.server.counters["not_modified"], 1)
+        self.assertEqual((cache.stats.revalidated, cache.stats.hits, cache.stats.stored), (1, 1, 1))
+        entry = cache.get(self.url)
+        self.assertTrue(entry.etag)
+        self.assertEqual(entry.last_modified, self.server.last_modified)
+        self.assertEqual(entry.body, self.server.payload)
+        self.assertEqual(os.path.getsize(cache._path(self.url)), size)
+
+    def test_malformed_metadata_is_a_miss(self):
+        cache = ResponseCache(self.directory.name)
+        for meta in ({"url": self.url, "unexpected": 1}, [self.url]):
+            with open(cache._path(self.url), "wb") as file:
+                file.write(json.dumps(meta).encode() + b"\nbody")
+
+            self.assertIsNone(cache.get(self.url))
+
+    def test_cache_survives_restart(self):
+        CachedWeatherAPI(ResponseCache(self.directory.name)).get_forecasting(self.url)
+        api = CachedWeatherAPI(ResponseCache(self.directory.name))
+
+        self.assertEqual(api.get_forecasting(self.url), {"forecasts": []})
+        self.assertEqual(self.server.counters["requests"], 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResponseCache(self.directory.name, max_bytes=2000)
+        body = b"x" * 300
+        for i in range(3):
+            cache.put(f"http://example.com/{i}", body)
+            os.utime(cache._path(f"http://example.com/{i}"), (i, i))
+        cache.get("http://example.com/0")
+        cache.put("http://example.com/3", body)
+
+        self.assertIsNotNone(cache.get("http://example.com/0"))
+        self.assertIsNone(cache.get("http://example.com/1"))
+        self.assertEqual(cache.stats.evicted, 1)
+
+    def test_concurrent_fetches(self):
+        self.server.payload = lambda path: json.dumps({"path": path}).encode()
+        urls = self.server.city_urls(f"CITY{i}" for i in range(40))
+        api = CachedWeatherAPI(ResponseCache(self.directory.name, ttl=0))
+
+        for _ in range(2):
+            results = DataFetchingTask(urls, api.get_forecasting, max_workers=8).fetch_all()
+            self.assertEqual(results, {city: {"path": "/" + url.rsplit("/", 1)[1]} for city, url in urls.items()})
+
+        self.assertEqual(api.cache.stats.misses, 40)
+        self.assertEqual(api.cache.stats.revalidated, 40)
+        self.assertEqual(len(os.listdir(self.directory.name)), 40)
@@ -0,0 +1,111 @@
+import copy
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from tasks import DataAnalyzingTask, DataCalculationTask
+from external.analyzer import analyze_json
+from src.result_store import STORE_VERSION, ResultStore, body_fingerprint, loads_with_fingerprint
+
+RESPONSE_PATH = Path(__file__).parent.parent / "data" / "examples" / "response.json"
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ResultStore(os.path.join(self.directory.name, "results.sqlite"))
+        payload = json.loads(RESPONSE_PATH.read_text())
+        self.payloads = {"MOSCOW": payload, "PARIS": copy.deepcopy(payload)}
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def run_stage(self):
+        task = DataCalculationTask(self.payloads, analyze_json, result_store=self.store)
+        return task, task.execute()
+
+    def test_unchanged_inputs_skip_the_workers(self):
+        _, first = self.run_stage()
+        task, second = self.run_stage()
+
+        self.assertEqual(second, first)
+        self.assertEqual(task.ipc_stats.items, 0)
+
+    def test_only_changed_inputs_are_recomputed(self):
+        self.run_stage()
+        self.payloads["PARIS"]["forecasts"][0]["hours"][12]["temp"] += 10
+
+        task, results = self.run_stage()
+
+        self.assertEqual(task.ipc_stats.items, 1)
+        self.assertEqual(results["PARIS"], analyze_json(self.payloads["PARIS"]))
+
+    def test_analyzer_parameters_invalidate_results(self):
+        self.run_stage()
+
+        with patch("external.analyzer.INPUT_DAY_HOURS_END", 12):
+            task, results = self.run_stage()
+
+        self.assertEqual(task.ipc_stats.items, 2)
+        self.assertEqual(results["MOSCOW"]["days"][0]["hours_end"], 12)
+
+    def test_analyzing_stage(self):
+        days = {"City1": {"days": [{"temp_avg": 20, "relevant_cond_hours": 5}]}}
+        DataAnalyzingTask(days, result_store=self.store).execute()
+
+        task = DataAnalyzingTask(days, result_store=self.store)
+        self.assertEqual(task.execute(), {"City1": {"average_temperature": 20, "total_relevant_condition_hours": 5}})
+        self.assertEqual(task.ipc_stats.items, 0)
+
+    def test_body_fingerprints_key_both_stages(self):
+        body = RESPONSE_PATH.read_text()
+        fingerprint, payload = loads_with_fingerprint(body)
+        self.assertEqual(fingerprint, body_fingerprint(RESPONSE_PATH.read_bytes()))
+
+        def run_stages(payloads):
+            calculation = DataCalculationTask(payloads, analyze_json, result_store=self.store, fingerprints=fingerprints)
+            calculated = calculation.execute()
+            analysis = DataAnalyzingTask(calculated, result_store=self.store, fingerprints=calculation.store_keys)
+            return calculation, analysis, analysis.execute()
+
+        fingerprints = {"MOSCOW": fingerprint}
+        _, _, first = run_stages({"MOSCOW": payload})
+        # the same body: the decoded payload is not hashed again
+        with patch("src.result_store.payload_fingerprint") as payload_fingerprint:
+            calculation, analysis, second = run_stages({"MOSCOW": payload})
+
+        payload_fingerprint.assert_not_called()
+        self.assertEqual(second, first)
+        self.assertEqual((calculation.ipc_stats.items, analysis.ipc_stats.items), (0, 0))
+
+    def test_least_recently_used_results_are_evicted(self):
+        result = analyze_json(self.payloads["MOSCOW"])
+        with patch("src.result_store.time.time", side_effect=range(1, 10)):
+            for i in range(3):
+                self.store.put_many({f"key{i}": result})
+            self.store.max_bytes = self.store._size
+            self.store.get_many(["key0"])
+            self.store.put_many({"key3": result})
+
+        self.assertEqual(set(self.store.get_many([f"key{i}" for i in range(4)])), {"key0", "key2", "key3"})
+        self.assertEqual(self.store.evicted, 1)
+        self.assertEqual(self.store._size, self.store.max_bytes)
+
+    def test_results_of_another_version_are_dropped(self):
+        self.run_stage()
+        self.store.close()
+        with sqlite3.connect(self.store.path) as connection:
+            connection.execute(f"PRAGMA user_version = {STORE_VERSION - 1}")
+        self.store = ResultStore(self.store.path)
+
+        task, _ = self.run_stage()
+
+        self.assertEqual(task.ipc_stats.items, 2)
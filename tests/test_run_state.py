@@ -0,0 +1,176 @@
+import copy
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+import unittest
+from unittest.mock import patch
+
+from external import analyzer
+from external.analyzer import analyze_json
+from src.instrumentation import Instrumentation
+from src.ranking import CityRanking
+from src.run_state import DeltaRun, OutputWriteError, RunState
+from src.tasks import DataAggregationTask, DataAnalyzingTask, WorkerPool
+
+RESPONSE_PATH = Path(__file__).parent.parent / "data" / "examples" / "response.json"
+PAYLOAD = json.loads(RESPONSE_PATH.read_text())
+
+
+def make_payload(warmer):
+    payload = copy.deepcopy(PAYLOAD)
+    payload["forecasts"][0]["hours"][12]["temp"] += warmer
+    return payload
+
+
+class TestDeltaRun(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.urls = {f"CITY{index}": f"http://example.com/{index}" for index in range(8)}
+        # a few cities tie, their order is the url order
+        self.warmer = {city: index % 5 for index, city in enumerate(self.urls)}
+        self.output = os.path.join(self.directory.name, "output.csv")
+        self.state = RunState(os.path.join(self.directory.name, "state.sqlite"))
+        self.addCleanup(self.state.close)
+        self.now = 1000.0
+        self.fetched = []
+
+    def fetch(self, cities):
+        self.fetched.append(sorted(cities))
+        return {city: make_payload(self.warmer[city]) for city in cities}
+
+    def run_delta(self, state=None, output=None, **kwargs):
+        with WorkerPool(num_workers=2) as pool:
+            delta_run = DeltaRun(
+                self.urls,
+                state or self.state,
+                self.fetch,
+                pool,
+                output or self.output,
+                clock=lambda: self.now,
+                **kwargs,
+            )
+            return delta_run, delta_run.run()
+
+    def regenerated(self):
+        """Output of a first run over the current payloads"""
+        output = os.path.join(self.directory.name, "regenerated.csv")
+        with RunState(os.path.join(self.directory.name, "regenerated.sqlite")) as state:
+            self.run_delta(state, output)
+        return Path(output).read_bytes()
+
+    def test_first_run_is_a_full_run(self):
+        delta_run, ranking = self.run_delta()
+
+        calculated = {city: analyze_json(self.fetch([city])[city]) for city in self.urls}
+        analyzed = DataAnalyzingTask(calculated).execute()
+        expected_ranking = CityRanking.from_results({city: analyzed[city] for city in self.urls}).ordered()
+        expected = os.path.join(self.directory.name, "expected.csv")
+        DataAggregationTask.write_aggregated_data_to_csv(calculated, analyzed, expected_ranking, expected)
+        self.assertEqual(ranking, expected_ranking)
+        self.assertEqual(Path(self.output).read_bytes(), Path(expected).read_bytes())
+        self.assertTrue(delta_run.stats.full_rewrite)
+        self.assertEqual(delta_run.stats.changed, len(self.urls))
+
+    def test_unchanged_forecasts_leave_the_output_alone(self):
+        self.run_delta()
+        os.utime(self.output, (0, 0))
+
+        delta_run, _ = self.run_delta()
+
+        self.assertEqual(delta_run.stats.fetched, len(self.urls))
+        self.assertEqual(delta_run.stats.changed, 0)
+        self.assertEqual(delta_run.stats.rewritten_from, len(self.urls))
+        self.assertEqual(os.stat(self.output).st_mtime, 0)
+
+    def test_changed_city_is_patched_in(self):
+        self.run_delta()
+        for warmer in (7, 2, -3):
+            self.warmer["CITY5"] = warmer
+            instrumentation = Instrumentation()
+
+            delta_run, ranking = self.run_delta(instrumentation=instrumentation)
+
+            self.assertEqual(delta_run.stats.changed, 1)
+            self.assertFalse(delta_run.stats.full_rewrite)
+            self.assertEqual(instrumentation.counters["delta.changed"], 1)
+            self.assertEqual(Path(self.output).read_bytes(), self.regenerated())
+        # the coldest city now, the rows of the cities above it were kept
+        self.assertEqual(ranking[-1], "CITY5")
+        self.assertGreater(delta_run.stats.rewritten_from, 0)
+
+    def test_fresh_cities_are_not_fetched(self):
+        self.run_delta()
+        self.now += 60
+
+        delta_run, _ = self.run_delta(refresh_after=3600)
+        self.now += 3600
+        self.run_delta(refresh_after=3600)
+
+        self.assertEqual(delta_run.stats.fetched, 0)
+        self.assertEqual(self.fetched[1], sorted(self.urls))
+
+    def test_new_and_removed_cities(self):
+        self.run_delta()
+        del self.urls["CITY3"]
+        self.urls["CITY8"], self.warmer["CITY8"] = "http://example.com/8", 3
+
+        delta_run, ranking = self.run_delta(refresh_after=3600)
+
+        self.assertEqual(self.fetched[1], ["CITY8"])
+        self.assertEqual((delta_run.stats.changed, delta_run.stats.removed), (1, 1))
+        self.assertNotIn("CITY3", ranking)
+        self.assertEqual(Path(self.output).read_bytes(), self.regenerated())
+        self.assertEqual(set(self.state.cities()), set(self.urls))
+
+    def test_modified_output_is_written_again(self):
+        self.run_delta()
+        with open(self.output, "a") as file:
+            file.write("edited\n")
+
+        delta_run, _ = self.run_delta()
+
+        self.assertTrue(delta_run.stats.full_rewrite)
+        self.assertEqual(Path(self.output).read_bytes(), self.regenerated())
+
+    def test_new_analyzer_parameters_recompute_every_city(self):
+        self.run_delta()
+
+        with patch.object(analyzer, "INPUT_DAY_HOURS_END", analyzer.INPUT_DAY_HOURS_END - 2):
+            delta_run, _ = self.run_delta()
+            self.assertEqual(delta_run.stats.changed, len(self.urls))
+            self.assertTrue(delta_run.stats.full_rewrite)
+            self.assertEqual(Path(self.output).read_bytes(), self.regenerated())
+
+    def test_failed_write_keeps_the_previous_output_and_state(self):
+        self.run_delta()
+        with open(self.output, "a") as file:
+            file.write("edited\n")
+        edited = Path(self.output).read_bytes()
+        cities = self.state.cities()
+        self.warmer["CITY5"] = 7
+
+        with patch.object(DataAggregationTask, "format_csv_row", side_effect=ValueError("disk full")):
+            with self.assertRaises(OutputWriteError):
+                self.run_delta()
+
+        self.assertEqual(Path(self.output).read_bytes(), edited)
+        self.assertFalse([name for name in os.listdir(self.directory.name) if name.endswith(".tmp")])
+        self.assertEqual(self.state.cities(), cities)
+        # the output no longer matches the state, the next run writes it in full
+        delta_run, _ = self.run_delta()
+        self.assertTrue(delta_run.stats.full_rewrite)
+        self.assertEqual(Path(self.output).read_bytes(), self.regenerated())
+
+    def test_output_format_that_cannot_be_written_records_no_state(self):
+        output = os.path.join(self.directory.name, "output.parquet")
+
+        with patch.dict(sys.modules, {"pyarrow": None, "pyarrow.parquet": None}):
+            with self.assertRaises(OutputWriteError):
+                self.run_delta(output=output, output_format="parquet")
+
+        self.assertFalse(os.path.exists(output))
+        self.assertEqual(self.state.cities(), {})
+        self.assertIsNone(self.state.get_meta("output_size"))
@@ -0,0 +1,175 @@
+import copy
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+import unittest
+from unittest.mock import patch
+
+from external.analyzer import analyze_json
+from src.instrumentation import Instrumentation
+from src.ranking import CityRanking
+from src.sharding import HashRing, ShardCoordinator, ShardsMissingError, shard_path
+from src.tasks import DataAnalyzingTask, DataCalculationTask, DataFetchingTask
+
+RESPONSE_PATH = Path(__file__).parent.parent / "data" / "examples" / "response.json"
+PAYLOAD = json.loads(RESPONSE_PATH.read_text())
+
+
+def fake_fetch(url, timeout):
+    payload = copy.deepcopy(PAYLOAD)
+    # a few distinct scores, so that most cities tie with cities of other shards
+    payload["forecasts"][0]["hours"][12]["temp"] += len(url) % 4
+    return payload
+
+
+def run_cities(cities, pool, instrumentation):
+    with instrumentation.stage("fetch"):
+        fetched = DataFetchingTask(cities, fake_fetch, instrumentation=instrumentation).fetch_all()
+    calculated = DataCalculationTask(fetched, analyze_json, pool=pool).execute()
+    return (calculated,) + DataAnalyzingTask(calculated, pool=pool).execute_and_rank()
+
+
+class TestHashRing(unittest.TestCase):
+    def setUp(self):
+        self.keys = [f"CITY{index:06d}" for index in range(10000)]
+
+    def test_same_ring_everywhere(self):
+        first, second = HashRing(range(4)), HashRing(reversed(range(4)))
+        self.assertEqual([first.node_for(key) for key in self.keys], [second.node_for(key) for key in self.keys])
+
+    def test_balance(self):
+        shards = HashRing(range(4)).partition(dict.fromkeys(self.keys, ""))
+        for cities in shards.values():
+            self.assertGreater(len(cities), 10000 / 4 * 0.75)
+            self.assertLess(len(cities), 10000 / 4 * 1.25)
+
+    def test_adding_a_node_only_moves_keys_to_it(self):
+        ring = HashRing(range(4))
+        before = {key: ring.node_for(key) for key in self.keys}
+        ring.add_node(4)
+        moved = [key for key in self.keys if ring.node_for(key) != before[key]]
+
+        self.assertTrue(all(ring.node_for(key) == 4 for key in moved))
+        self.assertLess(len(moved), 10000 / 5 * 1.3)
+        ring.remove_node(4)
+        self.assertEqual({key: ring.node_for(key) for key in self.keys}, before)
+
+    def test_partition_keeps_order(self):
+        urls = {key: key.lower() for key in self.keys[:100]}
+        shards = HashRing(range(3)).partition(urls)
+        for cities in shards.values():
+            self.assertEqual(list(cities), [city for city in urls if city in cities])
+
+    def test_empty_ring(self):
+        with self.assertRaises(ValueError):
+            HashRing().node_for("MOSCOW")
+
+
+class TestShardCoordinator(unittest.TestCase):
+    def setUp(self):
+        self.urls = {f"CITY{index}": f"http://example.com/{'x' * index}" for index in range(12)}
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def coordinator(self, shards, **kwargs):
+        return ShardCoordinator(self.urls, run_cities, self.temp_dir.name, shards, workers_per_node=2, **kwargs)
+
+    def test_matches_single_node(self):
+        calculated, analyzed, ranking = self.coordinator(3).run()
+
+        expected_calculated = {
+            city: analyze_json(fake_fetch(url, 10)) for city, url in self.urls.items()
+        }
+        expected_analyzed = DataAnalyzingTask(expected_calculated).execute()
+        self.assertEqual(calculated, expected_calculated)
+        self.assertEqual(analyzed, expected_analyzed)
+        # ties are broken in url order, whatever the shards
+        in_url_order = {city: expected_analyzed[city] for city in self.urls}
+        self.assertEqual(ranking, CityRanking.from_results(in_url_order).ordered())
+        self.assertEqual(ranking, self.coordinator(1).run()[2])
+
+    def test_node_results_are_merged_into_instrumentation(self):
+        instrumentation = Instrumentation()
+        self.coordinator(2, instrumentation=instrumentation).run()
+
+        self.assertEqual(instrumentation.latencies["fetch"].count, len(self.urls))
+        self.assertIn("shard-0.fetch", instrumentation.stages)
+        self.assertIn("shard-1.fetch", instrumentation.stages)
+
+    def test_missing_shard(self):
+        coordinator = self.coordinator(3)
+        coordinator.run()
+        os.remove(shard_path(self.temp_dir.name, 1))
+
+        with self.assertLogs("src.sharding", "ERROR"):
+            _, analyzed, ranking = coordinator.merge(coordinator.collect())
+        self.assertEqual(set(analyzed), set(self.urls) - set(coordinator.assignment[1]))
+        self.assertEqual(set(ranking), set(analyzed))
+
+    def test_collect_waits_past_stale_results(self):
+        self.coordinator(2, run_id="earlier").run()
+        coordinator = self.coordinator(2, run_id="later")
+
+        def run_nodes():
+            for index in range(2):
+                coordinator.node(index).run()
+
+        with patch("src.sharding.SHARD_POLL_INTERVAL", 0.01):
+            nodes = threading.Timer(0.2, run_nodes)
+            nodes.start()
+            started = time.monotonic()
+            results = coordinator.collect(timeout=60, require_all=True)
+            nodes.join()
+
+        self.assertLess(time.monotonic() - started, 30)
+        self.assertEqual([(result.index, result.run_id) for result in results], [(0, "later"), (1, "later")])
+        self.assertEqual(set(coordinator.merge(results)[1]), set(self.urls))
+
+    def test_results_of_another_shard_count_are_ignored(self):
+        self.coordinator(2).run()
+        coordinator = self.coordinator(3)
+
+        with self.assertLogs("src.sharding", "ERROR"):
+            results = coordinator.collect()
+        self.assertEqual([result.index for result in results], [])
+
+    def test_results_of_an_earlier_run_are_ignored(self):
+        self.coordinator(2, run_id="earlier").run()
+
+        with self.assertLogs("src.sharding", "ERROR") as logs:
+            results = self.coordinator(2, run_id="later").collect()
+        self.assertEqual(results, [])
+        self.assertIn("left by run earlier", "\n".join(logs.output))
+        with self.assertLogs("src.sharding", "ERROR"), self.assertRaises(ShardsMissingError) as raised:
+            self.coordinator(2, run_id="later").collect(require_all=True)
+        self.assertEqual(raised.exception.indexes, [0, 1])
+
+    def test_results_for_other_cities_are_ignored(self):
+        self.coordinator(2, run_id="run").run()
+        self.urls["CITY0"] = "http://example.com/moved"
+
+        with self.assertLogs("src.sharding", "ERROR"):
+            results = self.coordinator(2, run_id="run").collect()
+        self.assertEqual(results, [])
+
+    def test_results_are_json(self):
+        coordinator = self.coordinator(2)
+        calculated, analyzed, ranking = coordinator.run()
+
+        with open(shard_path(self.temp_dir.name, 0)) as file:
+            data = json.load(file)
+        self.assertEqual(data["run_id"], coordinator.run_id)
+        self.assertEqual(coordinator.merge(coordinator.collect()), (calculated, analyzed, ranking))
+
+    def test_unreadable_result_is_ignored(self):
+        coordinator = self.coordinator(2)
+        coordinator.run()
+        with open(shard_path(self.temp_dir.name, 1), "w") as file:
+            file.write("not json")
+
+        with self.assertLogs("src.sharding", "ERROR"):
+            results = coordinator.collect()
+        self.assertEqual([result.index for result in results], [0])
@@ -0,0 +1,78 @@
+import copy
+import json
+import sys
+from pathlib import Path
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from tasks import DataCalculationTask, TRANSPORT_SHARED_MEMORY, WorkerPool
+from external.analyzer import analyze_json
+from src import shm_transport
+
+RESPONSE_PATH = Path(__file__).parent.parent / "data" / "examples" / "response.json"
+
+
+def make_payloads():
+    payload = json.loads(RESPONSE_PATH.read_text())
+    rainy = copy.deepcopy(payload)
+    for day in rainy["forecasts"]:
+        for hour in day["hours"]:
+            hour["condition"] = "rain" if int(hour["hour"]) % 2 else "unknown-condition"
+            hour["temp"] = -hour["temp"]
+    return {"MOSCOW": payload, "LONDON": rainy, "EMPTY": {"forecasts": []}}
+
+
+def segment_state(input_data):
+    return "attached" if shm_transport._attached is not None else "detached"
+
+
+class TestSharedMemoryTransport(unittest.TestCase):
+    def setUp(self):
+        self.payloads = make_payloads()
+        self.expected = {city: analyze_json(data) for city, data in self.payloads.items()}
+
+    def test_matches_analyze_json(self):
+        task = DataCalculationTask(self.payloads, analyze_json, transport=TRANSPORT_SHARED_MEMORY)
+        self.assertEqual(task.execute(), self.expected)
+
+    def test_shared_pool_and_small_ipc(self):
+        with WorkerPool(num_workers=2) as pool:
+            pickled = DataCalculationTask(self.payloads, analyze_json, pool=pool)
+            shared = DataCalculationTask(self.payloads, analyze_json, pool=pool, transport=TRANSPORT_SHARED_MEMORY)
+
+            self.assertEqual(pickled.execute(), self.expected)
+            self.assertEqual(shared.execute(), self.expected)
+            # a second stage attaches to a new block
+            self.assertEqual(shared.execute(), self.expected)
+
+        self.assertLess(shared.ipc_stats.bytes_sent * 10, pickled.ipc_stats.bytes_sent)
+
+    def test_malformed_payload_drops_only_its_city(self):
+        malformed = copy.deepcopy(self.payloads["MOSCOW"])
+        malformed["forecasts"][1]["hours"][12]["temp"] = None
+        self.payloads["MALFORMED"] = malformed
+
+        with WorkerPool(num_workers=2) as pool:
+            pickled = DataCalculationTask(self.payloads, analyze_json, pool=pool)
+            shared = DataCalculationTask(self.payloads, analyze_json, pool=pool, transport=TRANSPORT_SHARED_MEMORY)
+            with self.assertLogs("external.columnar", level="ERROR"):
+                shared_result = shared.execute()
+
+            self.assertEqual(shared_result, self.expected)
+            self.assertEqual(pickled.execute(), self.expected)
+
+    def test_workers_release_the_block_after_their_chunk(self):
+        with WorkerPool(num_workers=1) as pool:
+            DataCalculationTask(self.payloads, analyze_json, pool=pool, transport=TRANSPORT_SHARED_MEMORY).execute()
+            state = DataCalculationTask({"MOSCOW": 1}, segment_state, pool=pool).execute()
+
+        self.assertEqual(state, {"MOSCOW": "detached"})
+
+    def test_detach(self):
+        with shm_transport.SharedForecastStore(self.payloads) as store:
+            ref = store.refs["MOSCOW"]
+            self.assertEqual(shm_transport.analyze_shared(ref), self.expected["MOSCOW"])
+            self.assertIsNotNone(shm_transport._attached)
+            shm_transport.detach()
+            self.assertIsNone(shm_transport._attached)
@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+import unittest
+from unittest.mock import patch
+
+from config import config
+from config.config import get_setting, read_env_file
+
+BASE_DIR = Path(__file__).parent.parent
+
+
+def loaded_modules(statement):
+    """Modules in sys.modules after running statement in a fresh interpreter"""
+    code = f"{statement}\nimport json, sys\nprint(json.dumps(sorted(sys.modules)))"
+    env = dict(os.environ, PYTHONPATH=str(BASE_DIR))
+    with tempfile.TemporaryDirectory() as directory:
+        # main.py opens app.log in the working directory
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=directory, env=env, capture_output=True, text=True, check=True
+        ).stdout
+    return set(json.loads(output.splitlines()[-1]))
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_main_imports_no_heavy_modules(self):
+        modules = loaded_modules("import main")
+
+        for heavy in ("numpy", "pydantic", "pydantic_settings", "asyncio", "sqlite3", "urllib.request"):
+            self.assertNotIn(heavy, modules)
+
+    def test_default_run_skips_cache_and_result_store(self):
+        statement = (
+            "import sys\nfrom unittest import mock\nimport main\nsys.argv = ['main.py', '--workers', '1']\n"
+            "with mock.patch.object(main, 'run_staged'):\n"
+            "    main.run_local(main.parse_args(), None, main.Instrumentation())"
+        )
+        modules = loaded_modules(statement)
+
+        for unused in ("external.cache", "src.result_store", "sqlite3"):
+            self.assertNotIn(unused, modules)
+
+    def test_output_dtype_is_loaded_on_use(self):
+        modules = loaded_modules("import src.tasks as tasks\nassert tasks.OUTPUT_DTYPE.names[0] == 'City'")
+
+        self.assertIn("numpy", modules)
+
+    def test_settings_are_loaded_on_use(self):
+        modules = loaded_modules("from config.config import settings\nassert settings.app_debug_level")
+
+        self.assertIn("pydantic_settings", modules)
+
+
+class TestSettings(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.env_path = os.path.join(self.directory.name, ".env")
+        with open(self.env_path, "w") as file:
+            file.write("# comment\nAPP_DEBUG_LEVEL='DEBUG'\nexport OTHER = value # note\n\nBROKEN\n")
+
+    def test_read_env_file(self):
+        self.assertEqual(read_env_file(self.env_path), {"app_debug_level": "DEBUG", "other": "value"})
+        self.assertEqual(read_env_file(os.path.join(self.directory.name, "missing")), {})
+
+    def test_environment_overrides_env_file(self):
+        with patch.object(config, "_env_file_values", read_env_file(self.env_path)):
+            with patch.dict(os.environ, {}, clear=True):
+                self.assertEqual(get_setting("app_debug_level", "INFO"), "DEBUG")
+                self.assertEqual(get_setting("missing", "INFO"), "INFO")
+            with patch.dict(os.environ, {"APP_DEBUG_LEVEL": "WARNING"}):
+                self.assertEqual(get_setting("app_debug_level", "INFO"), "WARNING")
+
+    def test_matches_settings(self):
+        self.assertEqual(get_setting("app_debug_level", "INFO"), config.settings.app_debug_level)
@@ -0,0 +1,53 @@
+import copy
+import json
+import time
+from pathlib import Path
+import unittest
+
+from external.analyzer import analyze_json
+from src.pipeline import StreamingPipeline
+from src.tasks import DataAnalyzingTask, WorkerPool
+
+RESPONSE_PATH = Path(__file__).parent.parent / "data" / "examples" / "response.json"
+PAYLOAD = json.loads(RESPONSE_PATH.read_text())
+DELAYS = {"http://example.com/slow": 0.5}
+
+
+def fake_fetch(url, timeout):
+    time.sleep(DELAYS.get(url, 0.01))
+    if url.endswith("broken"):
+        raise Exception("Unexpected error: broken")
+    payload = copy.deepcopy(PAYLOAD)
+    payload["forecasts"][0]["hours"][12]["temp"] += len(url)
+    return payload
+
+
+class TestStreamingPipeline(unittest.TestCase):
+    def setUp(self):
+        self.urls = {f"CITY{i}": f"http://example.com/{'x' * i}" for i in range(8)}
+        self.urls["SLOW"] = "http://example.com/slow"
+        self.urls["BROKEN"] = "http://example.com/broken"
+
+    def test_matches_staged_pipeline(self):
+        with WorkerPool(num_workers=2) as pool:
+            calculated, analyzed, ranked = StreamingPipeline(self.urls, fake_fetch, pool, queue_size=2).run()
+
+        del self.urls["BROKEN"]
+        expected_calculated = {
+            city: analyze_json(fake_fetch(url, 10)) for city, url in self.urls.items()
+        }
+        expected_analyzed = DataAnalyzingTask(expected_calculated).execute()
+        self.assertEqual(calculated, expected_calculated)
+        self.assertEqual(analyzed, expected_analyzed)
+        # ties keep arrival order, which differs between runs
+        self.assertEqual(ranked, DataAnalyzingTask(analyzed).find_most_favorable_cities(analyzed))
+
+    def test_slow_city_does_not_delay_the_others(self):
+        with WorkerPool(num_workers=2) as pool:
+            pipeline = StreamingPipeline(self.urls, fake_fetch, pool, max_workers=4)
+            started = time.perf_counter()
+            pipeline.run()
+            elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 0.5 + 0.4)
+        self.assertEqual(pipeline.ipc_stats.items, 9)
@@ -0,0 +1,58 @@
+import json
+import urllib.error
+import urllib.request
+import unittest
+
+from benchmarks.http_stand_in import FaultProfile, StandInServer
+from benchmarks.synthetic import ForecastGenerator, city_names
+from external.analyzer import analyze_json
+from external.columnar import ForecastBatch, analyze_city
+
+
+class TestForecastGenerator(unittest.TestCase):
+    def test_deterministic_per_city_and_seed(self):
+        generator = ForecastGenerator(days=3, hours=24)
+
+        self.assertEqual(generator.body("CITY000001"), ForecastGenerator(days=3, hours=24).body("CITY000001"))
+        self.assertNotEqual(generator.body("CITY000001"), generator.body("CITY000002"))
+        self.assertNotEqual(generator.body("CITY000001"), ForecastGenerator(days=3, seed=1).body("CITY000001"))
+
+    def test_lean_and_full_forecasts_analyze_the_same(self):
+        for city in city_names(5):
+            full = ForecastGenerator(days=4, hours=24).forecast(city)
+            lean = ForecastGenerator(days=4, hours=24, lean=True).forecast(city)
+
+            self.assertEqual(len(full["forecasts"]), 4)
+            self.assertIn("geo_object", full)
+            expected = analyze_json(full)
+            self.assertEqual(analyze_json(lean), expected)
+            self.assertEqual(analyze_city(ForecastBatch.from_payloads({city: full}), 0), expected)
+
+
+class TestFaultInjection(unittest.TestCase):
+    def test_errors_and_payloads_by_path(self):
+        generator = ForecastGenerator(days=2, lean=True)
+        faults = FaultProfile(error_rate=0.5, seed=3)
+        statuses = []
+        with StandInServer(generator.payload_source(), faults=faults) as server:
+            for city in city_names(20):
+                try:
+                    with urllib.request.urlopen(server.url_for(city)) as response:
+                        self.assertEqual(json.loads(response.read()), generator.forecast(city))
+                        statuses.append(response.status)
+                except urllib.error.HTTPError as error:
+                    statuses.append(error.code)
+
+        self.assertEqual(set(statuses), {200, 500})
+        self.assertEqual(server.counters["errors"], statuses.count(500))
+
+    def test_slow_tail_draws(self):
+        faults = FaultProfile(latency=0.01, slow_rate=0.1, slow_latency=1.0, seed=1)
+        delays = [faults.draw()[0] for _ in range(1000)]
+
+        self.assertAlmostEqual(sum(delay > 1 for delay in delays) / 1000, 0.1, delta=0.03)
+        self.assertTrue(all(delay >= 0.01 for delay in delays))
+
+
+if __name__ == "__main__":
+    unittest.main()
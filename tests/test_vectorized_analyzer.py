@@ -0,0 +1,34 @@
+import copy
+import json
+from pathlib import Path
+import unittest
+
+from external.analyzer import analyze_json
+from external.columnar import ForecastBatch
+from external.vectorized_analyzer import analyze_batch, analyze_json_vectorized
+
+RESPONSE_PATH = Path(__file__).parent.parent / "data" / "examples" / "response.json"
+
+
+class TestVectorizedAnalyzer(unittest.TestCase):
+    def setUp(self):
+        payload = json.loads(RESPONSE_PATH.read_text())
+        shifted = copy.deepcopy(payload)
+        for day in shifted["forecasts"]:
+            for hour in day["hours"]:
+                hour["condition"] = ("rain", "clear", "not-listed")[int(hour["hour"]) % 3]
+                hour["temp"] = hour["temp"] - 17
+            # missing and partial days
+            day["hours"] = day["hours"][5:14]
+        # a day with night hours only
+        shifted["forecasts"][0]["hours"] = payload["forecasts"][0]["hours"][:5]
+        self.payloads = {"MOSCOW": payload, "PARIS": shifted, "EMPTY": {"forecasts": []}}
+
+    def test_batch_matches_analyze_json(self):
+        expected = {city: copy.deepcopy(analyze_json(data)) for city, data in self.payloads.items()}
+        self.assertEqual(analyze_batch(ForecastBatch.from_payloads(self.payloads)), expected)
+
+    def test_single_payload(self):
+        for data in self.payloads.values():
+            self.assertEqual(analyze_json_vectorized(data), copy.deepcopy(analyze_json(data)))
+        self.assertEqual(analyze_json_vectorized({}), {})
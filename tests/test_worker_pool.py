@@ -0,0 +1,50 @@
+import os
+import sys
+from pathlib import Path
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from tasks import DataAnalyzingTask, DataCalculationTask, WorkerPool
+
+
+def double(input_data):
+    return input_data * 2
+
+
+def worker_pid(input_data):
+    return os.getpid()
+
+
+def fail_on_odd(input_data):
+    if input_data % 2:
+        raise ValueError(input_data)
+    return input_data
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_pool_is_shared_between_task_managers(self):
+        with WorkerPool(num_workers=2) as pool:
+            pids = {worker.pid for worker in pool.workers}
+
+            calculated = DataCalculationTask({1: 10, 2: 20}, double, pool=pool).execute()
+            analyzed = DataAnalyzingTask({"City1": {"days": [{"temp_avg": 20, "relevant_cond_hours": 5}]}}, pool=pool)
+
+            self.assertEqual(calculated, {1: 20, 2: 40})
+            self.assertEqual(
+                analyzed.execute(), {"City1": {"average_temperature": 20, "total_relevant_condition_hours": 5}}
+            )
+            self.assertEqual({worker.pid for worker in pool.workers}, pids)
+            used_pids = DataCalculationTask({i: i for i in range(20)}, worker_pid, pool=pool).execute()
+            self.assertTrue(set(used_pids.values()) <= pids)
+        self.assertFalse(pool.is_running)
+
+    def test_pool_with_spawn_start_method(self):
+        with WorkerPool(num_workers=2, start_method="spawn") as pool:
+            results = DataCalculationTask({1: 10, 2: 20, 3: 30}, double, pool=pool).execute()
+        self.assertEqual(results, {1: 20, 2: 40, 3: 60})
+
+    def test_failed_tasks_are_skipped(self):
+        with WorkerPool(num_workers=2) as pool:
+            results = DataCalculationTask({1: 1, 2: 2, 4: 4}, fail_on_odd, pool=pool).execute()
+        self.assertEqual(results, {2: 2, 4: 4})